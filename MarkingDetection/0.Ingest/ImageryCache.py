@@ -0,0 +1,343 @@
+"""
+Imagery Ingest & Block Cache
+One-time conversion of source orthophotos (PNG/JPG/TIFF) into Cloud-Optimized GeoTIFFs,
+plus the cache-aware reader every stage uses afterwards.
+
+Ingest writes each image as a tiled, internally compressed COG with average-resampled
+overviews and an internal per-tile nodata mask (alpha, the source mask, or all-zero
+pixels). Folders are mirrored, label .txt / .yaml files copied alongside, and images
+already ingested (newer than their source) are skipped.
+
+The reader (open_raster) serves arbitrary windows from decoded blocks kept in one
+process-wide LRU, so patching, detection and rendering passes over the same imagery
+decode each block once. Tiled rasters are cached block by block; untiled PNG/JPEG
+(not ingested yet) fall back to full-width strips. Previews come from the overviews.
+Cache keys carry the file's mtime and size, so a raster rewritten in place (re-ingest,
+re-export) is reopened and re-decoded instead of served from stale blocks.
+
+    python ImageryCache.py ingest DrapeYOLO --output DrapeYOLO_COG
+    python ImageryCache.py ingest ortho_2024.png --output cog/ --compress jpeg
+    python ImageryCache.py info DrapeYOLO_COG/images/train/clipped.tif
+
+    raster = open_raster(path)
+    rgb = raster.read(Window(col, row, 128, 128))      # (128, 128, 3) uint8, zero outside
+    valid = raster.read_mask(window)                   # (H, W) uint8, None if the raster has no mask
+"""
+import argparse
+import os
+import shutil
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+import numpy as np
+import rasterio
+import rasterio.shutil
+from PIL import Image
+from rasterio.crs import CRS
+from rasterio.enums import MaskFlags, Resampling
+from rasterio.windows import Window
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.tif', '.tiff')
+COPY_EXTENSIONS = ('.txt', '.yaml', '.yml', '.geojson', '.json')  # labels and configs mirrored next to the COGs
+
+# ---------------- CONFIGURATION ----------------
+
+class Config:
+    block_size = 512            # COG tile size (pixels)
+    compress = 'deflate'        # 'deflate' (lossless), 'jpeg' or 'webp' (lossy, much smaller)
+    quality = 90                # jpeg / webp quality
+    min_overview = 256          # overviews are added until the smallest level fits this size
+    cache_mb = 512              # decoded-block LRU budget per process
+    strip_mb = 64               # untiled rasters are cached in full-width strips of about this size
+    max_open = 32               # raster handles kept open per process
+
+config = Config()
+
+# ---------------- INGEST ----------------
+
+def overview_levels(width: int, height: int, min_size: int) -> List[int]:
+    """2, 4, 8, ... until the overview fits within min_size."""
+    levels, factor = [], 2
+    while max(width, height) / factor >= min_size:
+        levels.append(factor)
+        factor *= 2
+    return levels
+
+def source_mask(src, data: np.ndarray, window: Window) -> np.ndarray:
+    """Validity mask (255 = data) for one strip: alpha band, the source's own mask, or non-zero pixels."""
+    if src.count == 4:
+        return np.where(src.read(4, window=window) > 0, 255, 0).astype(np.uint8)
+    if any(MaskFlags.all_valid not in flags for flags in src.mask_flag_enums):
+        return src.dataset_mask(window=window)
+    return np.where(data.any(axis=0), 255, 0).astype(np.uint8)
+
+def ingest_image(src_path: str, dst_path: str, epsg: Optional[int] = None) -> str:
+    """Convert one image to a COG with overviews and an internal mask; returns dst_path."""
+    tmp_path = dst_path + '.tmp.tif'
+    with rasterio.open(src_path) as src:
+        indexes = [1, 2, 3] if src.count >= 3 else [1, 1, 1]
+        crs = CRS.from_epsg(epsg) if epsg else src.crs
+        profile = {
+            'driver': 'GTiff', 'width': src.width, 'height': src.height, 'count': 3, 'dtype': 'uint8',
+            'crs': crs, 'transform': src.transform, 'tiled': True,
+            'blockxsize': config.block_size, 'blockysize': config.block_size, 'compress': 'deflate',
+        }
+        with rasterio.Env(GDAL_TIFF_INTERNAL_MASK=True):
+            with rasterio.open(tmp_path, 'w', **profile) as dst:
+                # Full-width strips: PNG/JPEG decode sequentially, so never seek backwards in the source
+                for row in range(0, src.height, config.block_size):
+                    window = Window(0, row, src.width, min(config.block_size, src.height - row))
+                    data = src.read(indexes, window=window).astype(np.uint8)
+                    dst.write(data, window=window)
+                    dst.write_mask(source_mask(src, data, window), window=window)
+                levels = overview_levels(src.width, src.height, config.min_overview)
+                if levels:
+                    dst.build_overviews(levels, Resampling.average)
+
+            options = {'BLOCKSIZE': config.block_size, 'COMPRESS': config.compress.upper(),
+                       'OVERVIEW_RESAMPLING': 'AVERAGE', 'BIGTIFF': 'IF_SAFER'}
+            if config.compress.lower() in ('jpeg', 'webp'):
+                options['QUALITY'] = config.quality
+            rasterio.shutil.copy(tmp_path, dst_path, driver='COG', **options)
+    os.remove(tmp_path)
+    return dst_path
+
+def ingest(inputs: List[str], output: str, epsg: Optional[int] = None, force: bool = False) -> List[str]:
+    """Ingest files and folders (mirrored recursively) into output; returns the COG paths."""
+    jobs = []
+    for entry in inputs:
+        entry = Path(entry)
+        if entry.is_dir():
+            for path in sorted(entry.rglob('*')):
+                if path.is_file():
+                    jobs.append((path, Path(output) / path.relative_to(entry)))
+        else:
+            jobs.append((entry, Path(output) / entry.name))
+
+    written = []
+    for src, dst in jobs:
+        suffix = src.suffix.lower()
+        if suffix in IMAGE_EXTENSIONS:
+            dst = dst.with_suffix('.tif')
+        elif suffix not in COPY_EXTENSIONS:
+            continue
+        if not force and dst.exists() and dst.stat().st_mtime >= src.stat().st_mtime:
+            continue
+        dst.parent.mkdir(parents=True, exist_ok=True)
+        if suffix in COPY_EXTENSIONS:
+            shutil.copy2(src, dst)
+            continue
+        print(f"🗜️  {src} → {dst}")
+        written.append(ingest_image(str(src), str(dst), epsg))
+    print(f"✅ Ingested {len(written)} image(s) into {output}")
+    return written
+
+# ---------------- BLOCK CACHE ----------------
+
+class BlockCache:
+    """Process-wide LRU of decoded blocks, bounded by bytes."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.blocks = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, key, loader):
+        with self.lock:
+            value = self.blocks.get(key)
+            if value is not None:
+                self.blocks.move_to_end(key)
+                self.hits += 1
+                return value
+        value = loader()  # decode outside the lock; a concurrent duplicate decode is harmless
+        size = sum(a.nbytes for a in value if a is not None)
+        with self.lock:
+            self.misses += 1
+            if key not in self.blocks:
+                self.blocks[key] = value
+                self.bytes += size
+            while self.bytes > self.max_bytes and len(self.blocks) > 1:
+                _, old = self.blocks.popitem(last=False)
+                self.bytes -= sum(a.nbytes for a in old if a is not None)
+        return value
+
+    def stats(self) -> dict:
+        return {'blocks': len(self.blocks), 'mb': round(self.bytes / 2**20, 1), 'hits': self.hits, 'misses': self.misses}
+
+_cache = BlockCache(config.cache_mb * 2**20)
+_open = OrderedDict()
+_open_lock = threading.Lock()
+
+def set_cache_size(mb: int) -> None:
+    _cache.max_bytes = mb * 2**20
+
+def cache_stats() -> dict:
+    return _cache.stats()
+
+def file_stamp(path: str) -> Tuple[int, int]:
+    """(mtime_ns, size) of a file; part of every cache key so rewritten rasters never hit old blocks."""
+    st = os.stat(path)
+    return st.st_mtime_ns, st.st_size
+
+# ---------------- READER ----------------
+
+class CachedRaster:
+    """Window reads of one raster served from cached decoded blocks."""
+
+    def __init__(self, path: str, cache: BlockCache = None):
+        self.path = os.path.abspath(path)
+        self.cache = cache or _cache
+        self.stamp = file_stamp(self.path)
+        self.src = rasterio.open(self.path)
+        self.lock = threading.Lock()  # a GDAL handle must not be used by two threads at once
+        self.width, self.height = self.src.width, self.src.height
+        self.count = self.src.count
+        self.transform, self.crs = self.src.transform, self.src.crs
+        self.indexes = [1, 2, 3] if self.count >= 3 else [1, 1, 1]
+        self.tiled = bool(self.src.profile.get('tiled'))
+        if self.tiled:
+            self.block_h, self.block_w = self.src.block_shapes[0]
+        else:
+            # Untiled PNG/JPEG decode from the top on every window read, so cache large full-width strips
+            rows = max(1, config.strip_mb * 2**20 // (self.width * 3))
+            self.block_h, self.block_w = min(self.height, rows), self.width
+        self.has_mask = self.count == 4 or any(MaskFlags.all_valid not in f for f in self.src.mask_flag_enums)
+
+    def close(self):
+        """Close the handle once no read is using it; a read through a stale reference reopens it."""
+        with self.lock:
+            self.src.close()
+
+    def _handle(self):
+        """Open dataset for a read; the caller holds self.lock."""
+        if self.src.closed:
+            if file_stamp(self.path) != self.stamp:
+                raise RuntimeError(f"{self.path} changed on disk; call open_raster() again")
+            self.src = rasterio.open(self.path)
+        return self.src
+
+    def _load_block(self, row: int, col: int):
+        window = Window(col * self.block_w, row * self.block_h,
+                        min(self.block_w, self.width - col * self.block_w),
+                        min(self.block_h, self.height - row * self.block_h))
+        with self.lock:
+            src = self._handle()
+            rgb = np.moveaxis(src.read(self.indexes, window=window), 0, -1).astype(np.uint8)
+            if self.count == 4:
+                mask = src.read(4, window=window)
+            elif self.has_mask:
+                mask = src.dataset_mask(window=window)
+            else:
+                mask = None
+        return rgb, mask
+
+    def block(self, row: int, col: int):
+        """(rgb, mask) of one block, decoded at most once while it stays in the cache."""
+        return self.cache.get((self.path, self.stamp, row, col), lambda: self._load_block(row, col))
+
+    def _assemble(self, window: Window, channel: int) -> Optional[np.ndarray]:
+        col0, row0 = int(window.col_off), int(window.row_off)
+        w, h = int(window.width), int(window.height)
+        out = np.zeros((h, w, 3) if channel == 0 else (h, w), dtype=np.uint8)
+        x0, y0 = max(0, col0), max(0, row0)
+        x1, y1 = min(self.width, col0 + w), min(self.height, row0 + h)
+        if x1 <= x0 or y1 <= y0:
+            return out
+        for row in range(y0 // self.block_h, (y1 - 1) // self.block_h + 1):
+            for col in range(x0 // self.block_w, (x1 - 1) // self.block_w + 1):
+                data = self.block(row, col)[channel]
+                if data is None:
+                    return None
+                bx, by = col * self.block_w, row * self.block_h
+                sx0, sy0 = max(x0, bx), max(y0, by)
+                sx1, sy1 = min(x1, bx + data.shape[1]), min(y1, by + data.shape[0])
+                out[sy0 - row0:sy1 - row0, sx0 - col0:sx1 - col0] = data[sy0 - by:sy1 - by, sx0 - bx:sx1 - bx]
+        return out
+
+    def read(self, window: Window) -> np.ndarray:
+        """(H, W, 3) uint8 RGB for a pixel window; outside the raster is zero-filled."""
+        return self._assemble(window, 0)
+
+    def read_mask(self, window: Window) -> Optional[np.ndarray]:
+        """(H, W) validity mask (0 = nodata) for a window, or None if the raster has no alpha/mask."""
+        if not self.has_mask:
+            return None
+        return self._assemble(window, 1)
+
+    def read_preview(self, max_size: int) -> Tuple[Image.Image, float]:
+        """Decimated RGB image no larger than max_size, read from the overviews; returns (image, scale)."""
+        scale = min(1.0, max_size / max(self.width, self.height))
+        out_shape = (max(1, round(self.height * scale)), max(1, round(self.width * scale)))
+
+        def load():
+            with self.lock:
+                data = self._handle().read(self.indexes, out_shape=out_shape, resampling=Resampling.average)
+            return (np.moveaxis(data, 0, -1).astype(np.uint8),)
+
+        data = self.cache.get((self.path, self.stamp, 'preview', out_shape), load)[0]
+        return Image.fromarray(data), scale
+
+def open_raster(path: str) -> CachedRaster:
+    """
+    Shared CachedRaster for a path (handles kept open per process, least recently used closed first).
+    A file whose mtime or size changed since it was opened gets a fresh handle.
+    """
+    key = os.path.abspath(path)
+    stamp = file_stamp(key)
+    retired = []
+    with _open_lock:
+        raster = _open.pop(key, None)
+        if raster is not None and raster.stamp != stamp:
+            retired.append(raster)
+            raster = None
+        if raster is None:
+            raster = CachedRaster(key)
+        _open[key] = raster
+        while len(_open) > config.max_open:
+            retired.append(_open.popitem(last=False)[1])
+    # Closed outside _open_lock: close() waits for any read another thread is running on the handle
+    for old in retired:
+        old.close()
+    return raster
+
+# ---------------- CLI ----------------
+
+def print_info(path: str) -> None:
+    with rasterio.open(path) as src:
+        profile = src.profile
+        print(f"{path}")
+        print(f"  size: {src.width} x {src.height}, bands: {src.count}, crs: {src.crs}")
+        print(f"  tiled: {bool(profile.get('tiled'))} {src.block_shapes[0]}, compress: {profile.get('compress')}")
+        print(f"  overviews: {src.overviews(1)}")
+        print(f"  mask: {[f.name for f in src.mask_flag_enums[0]]}")
+
+def main():
+    """Entry point."""
+    parser = argparse.ArgumentParser(description="Ingest imagery into COGs and inspect them.")
+    commands = parser.add_subparsers(dest='command', required=True)
+    ingest_cmd = commands.add_parser('ingest', help='Convert images (files or dataset folders) to COGs')
+    ingest_cmd.add_argument('inputs', nargs='+', help='Images and/or folders (mirrored recursively)')
+    ingest_cmd.add_argument('--output', required=True, help='Output folder')
+    ingest_cmd.add_argument('--block', type=int, default=config.block_size, help='Tile size')
+    ingest_cmd.add_argument('--compress', default=config.compress, choices=['deflate', 'jpeg', 'webp'])
+    ingest_cmd.add_argument('--quality', type=int, default=config.quality, help='jpeg / webp quality')
+    ingest_cmd.add_argument('--epsg', type=int, help='Assign this CRS (the source rasters carry a wrong one)')
+    ingest_cmd.add_argument('--force', action='store_true', help='Re-ingest even if the COG is newer')
+    info_cmd = commands.add_parser('info', help='Show tiling, compression, overviews and mask of rasters')
+    info_cmd.add_argument('paths', nargs='+')
+    args = parser.parse_args()
+
+    if args.command == 'ingest':
+        config.block_size, config.compress, config.quality = args.block, args.compress, args.quality
+        ingest(args.inputs, args.output, args.epsg, args.force)
+    else:
+        for path in args.paths:
+            print_info(path)
+
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,12 @@
 import os
+import sys
+from pathlib import Path
 from PIL import Image
+from rasterio.windows import Window
+
+# Shared imagery reader: COGs from 0.Ingest/ImageryCache.py (or any raster) served from decoded-block cache
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / '0.Ingest'))
+from ImageryCache import IMAGE_EXTENSIONS, open_raster
 
 # --- Configuration ---
 DATASET_ROOT = r'C:\GIS_Working\ObjectDetection\DrapeYOLO' # main YOLO dataset root
@@ -47,7 +54,7 @@ def process_split(split_name):
     print(f"Output → {output_images_dir}")
 
     for img_filename in os.listdir(source_images_dir):
-        if not img_filename.lower().endswith(('.png', '.jpg', '.jpeg')):
+        if not img_filename.lower().endswith(IMAGE_EXTENSIONS):
             continue
 
         basename = os.path.splitext(img_filename)[0]
@@ -59,8 +66,8 @@ def process_split(split_name):
             continue
 
         try:
-            original_img = Image.open(img_path).convert("RGB")
-            img_w, img_h = original_img.size
+            raster = open_raster(img_path)
+            img_w, img_h = raster.width, raster.height
         except Exception as e:
             print(f"❌ Error opening {img_filename}: {e}")
             continue
@@ -80,9 +87,6 @@ def process_split(split_name):
                 right = min(left + PATCH_SIZE, img_w)
                 bottom = min(top + PATCH_SIZE, img_h)
 
-                # Extract patch
-                patch = original_img.crop((left, top, right, bottom))
-
                 # Collect objects inside patch
                 patch_labels = []
                 for obj in objects:
@@ -112,6 +116,9 @@ def process_split(split_name):
                 if not patch_labels:
                     continue
 
+                # Extract patch (only the blocks it touches are decoded, once per image)
+                patch = Image.fromarray(raster.read(Window(left, top, right - left, bottom - top)))
+
                 # Save patch image as png section commented out to change into jpeg
                 # patch_name = f"{basename}_patch{patch_idx:04d}.png"
                 # patch.save(os.path.join(output_images_dir, patch_name))
@@ -135,10 +142,16 @@ def process_split(split_name):
 
 
 # --- Run for all splits ---
-total = 0
-for split in VALID_SPLITS:
-    total += process_split(split)
+def main():
+    total = 0
+    for split in VALID_SPLITS:
+        total += process_split(split)
+
+    print("\n--- Sliding Patch Generation Complete ---")
+    print(f"Grand total patches generated: {total}")
+    print(f"Saved under: {OUTPUT_PATCHES_ROOT}")
+    return total
+
 
-print("\n--- Sliding Patch Generation Complete ---")
-print(f"Grand total patches generated: {total}")
-print(f"Saved under: {OUTPUT_PATCHES_ROOT}")
+if __name__ == '__main__':
+    main()
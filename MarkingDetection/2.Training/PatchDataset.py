@@ -0,0 +1,316 @@
+"""
+On-the-fly Patch Dataset
+Trains straight from the source imagery instead of a PatchGeneration.py output folder.
+
+The dataset keeps an index of every label box (from the YOLO label files next to the
+source images) and samples crops when the dataloader asks for them, in its worker
+processes:
+  * object-centred crops: a random label box, jittered so it isn't always dead centre
+  * background crops (background_ratio): random windows that contain no label box
+Training crops are re-drawn every epoch. Validation crops are fixed: one around every label
+box plus the background share, with seeded jitter, so metrics stay comparable between epochs. Changing the patch size is just a different imgsz,
+with no dataset to regenerate.
+
+Source images are read through the shared imagery cache (0.Ingest/ImageryCache.py): each
+worker decodes a block once and serves later crops from it. Ingested COGs are read
+block by block, and untiled PNG/JPEG in large strips.
+
+Use it through YOLOTrainer (TrainMode.py --on-the-fly) or directly:
+
+    from ultralytics import YOLO
+    from PatchDataset import PatchTrainer
+    YOLO('yolov8s.pt').train(data='DrapeYOLO/data.yaml', trainer=PatchTrainer, imgsz=128)
+
+data.yaml points at the source dataset (images/train, images/val) and may carry optional
+sampler settings:
+
+    patch_sampling:
+      samples_per_epoch: 20000   # default: one crop per label box
+      background_ratio: 0.1
+      jitter: 0.25               # max centre offset, fraction of the patch size
+      min_visibility: 0.25       # keep boxes with at least this fraction inside the crop
+      cache_mb: 256              # decoded-block cache per worker
+
+    python PatchDataset.py DrapeYOLO/images/train --imgsz 128 --preview previews/   # inspect crops
+"""
+import argparse
+import os
+import sys
+from dataclasses import dataclass, fields
+from pathlib import Path
+from typing import List, Optional
+
+import numpy as np
+import rasterio
+import torch
+from rasterio.windows import Window
+from torch.utils.data import Dataset, get_worker_info
+from ultralytics.data.augment import Compose, Format, RandomFlip, RandomHSV, RandomPerspective
+from ultralytics.data.dataset import YOLODataset
+from ultralytics.data.utils import IMG_FORMATS, img2label_paths
+from ultralytics.models.yolo.detect import DetectionTrainer
+from ultralytics.utils.instance import Instances
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / '0.Ingest'))
+import ImageryCache
+
+# ---------------- CONFIGURATION ----------------
+
+@dataclass
+class SamplingConfig:
+    """How crops are drawn from the source images."""
+    patch_size: int = 128
+    samples_per_epoch: Optional[int] = None  # None = one crop per label box
+    background_ratio: float = 0.1            # share of crops without any object
+    jitter: float = 0.25                     # max object offset from the crop centre, fraction of patch_size
+    min_visibility: float = 0.25             # boxes cut by the crop edge need this fraction inside
+    cache_mb: int = 256                      # decoded-block cache per worker process
+    seed: int = 0
+
+    @classmethod
+    def from_dict(cls, values: dict, **overrides) -> 'SamplingConfig':
+        known = {f.name for f in fields(cls)}
+        return cls(**{**{k: v for k, v in (values or {}).items() if k in known}, **overrides})
+
+# ---------------- LABEL INDEX ----------------
+
+def read_yolo_boxes(label_path: str, img_w: int, img_h: int) -> np.ndarray:
+    """YOLO label file → (N, 5) [class_id, x1, y1, x2, y2] in pixels."""
+    rows = []
+    if os.path.exists(label_path):
+        with open(label_path, 'r') as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) < 5:
+                    continue
+                cls, xc, yc, w, h = int(parts[0]), *map(float, parts[1:5])
+                rows.append((cls, (xc - w / 2) * img_w, (yc - h / 2) * img_h,
+                             (xc + w / 2) * img_w, (yc + h / 2) * img_h))
+    return np.array(rows, dtype=np.float32).reshape(-1, 5)
+
+def list_source_images(img_path: str) -> List[str]:
+    """Image files in a folder (or listed in a .txt file, as ultralytics accepts)."""
+    if os.path.isfile(img_path) and img_path.endswith('.txt'):
+        root = os.path.dirname(img_path)
+        with open(img_path, 'r') as f:
+            paths = [os.path.join(root, line.strip()) for line in f if line.strip()]
+    else:
+        paths = [os.path.join(img_path, name) for name in sorted(os.listdir(img_path))]
+    return [p for p in paths if p.rsplit('.', 1)[-1].lower() in IMG_FORMATS]
+
+class SourceImage:
+    """One source image: size from the header, crops read through the worker's imagery cache."""
+
+    def __init__(self, path: str):
+        self.path = path
+        with rasterio.open(path) as src:
+            self.width, self.height = src.width, src.height
+
+    def read(self, x0: int, y0: int, size: int) -> np.ndarray:
+        """size x size RGB crop at (x0, y0); outside the image is zero-filled."""
+        return ImageryCache.open_raster(self.path).read(Window(x0, y0, size, size))
+
+# ---------------- DATASET ----------------
+
+class PatchDataset(Dataset):
+    """Random object-centred / background crops from source images, in ultralytics' sample format."""
+
+    def __init__(self, img_path: str, sampling: SamplingConfig, hyp=None, augment: bool = True,
+                 names: Optional[dict] = None):
+        self.sampling = sampling
+        self.augment = augment
+        self.names = names or {}
+        self.images = []
+        self.boxes = []
+        for path in list_source_images(img_path):
+            image = SourceImage(path)
+            self.images.append(image)
+            self.boxes.append(read_yolo_boxes(img2label_paths([path])[0], image.width, image.height))
+
+        # Flat index of every label box: (image index, box index)
+        self.objects = np.array([(i, j) for i, boxes in enumerate(self.boxes) for j in range(len(boxes))],
+                                dtype=np.int64).reshape(-1, 2)
+        if not len(self.objects):
+            raise ValueError(f"No labelled objects found under {img_path}")
+        if augment:
+            self.length = sampling.samples_per_epoch or len(self.objects)
+        else:
+            # Every object once, plus background crops in the configured ratio
+            ratio = min(sampling.background_ratio, 0.9)
+            self.length = len(self.objects) + int(round(len(self.objects) * ratio / (1 - ratio)))
+        self.transforms = self.build_transforms(hyp)
+
+        self._rng = None  # per-process, created in each dataloader worker
+
+        print(f"✅ Patch index: {len(self.images)} images, {len(self.objects)} objects, "
+              f"{self.length} {'random' if augment else 'fixed'} {sampling.patch_size}px crops per epoch")
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_rng'] = None
+        return state
+
+    def __len__(self):
+        return self.length
+
+    @property
+    def labels(self) -> List[dict]:
+        """Per-image labels (normalized xywh), as YOLODataset exposes them for plot_training_labels."""
+        labels = []
+        for image, boxes in zip(self.images, self.boxes):
+            xywh = np.stack([(boxes[:, 1] + boxes[:, 3]) / 2 / image.width, (boxes[:, 2] + boxes[:, 4]) / 2 / image.height,
+                             (boxes[:, 3] - boxes[:, 1]) / image.width, (boxes[:, 4] - boxes[:, 2]) / image.height], 1)
+            labels.append({'im_file': image.path, 'cls': boxes[:, :1], 'bboxes': xywh})
+        return labels
+
+    collate_fn = staticmethod(YOLODataset.collate_fn)
+
+    def build_transforms(self, hyp) -> Compose:
+        """Geometric + colour augmentation for training crops, format-only for validation."""
+        transforms = []
+        if self.augment and hyp is not None:
+            transforms += [
+                RandomPerspective(degrees=hyp.degrees, translate=hyp.translate, scale=hyp.scale,
+                                  shear=hyp.shear, perspective=hyp.perspective, border=(0, 0)),
+                RandomHSV(hgain=hyp.hsv_h, sgain=hyp.hsv_s, vgain=hyp.hsv_v),
+                RandomFlip(direction='vertical', p=hyp.flipud),
+                RandomFlip(direction='horizontal', p=hyp.fliplr),
+            ]
+        transforms.append(Format(bbox_format='xywh', normalize=True, return_mask=False,
+                                 return_keypoint=False, batch_idx=True))
+        return Compose(transforms)
+
+    # ---- sampling ----
+
+    def rng(self, index: int) -> np.random.Generator:
+        """Training: one stream per worker (fresh crops every epoch). Validation: fixed per index."""
+        if self._rng is None:
+            # First sample in this process: size the worker's block cache for either split
+            ImageryCache.set_cache_size(self.sampling.cache_mb)
+            info = get_worker_info()
+            self._rng = np.random.default_rng(info.seed if info else torch.initial_seed())
+        if not self.augment:
+            return np.random.default_rng([self.sampling.seed, index])
+        return self._rng
+
+    def choose_crop(self, rng: np.random.Generator):
+        """(image index, x0, y0) of the next training crop."""
+        if rng.random() < self.sampling.background_ratio:
+            crop = self.background_crop(rng)
+            if crop is not None:
+                return crop
+            # Dense image: fall through to an object crop
+        return self.object_crop(*self.objects[rng.integers(len(self.objects))], rng)
+
+    def fixed_crop(self, index: int, rng: np.random.Generator):
+        """(image index, x0, y0) of validation crop `index`: objects in index order, then background."""
+        if index < len(self.objects):
+            return self.object_crop(*self.objects[index], rng)
+        crop = self.background_crop(rng)
+        return crop if crop is not None else self.object_crop(*self.objects[index % len(self.objects)], rng)
+
+    def background_crop(self, rng: np.random.Generator):
+        """A random window without any label box, or None if ten tries all hit one."""
+        size = self.sampling.patch_size
+        for _ in range(10):
+            i = int(rng.integers(len(self.images)))
+            image = self.images[i]
+            x0 = int(rng.integers(max(1, image.width - size + 1)))
+            y0 = int(rng.integers(max(1, image.height - size + 1)))
+            boxes = self.boxes[i]
+            hits = ((boxes[:, 1] < x0 + size) & (boxes[:, 3] > x0) &
+                    (boxes[:, 2] < y0 + size) & (boxes[:, 4] > y0))
+            if not hits.any():
+                return i, x0, y0
+        return None
+
+    def object_crop(self, i: int, j: int, rng: np.random.Generator):
+        """Crop around label box j of image i, jittered so it isn't always dead centre."""
+        size = self.sampling.patch_size
+        _, x1, y1, x2, y2 = self.boxes[i][j]
+        max_shift = self.sampling.jitter * size
+        cx = (x1 + x2) / 2 + rng.uniform(-max_shift, max_shift)
+        cy = (y1 + y2) / 2 + rng.uniform(-max_shift, max_shift)
+        return int(i), int(round(cx - size / 2)), int(round(cy - size / 2))
+
+    def crop_boxes(self, i: int, x0: int, y0: int) -> np.ndarray:
+        """Label boxes inside the crop, clipped and shifted to crop pixels; (N, 5) [cls, x1, y1, x2, y2]."""
+        size = self.sampling.patch_size
+        boxes = self.boxes[i]
+        clipped = boxes.copy()
+        clipped[:, [1, 3]] = np.clip(boxes[:, [1, 3]] - x0, 0, size)
+        clipped[:, [2, 4]] = np.clip(boxes[:, [2, 4]] - y0, 0, size)
+        area = (boxes[:, 3] - boxes[:, 1]) * (boxes[:, 4] - boxes[:, 2])
+        visible = (clipped[:, 3] - clipped[:, 1]) * (clipped[:, 4] - clipped[:, 2])
+        keep = visible >= self.sampling.min_visibility * np.maximum(area, 1e-6)
+        return clipped[keep & (visible > 0)]
+
+    def __getitem__(self, index: int) -> dict:
+        rng = self.rng(index)
+        i, x0, y0 = self.choose_crop(rng) if self.augment else self.fixed_crop(index, rng)
+        size = self.sampling.patch_size
+        boxes = self.crop_boxes(i, x0, y0)
+        sample = {
+            'im_file': f"{self.images[i].path}#{x0},{y0}",
+            'img': np.ascontiguousarray(self.images[i].read(x0, y0, size)[:, :, ::-1]),  # ultralytics works in BGR
+            'ori_shape': (size, size),
+            'resized_shape': (size, size),
+            'ratio_pad': ((1.0, 1.0), (0, 0)),
+            'cls': boxes[:, :1],
+            'instances': Instances(boxes[:, 1:5].copy(), bbox_format='xyxy', normalized=False),
+        }
+        return self.transforms(sample)
+
+# ---------------- TRAINER HOOK ----------------
+
+class PatchTrainer(DetectionTrainer):
+    """DetectionTrainer that samples crops from the source images instead of reading patch files."""
+
+    def build_dataset(self, img_path, mode='train', batch=None):
+        sampling = SamplingConfig.from_dict(self.data.get('patch_sampling'), patch_size=self.args.imgsz)
+        if mode != 'train':
+            # Fixed validation crops (one per object plus the background share); the epoch size doesn't apply
+            sampling.samples_per_epoch = None
+        return PatchDataset(img_path, sampling, hyp=self.args if mode == 'train' else None,
+                            augment=mode == 'train', names=self.data.get('names'))
+
+# ---------------- PREVIEW ----------------
+
+def save_previews(dataset: PatchDataset, output_dir: str, count: int) -> None:
+    """Write a few decoded crops with their boxes drawn, to check sampling settings."""
+    from PIL import Image, ImageDraw
+
+    os.makedirs(output_dir, exist_ok=True)
+    size = dataset.sampling.patch_size
+    for k in range(count):
+        sample = dataset[k]
+        img = Image.fromarray(sample['img'].numpy().transpose(1, 2, 0))
+        draw = ImageDraw.Draw(img)
+        for cls, (xc, yc, w, h) in zip(sample['cls'].flatten().tolist(), sample['bboxes'].tolist()):
+            draw.rectangle(((xc - w / 2) * size, (yc - h / 2) * size, (xc + w / 2) * size, (yc + h / 2) * size),
+                           outline=(255, 0, 0))
+            draw.text(((xc - w / 2) * size + 2, (yc - h / 2) * size + 1), dataset.names.get(int(cls), str(int(cls))),
+                      fill=(255, 0, 0))
+        img.save(os.path.join(output_dir, f"crop_{k:04d}.png"))
+    print(f"🖼️  {count} previews saved to {output_dir}")
+
+def main():
+    """Entry point: build the index and optionally dump preview crops."""
+    parser = argparse.ArgumentParser(description="Inspect on-the-fly patch sampling.")
+    parser.add_argument('images', help='Source image folder (labels in the matching labels/ folder)')
+    parser.add_argument('--imgsz', type=int, default=128, help='Patch size')
+    parser.add_argument('--background', type=float, default=SamplingConfig.background_ratio, help='Background crop ratio')
+    parser.add_argument('--jitter', type=float, default=SamplingConfig.jitter, help='Object offset, fraction of patch')
+    parser.add_argument('--preview', help='Folder for preview crops')
+    parser.add_argument('--count', type=int, default=16, help='Preview crops to write')
+    args = parser.parse_args()
+
+    sampling = SamplingConfig(patch_size=args.imgsz, background_ratio=args.background, jitter=args.jitter)
+    dataset = PatchDataset(args.images, sampling, augment=False)
+    counts = np.bincount(np.concatenate([b[:, 0].astype(int) for b in dataset.boxes]))
+    print("Objects per class: " + ", ".join(f"{c}: {n}" for c, n in enumerate(counts) if n))
+    if args.preview:
+        save_previews(dataset, args.preview, args.count)
+
+if __name__ == '__main__':
+    main()
@@ -47,15 +47,13 @@ def restore_stderr(old_stderr, devnull):
 class Config:
     """Training configuration optimized for patch-based datasets."""
     data_yaml_path: str = r'I:\Drape\DrapeYOLO_Patches2\data.yaml' # Data.yml location - This will be inside your Training data folder.
-    # This is what the content of the data.yaml looks like. 
-        '''' 
-        # data.yaml
-        path: I:/Drape/DrapeYOLO_Patches2 # This is the root where out 'images' and 'labels' folders are for the patches
-        train: images/train              # Path to training images relative to 'path'
-        val: images/val                  # Path to validation images relative to 'path'
-        nc: 6                            # Number of classes (should be the same as the original classes)
-        names: ['StopBar', 'TurnArrow', 'CrossWalk', 'Diamond', 'CycleLane', 'Cross'] # The class names 
-        '''
+    # This is what the content of the data.yaml looks like.
+    #   # data.yaml
+    #   path: I:/Drape/DrapeYOLO_Patches2 # This is the root where out 'images' and 'labels' folders are for the patches
+    #   train: images/train              # Path to training images relative to 'path'
+    #   val: images/val                  # Path to validation images relative to 'path'
+    #   nc: 6                            # Number of classes (should be the same as the original classes)
+    #   names: ['StopBar', 'TurnArrow', 'CrossWalk', 'Diamond', 'CycleLane', 'Cross'] # The class names
     
     model_weights: str = 'yolov8s.pt'
     epochs: int = 300  # More epochs for patch dataset
@@ -64,6 +62,7 @@ class Config:
     run_name: str = 'road_markings_patches_v1'
     device: str = None
     patience: int = 150
+    on_the_fly: bool = False  # Sample crops from the source imagery each epoch (PatchDataset.py); data.yaml then points at the source dataset
     
     def __post_init__(self):
         # Auto-detect device and optimize for patch training
@@ -129,8 +128,15 @@ class YOLOTrainer:
         print(f"\n🏃 Starting patch-based training on {self.config.device.upper()}...")
         print("📦 Training with sliding window patches (libpng warnings suppressed)")
         
+        trainer = None
+        if self.config.on_the_fly:
+            from PatchDataset import PatchTrainer
+            trainer = PatchTrainer
+            print(f"🎲 On-the-fly {self.config.image_size}px crops from source imagery (no patch folder needed)")
+
         try:
             results = self.model.train(
+                trainer=trainer,
                 data=self.config.data_yaml_path,
                 epochs=self.config.epochs,
                 imgsz=self.config.image_size,
@@ -222,6 +228,7 @@ def main():
     parser.add_argument('--imgsz', type=int, default=128, help='Image size')
     parser.add_argument('--name', default='road_markings_v2', help='Run name')
     parser.add_argument('--device', help='Training device')
+    parser.add_argument('--on-the-fly', action='store_true', help='Sample patches from source images (PatchDataset.py)')
     
     args = parser.parse_args()
     
@@ -236,6 +243,8 @@ def main():
     config.run_name = args.name
     if args.device:
         config.device = args.device
+    if args.on_the_fly:
+        config.on_the_fly = True
     
     # Run trainer
     trainer = YOLOTrainer(config)
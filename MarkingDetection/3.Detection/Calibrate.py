@@ -0,0 +1,134 @@
+"""
+Per-class Confidence Calibration
+Learns one confidence threshold per class from the validation split, so rare
+classes (Diamond, CycleLane) can run lower and StopBar higher than the global cutoff.
+
+    python Calibrate.py --images DrapeYOLO_Patches/images/val --labels DrapeYOLO_Patches/labels/val \
+        --model best.pt --output class_thresholds.json
+
+Feed the result back with:  python DetectionEngine.py ... --thresholds class_thresholds.json
+"""
+import argparse
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+from DetectionEngine import DetectionConfig, DetectionEngine, box_iou, list_images
+
+def load_yolo_labels(label_path: str, img_w: int, img_h: int) -> np.ndarray:
+    """YOLO label file → (N, 5) [class_id, x1, y1, x2, y2] in pixels."""
+    rows = []
+    if os.path.exists(label_path):
+        with open(label_path, 'r') as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) < 5:
+                    continue
+                cls, xc, yc, w, h = int(parts[0]), *map(float, parts[1:5])
+                rows.append((cls, (xc - w / 2) * img_w, (yc - h / 2) * img_h,
+                             (xc + w / 2) * img_w, (yc + h / 2) * img_h))
+    return np.array(rows, dtype=float).reshape(-1, 5)
+
+def match_image(detections: list, truth: np.ndarray, iou_threshold: float) -> list:
+    """Greedy score-ordered matching; returns (class_id, score, is_true_positive) per detection."""
+    matched = np.zeros(len(truth), dtype=bool)
+    scored = []
+    for det in sorted(detections, key=lambda d: d['score'], reverse=True):
+        cls = det['category_id']
+        hit = False
+        candidates = np.where(~matched & (truth[:, 0] == cls))[0]
+        if len(candidates):
+            ious = box_iou(np.asarray(det['bbox'], dtype=float), truth[candidates, 1:])
+            best = int(np.argmax(ious))
+            if ious[best] >= iou_threshold:
+                matched[candidates[best]] = True
+                hit = True
+        scored.append((cls, det['score'], hit))
+    return scored
+
+def best_threshold(scores: np.ndarray, hits: np.ndarray, support: int, beta: float, default: float) -> dict:
+    """Sweep every observed score as a cutoff and keep the one with the best F-beta."""
+    if support == 0 or len(scores) == 0:
+        return {'threshold': default, 'precision': 0.0, 'recall': 0.0, 'f_score': 0.0, 'support': support}
+    order = np.argsort(-scores)
+    scores, hits = scores[order], hits[order]
+    tp = np.cumsum(hits)
+    precision = tp / np.arange(1, len(hits) + 1)
+    recall = tp / support
+    b2 = beta * beta
+    f_score = (1 + b2) * precision * recall / np.maximum(b2 * precision + recall, 1e-9)
+    best = int(np.argmax(f_score))
+    return {
+        'threshold': round(float(scores[best]), 4),
+        'precision': round(float(precision[best]), 4),
+        'recall': round(float(recall[best]), 4),
+        'f_score': round(float(f_score[best]), 4),
+        'support': support,
+    }
+
+def main(argv=None):
+    """Entry point."""
+    parser = argparse.ArgumentParser(description="Learn per-class confidence thresholds on the validation split.")
+    parser.add_argument('--images', required=True, help='Validation images folder')
+    parser.add_argument('--labels', required=True, help='Validation YOLO labels folder')
+    parser.add_argument('--model', required=True, help='Path to YOLO weights (best.pt)')
+    parser.add_argument('--output', default='class_thresholds.json', help='Thresholds JSON to write')
+    parser.add_argument('--floor', type=float, default=0.05, help='Lowest score considered')
+    parser.add_argument('--iou', type=float, default=0.5, help='IoU for a true positive')
+    parser.add_argument('--beta', type=float, default=1.0, help='F-beta weight (>1 favours recall)')
+    parser.add_argument('--default', type=float, default=0.3, help='Threshold for classes with no support')
+    parser.add_argument('--slice-size', type=int, default=128, help='SAHI slice size')
+    parser.add_argument('--tta', action='store_true', help='Calibrate with flip-TTA enabled (match production)')
+    args = parser.parse_args(argv)
+
+    engine = DetectionEngine(DetectionConfig(
+        model_path=args.model,
+        conf_threshold=args.floor,
+        slice_size=args.slice_size,
+        skip_empty_slices=False,
+        tta=args.tta,
+    ))
+
+    image_paths = list_images([args.images], DetectionConfig.image_extensions)
+    scored = []
+    support = {}
+    for idx, image_path in enumerate(image_paths, start=1):
+        with Image.open(image_path) as img:
+            img_w, img_h = img.size
+        truth = load_yolo_labels(os.path.join(args.labels, Path(image_path).stem + '.txt'), img_w, img_h)
+        for cls in truth[:, 0].astype(int):
+            support[cls] = support.get(cls, 0) + 1
+        scored.extend(match_image(engine.predict(image_path), truth, args.iou))
+        if idx % 200 == 0:
+            print(f"  Processed {idx}/{len(image_paths)} images...")
+
+    results = {}
+    for cls_id, name in sorted(engine.category_names.items()):
+        rows = [(score, hit) for cls, score, hit in scored if cls == cls_id]
+        scores = np.array([r[0] for r in rows], dtype=float)
+        hits = np.array([r[1] for r in rows], dtype=bool)
+        results[name] = best_threshold(scores, hits, support.get(cls_id, 0), args.beta, args.default)
+
+    print("\n" + "="*60)
+    print("CALIBRATED THRESHOLDS")
+    print("="*60)
+    for name, r in results.items():
+        print(f"{name:12s} thr={r['threshold']:.3f}  P={r['precision']:.3f}  R={r['recall']:.3f}  "
+              f"F={r['f_score']:.3f}  n={r['support']}")
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump({
+            'thresholds': {name: r['threshold'] for name, r in results.items()},
+            'metrics': results,
+            'images': len(image_paths),
+            'iou': args.iou,
+            'beta': args.beta,
+            'tta': args.tta,
+        }, f, indent=2)
+    print(f"\n✅ Saved thresholds: {args.output}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,373 @@
+"""
+Warm Detection Server
+Keeps the model, the road buffer and its prepared index loaded between requests, so an
+ad-hoc "check this intersection" job skips the imports, model load and buffer
+reprojection that dominate a one-off Detect2GeoJ.py / Detect2img.py run.
+
+Slices from concurrent requests are pooled into shared model calls (up to --max-batch
+slices, waiting at most --max-wait-ms for other callers), and every response reports
+its own latency breakdown.
+
+    python DetectServer.py serve --model best.pt --buffer roads.geojson --port 8765
+    python DetectServer.py serve --model best.pt --socket /tmp/detect.sock
+    python DetectServer.py send tile.tif --window 2048 1024 512 512 --format geojson
+
+    POST /detect  {"image": "...", "window": [col, row, width, height],
+                   "format": "json" | "geojson" | "csv" | "gpkg" | "png", "output_dir": "..."}
+    GET  /stats   latency percentiles and batch fill since start
+"""
+import argparse
+import http.client
+import json
+import os
+import queue
+import socket
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from socketserver import ThreadingMixIn, UnixStreamServer
+from typing import List, Optional
+
+import numpy as np
+
+from DetectionEngine import DetectionConfig, DetectionEngine, build_sinks, load_class_thresholds
+
+FORMATS = ('json', 'geojson', 'csv', 'gpkg', 'png')
+FILE_FORMATS = ('csv', 'gpkg', 'png')   # written to output_dir through the engine's sinks
+
+# --------------------------- BATCHING ---------------------------
+
+class TileBatcher:
+    """
+    Single model thread. Callers hand in lists of slices and block until their rows come back;
+    the thread merges whatever is queued into one predict_tiles call, so concurrent
+    requests share GPU batches instead of taking turns.
+    """
+
+    def __init__(self, engine: DetectionEngine, max_batch: int = 64, max_wait: float = 0.01):
+        self.engine = engine
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.pending = queue.Queue()
+        self.batches = 0
+        self.slices = 0
+        self.thread = threading.Thread(target=self.loop, daemon=True)
+        self.thread.start()
+
+    def submit(self, tiles: List[np.ndarray]) -> List[np.ndarray]:
+        """Rows for each tile, from a (possibly shared) batched model call."""
+        future = Future()
+        self.pending.put((tiles, future))
+        return future.result()
+
+    def loop(self):
+        while True:
+            chunks = [self.pending.get()]
+            size = len(chunks[0][0])
+            deadline = time.perf_counter() + self.max_wait
+            while size < self.max_batch:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    chunk = self.pending.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                chunks.append(chunk)
+                size += len(chunk[0])
+
+            tiles = [tile for chunk_tiles, _ in chunks for tile in chunk_tiles]
+            try:
+                outputs = self.engine.predict_tiles(tiles)
+            except Exception as e:
+                for _, future in chunks:
+                    future.set_exception(e)
+                continue
+            self.batches += 1
+            self.slices += len(tiles)
+            start = 0
+            for chunk_tiles, future in chunks:
+                future.set_result(outputs[start:start + len(chunk_tiles)])
+                start += len(chunk_tiles)
+
+# --------------------------- SERVER ---------------------------
+
+def detection_record(det: dict) -> dict:
+    """Detection dict as plain JSON (no numpy scalars)."""
+    x, y = det['abs_coords']
+    return {
+        'class': det['category_name'],
+        'confidence': round(float(det['score']), 4),
+        'pixel_x': round(float(det['position']['x']), 2),
+        'pixel_y': round(float(det['position']['y']), 2),
+        'x': x, 'y': y,
+        'bbox': [round(float(v), 2) for v in det['bbox']],
+    }
+
+def to_feature_collection(detections: List[dict], epsg: int) -> dict:
+    """GeoJSON FeatureCollection of detection points (same properties as VectorSink)."""
+    return {
+        'type': 'FeatureCollection',
+        'crs': {'type': 'name', 'properties': {'name': f"urn:ogc:def:crs:EPSG::{epsg}"}},
+        'features': [{
+            'type': 'Feature',
+            'geometry': {'type': 'Point', 'coordinates': list(det['abs_coords'])},
+            'properties': {'class': det['category_name'], 'confidence': round(float(det['score']), 4)},
+        } for det in detections],
+    }
+
+class DetectionService:
+    """Runs jobs against one warm engine and keeps per-request latency history."""
+
+    def __init__(self, engine: DetectionEngine, max_batch: int = 64, max_wait: float = 0.01):
+        self.engine = engine
+        self.batcher = TileBatcher(engine, max_batch, max_wait)
+        self.sink_lock = threading.Lock()     # matplotlib / file sinks are not thread-safe
+        self.latencies = deque(maxlen=1000)
+        self.requests = 0
+        self.started = time.time()
+
+    def warm_up(self):
+        """One dummy batch so CUDA/kernel initialization isn't paid by the first caller."""
+        size = self.engine.config.slice_size
+        start = time.perf_counter()
+        self.batcher.submit([np.zeros((size, size, 3), dtype=np.uint8)])
+        print(f"🔥 Warm-up batch in {(time.perf_counter() - start) * 1000:.0f} ms")
+
+    def handle(self, job: dict) -> dict:
+        """Run one job; returns the response body."""
+        received = time.perf_counter()
+        image = job.get('image')
+        fmt = job.get('format', 'json')
+        window = job.get('window')
+        if not image or not os.path.exists(image):
+            raise ValueError(f"Image not found: {image}")
+        if fmt not in FORMATS:
+            raise ValueError(f"Unknown format {fmt!r}; expected one of {', '.join(FORMATS)}")
+        if window is not None and len(window) != 4:
+            raise ValueError("window must be [col_off, row_off, width, height]")
+        if fmt in FILE_FORMATS and not job.get('output_dir'):
+            raise ValueError(f"format {fmt!r} needs output_dir")
+
+        model = {'seconds': 0.0, 'slices': 0, 'calls': 0}
+
+        def predict_tiles(tiles):
+            start = time.perf_counter()
+            rows = self.batcher.submit(tiles)
+            model['seconds'] += time.perf_counter() - start
+            model['slices'] += len(tiles)
+            model['calls'] += 1
+            return rows
+
+        # The buffer geometry is prepared once at start-up, so concurrent contains_xy calls only read it
+        detections, transform = self.engine.detect(image, window=window, predict_tiles=predict_tiles)
+        inferred = time.perf_counter()
+
+        response = {'image': image, 'window': window, 'format': fmt, 'count': len(detections)}
+        if fmt == 'json':
+            response['detections'] = [detection_record(det) for det in detections]
+        elif fmt == 'geojson':
+            response['geojson'] = to_feature_collection(detections, self.engine.config.crs_epsg)
+        else:
+            with self.sink_lock:
+                sinks = build_sinks([fmt], job['output_dir'])
+                for sink in sinks:
+                    sink.write(image, detections, transform, self.engine.crs)
+                    sink.close()
+            response['output_dir'] = job['output_dir']
+        finished = time.perf_counter()
+
+        timing = {
+            'total_ms': round((finished - received) * 1000, 1),
+            'model_wait_ms': round(model['seconds'] * 1000, 1),   # includes batching wait for other callers
+            'read_and_post_ms': round((inferred - received - model['seconds']) * 1000, 1),
+            'output_ms': round((finished - inferred) * 1000, 1),
+            'slices': model['slices'],
+            'model_calls': model['calls'],
+        }
+        response['timing'] = timing
+        self.latencies.append(timing['total_ms'])
+        self.requests += 1
+        return response
+
+    def stats(self) -> dict:
+        latencies = np.array(self.latencies) if self.latencies else np.zeros(1)
+        batcher = self.batcher
+        return {
+            'uptime_s': round(time.time() - self.started, 1),
+            'requests': self.requests,
+            'latency_ms': {'p50': round(float(np.percentile(latencies, 50)), 1),
+                           'p95': round(float(np.percentile(latencies, 95)), 1),
+                           'max': round(float(latencies.max()), 1)},
+            'model_batches': batcher.batches,
+            'slices': batcher.slices,
+            'mean_batch_fill': round(batcher.slices / batcher.batches, 1) if batcher.batches else 0,
+            'tta_slices': self.engine.tta_slices,
+        }
+
+def make_handler(service: DetectionService):
+    class Handler(BaseHTTPRequestHandler):
+        def address_string(self):
+            # Unix socket peers have no (host, port)
+            return self.client_address[0] if isinstance(self.client_address, tuple) else 'unix'
+
+        def send_json(self, status: int, body: dict):
+            payload = json.dumps(body).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def do_GET(self):
+            if self.path == '/stats':
+                return self.send_json(200, service.stats())
+            self.send_json(404, {'error': f"Unknown path {self.path}"})
+
+        def do_POST(self):
+            if self.path != '/detect':
+                return self.send_json(404, {'error': f"Unknown path {self.path}"})
+            try:
+                job = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+                response = service.handle(job)
+            except (ValueError, json.JSONDecodeError) as e:
+                return self.send_json(400, {'error': str(e)})
+            except Exception as e:
+                print(f"❌ {type(e).__name__}: {e}")
+                return self.send_json(500, {'error': f"{type(e).__name__}: {e}"})
+            timing = response['timing']
+            print(f"⏱️  {os.path.basename(response['image'])} {response['format']}: {response['count']} detections, "
+                  f"{timing['total_ms']} ms ({timing['slices']} slices, model {timing['model_wait_ms']} ms)")
+            self.send_json(200, response)
+
+        def log_message(self, format, *args):
+            pass  # one line per job is printed above
+
+    return Handler
+
+class UnixHTTPServer(ThreadingMixIn, UnixStreamServer):
+    daemon_threads = True
+
+    def server_bind(self):
+        if os.path.exists(self.server_address):
+            os.remove(self.server_address)
+        super().server_bind()
+
+# --------------------------- CLIENT ---------------------------
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, path: str, timeout: float = 600):
+        super().__init__('localhost', timeout=timeout)
+        self.socket_path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+def send_job(job: dict, host: str = '127.0.0.1', port: int = 8765, socket_path: Optional[str] = None) -> dict:
+    """POST a job to a running server and return its JSON response."""
+    conn = UnixHTTPConnection(socket_path) if socket_path else http.client.HTTPConnection(host, port, timeout=600)
+    try:
+        conn.request('POST', '/detect', body=json.dumps(job), headers={'Content-Type': 'application/json'})
+        body = json.loads(conn.getresponse().read())
+    finally:
+        conn.close()
+    if 'error' in body:
+        raise RuntimeError(body['error'])
+    return body
+
+# --------------------------- CLI ---------------------------
+
+def serve(args):
+    defaults = DetectionConfig()
+    config = DetectionConfig(
+        model_path=args.model,
+        buffer_geojson=args.buffer,
+        crs_epsg=args.epsg,
+        slice_size=args.slice_size,
+        slice_overlap=args.overlap,
+        conf_threshold=args.conf,
+        batch_size=min(defaults.batch_size, args.max_batch),
+        class_thresholds=load_class_thresholds(args.thresholds) if args.thresholds else None,
+        tta=args.tta,
+    )
+    start = time.perf_counter()
+    service = DetectionService(DetectionEngine(config), max_batch=args.max_batch, max_wait=args.max_wait_ms / 1000)
+    service.warm_up()
+    print(f"✅ Engine ready in {time.perf_counter() - start:.1f}s")
+
+    if args.socket:
+        server = UnixHTTPServer(args.socket, make_handler(service))
+        where = f"unix:{args.socket}"
+    else:
+        server = ThreadingHTTPServer((args.host, args.port), make_handler(service))
+        where = f"http://{args.host}:{args.port}"
+    print(f"🚀 Listening on {where} (POST /detect, GET /stats)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if args.socket and os.path.exists(args.socket):
+            os.remove(args.socket)
+        print(f"\n{json.dumps(service.stats(), indent=2)}")
+
+def send(args):
+    job = {'image': os.path.abspath(args.image), 'format': args.format}
+    if args.window:
+        job['window'] = args.window
+    if args.output_dir:
+        job['output_dir'] = os.path.abspath(args.output_dir)
+    start = time.perf_counter()
+    response = send_job(job, args.host, args.port, args.socket)
+    round_trip = (time.perf_counter() - start) * 1000
+    if args.output:
+        payload = response.get('geojson', response.get('detections'))
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(payload, f)
+        print(f"✅ Saved {response['count']} detections to {args.output}")
+    else:
+        print(json.dumps({k: v for k, v in response.items() if k not in ('detections', 'geojson')}, indent=2))
+    print(f"Round trip: {round_trip:.0f} ms (server {response['timing']['total_ms']} ms)")
+
+def main(argv=None):
+    """Entry point."""
+    defaults = DetectionConfig()
+    parser = argparse.ArgumentParser(description="Warm road marking detection server and client.")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    server = commands.add_parser('serve', help='Load the model once and serve detection jobs')
+    server.add_argument('--model', required=True, help='Path to YOLO weights (best.pt)')
+    server.add_argument('--buffer', help='Road buffer GeoJSON; detections outside it are dropped')
+    server.add_argument('--conf', type=float, default=defaults.conf_threshold, help='Confidence threshold')
+    server.add_argument('--thresholds', help='Per-class thresholds JSON from Calibrate.py')
+    server.add_argument('--tta', action='store_true', help='Flip-TTA on slices whose max score is uncertain')
+    server.add_argument('--slice-size', type=int, default=defaults.slice_size, help='SAHI slice size')
+    server.add_argument('--overlap', type=float, default=defaults.slice_overlap, help='SAHI slice overlap ratio')
+    server.add_argument('--epsg', type=int, default=defaults.crs_epsg, help='CRS of the imagery')
+    server.add_argument('--max-batch', type=int, default=64, help='Most slices per shared model call')
+    server.add_argument('--max-wait-ms', type=float, default=10, help='How long a batch waits for other callers')
+    server.add_argument('--host', default='127.0.0.1')
+    server.add_argument('--port', type=int, default=8765)
+    server.add_argument('--socket', help='Listen on this Unix socket instead of TCP')
+
+    client = commands.add_parser('send', help='Send one job to a running server')
+    client.add_argument('image', help='Raster to run detection on (path as seen by the server)')
+    client.add_argument('--window', type=int, nargs=4, metavar=('COL', 'ROW', 'WIDTH', 'HEIGHT'),
+                        help='Only this pixel window')
+    client.add_argument('--format', default='json', choices=FORMATS, help='Response / output format')
+    client.add_argument('--output-dir', help='Folder for csv, gpkg and png output (written by the server)')
+    client.add_argument('--output', help='Save the json / geojson result here instead of printing')
+    client.add_argument('--host', default='127.0.0.1')
+    client.add_argument('--port', type=int, default=8765)
+    client.add_argument('--socket', help='Server Unix socket')
+
+    args = parser.parse_args(argv)
+    serve(args) if args.command == 'serve' else send(args)
+
+if __name__ == '__main__':
+    main()
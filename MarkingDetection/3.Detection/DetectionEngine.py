@@ -0,0 +1,786 @@
+"""
+Road Marking Detection Engine
+Shared inference path for Detect2GeoJ.py, Detect2img.py and the command line.
+
+One windowed SAHI pass per image feeds any number of sinks (GeoJSON/GeoPackage,
+PNG overlay, CSV), so exporting several formats never runs the model twice.
+
+    python DetectionEngine.py images/val --model best.pt --buffer roads.geojson \\
+        --output-dir out --sink geojson --sink csv --sink png
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+import geopandas as gpd
+import matplotlib.pyplot as plt
+import rasterio
+import shapely
+from matplotlib.collections import EllipseCollection
+from matplotlib.colors import to_rgb, to_rgba_array
+from matplotlib.patches import Patch
+from PIL import Image, ImageDraw
+from pyproj import CRS
+from rasterio.transform import Affine
+from rasterio.windows import Window
+from sahi.models.ultralytics import UltralyticsDetectionModel
+from sahi.postprocess.combine import GreedyNMMPostprocess
+from sahi.prediction import ObjectPrediction
+from sahi.slicing import get_slice_bboxes
+
+from EpochCache import EpochCache
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / '0.Ingest'))
+from ImageryCache import open_raster
+
+# --------------------------- CONFIG ---------------------------
+
+@dataclass
+class DetectionConfig:
+    """Inference settings shared by every detection entry point."""
+    model_path: str = 'best.pt'
+    buffer_geojson: Optional[str] = None  # None keeps every detection
+    crs_epsg: int = 26918                 # forced CRS; the source rasters carry a wrong one
+    slice_size: int = 128
+    slice_overlap: float = 0.2
+    conf_threshold: float = 0.3
+    block_size: int = 4096                # pixels per read block; peak memory scales with this
+    skip_empty_slices: bool = True        # don't infer on all-zero / fully transparent slices
+    batch_size: int = 16                  # slices per model call
+    class_thresholds: Optional[Dict[str, float]] = None  # per-class cutoffs from Calibrate.py
+    tta: bool = False                     # flip-TTA on uncertain slices only
+    tta_band: Tuple[float, float] = (0.2, 0.6)  # slice max score range that counts as uncertain
+    tta_iou: float = 0.55                 # IoU to pair a box with its flipped counterpart
+    epoch_cache: Optional[str] = None     # SQLite file; re-infer only grid cells that changed since last run
+    cell_size: float = 50.0               # change-detection grid cell, in map units
+    change_threshold: float = 0.35        # fingerprint distance above which a cell counts as changed
+    image_extensions: Tuple[str, ...] = ('.png', '.jpg', '.jpeg', '.tif', '.tiff')
+
+CLASS_COLORS = {
+    'StopBar': "#1AE413", 'TurnArrow': "#D9FF00", 'CrossWalk': "#00FFFF",
+    'Diamond': "#FF4800", 'CycleLane': "#1100FF", 'Cross': "#F700FF", 'default': '#FFFFFF'
+}
+
+# --------------------------- GEO HELPERS ---------------------------
+
+def get_crs_and_transform(img_path: str, epsg: int = 26918) -> Tuple[Affine, CRS]:
+    """Get transform from the raster; the CRS is forced to the configured EPSG."""
+    with rasterio.open(img_path) as src:
+        return src.transform, CRS.from_epsg(epsg)
+
+def pixel_to_coords(transform: Affine, x: float, y: float) -> Tuple[float, float]:
+    """Convert pixel coordinates to geographic coordinates."""
+    return transform * (x, y)
+
+def load_buffer_geojson(path: str, target_crs: CRS) -> gpd.GeoDataFrame:
+    """Load and reproject buffer geometry."""
+    gdf = gpd.read_file(path)
+    if gdf.crs is None:
+        print("Buffer GeoJSON missing CRS, setting to EPSG:4326")
+        gdf = gdf.set_crs("EPSG:4326")
+    return gdf.to_crs(target_crs)
+
+class RoadBuffer:
+    """Road buffer dissolved and prepared once, tested against all detections in one vectorized call."""
+
+    def __init__(self, buffer_gdf: gpd.GeoDataFrame):
+        self.crs = buffer_gdf.crs
+        self.geometry = shapely.union_all(buffer_gdf.geometry.values)
+        shapely.prepare(self.geometry)
+
+    @classmethod
+    def from_file(cls, path: str, target_crs: CRS) -> 'RoadBuffer':
+        return cls(load_buffer_geojson(path, target_crs))
+
+    def contains(self, xs: np.ndarray, ys: np.ndarray) -> np.ndarray:
+        return shapely.contains_xy(self.geometry, xs, ys)
+
+def georeference(detections: List[dict], transform: Affine) -> Tuple[np.ndarray, np.ndarray]:
+    """Attach abs_coords to each detection and return the coordinate arrays."""
+    if not detections:
+        return np.empty(0), np.empty(0)
+    px = np.array([det['position']['x'] for det in detections])
+    py = np.array([det['position']['y'] for det in detections])
+    xs, ys = transform * (px, py)
+    for det, x, y in zip(detections, xs, ys):
+        det['abs_coords'] = (float(x), float(y))
+    return xs, ys
+
+def filter_detections_within_buffer(detections: List[dict], transform: Affine, road_buffer: RoadBuffer) -> List[dict]:
+    """Filter detections to only those within the road buffer."""
+    xs, ys = georeference(detections, transform)
+    if not detections:
+        return []
+    inside = road_buffer.contains(xs, ys)
+    return [det for det, keep in zip(detections, inside) if keep]
+
+# --------------------------- RASTER HELPERS ---------------------------
+
+def load_image(image_path: str) -> Image.Image:
+    """Decode the whole raster as RGB (small images and rendering only)."""
+    with Image.open(image_path) as img:
+        return img.convert("RGB")
+
+def load_preview(image_path: str, max_size: int) -> Tuple[Image.Image, float]:
+    """Decimated read of the raster for rendering (from COG overviews when ingested); returns (image, scale)."""
+    return open_raster(image_path).read_preview(max_size)
+
+def scale_detections(detections: List[dict], scale: float) -> List[dict]:
+    """Copy detections with positions scaled into preview pixel space."""
+    return [{**det, 'position': {'x': det['position']['x'] * scale, 'y': det['position']['y'] * scale}}
+            for det in detections]
+
+def list_images(inputs: List[str], extensions: Tuple[str, ...]) -> List[str]:
+    """Expand files and folders into a sorted list of image paths."""
+    paths = []
+    for entry in inputs:
+        if os.path.isdir(entry):
+            paths.extend(os.path.join(entry, f) for f in sorted(os.listdir(entry))
+                         if f.lower().endswith(extensions))
+        else:
+            paths.append(entry)
+    return paths
+
+# --------------------------- INFERENCE ---------------------------
+
+def load_class_thresholds(path: str) -> Dict[str, float]:
+    """Read the per-class thresholds JSON written by Calibrate.py."""
+    with open(path, 'r', encoding='utf-8') as f:
+        return {cls: float(v) for cls, v in json.load(f)['thresholds'].items()}
+
+def box_iou(box: np.ndarray, boxes: np.ndarray) -> np.ndarray:
+    """IoU of one xyxy box against an (N, 4) array."""
+    ix = np.clip(np.minimum(box[2], boxes[:, 2]) - np.maximum(box[0], boxes[:, 0]), 0, None)
+    iy = np.clip(np.minimum(box[3], boxes[:, 3]) - np.maximum(box[1], boxes[:, 1]), 0, None)
+    inter = ix * iy
+    area = (box[2] - box[0]) * (box[3] - box[1])
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    return inter / np.maximum(area + areas - inter, 1e-9)
+
+def fuse_flip_tta(original: np.ndarray, flipped: np.ndarray, iou_threshold: float) -> np.ndarray:
+    """
+    Fuse (N, 6) [x1, y1, x2, y2, score, cls] rows from the original and un-flipped views.
+    Paired boxes are averaged; a box seen in only one view keeps half its score,
+    so TTA rewards agreement instead of just adding boxes.
+    """
+    fused = []
+    used = np.zeros(len(flipped), dtype=bool)
+    for row in original[np.argsort(-original[:, 4])]:
+        candidates = np.where(~used & (flipped[:, 5] == row[5]))[0]
+        if len(candidates):
+            ious = box_iou(row[:4], flipped[candidates, :4])
+            best = int(np.argmax(ious))
+            if ious[best] >= iou_threshold:
+                match = candidates[best]
+                used[match] = True
+                fused.append(np.append((row[:5] + flipped[match, :5]) / 2, row[5]))
+                continue
+        fused.append(np.append(row[:4], [row[4] / 2, row[5]]))
+    for row in flipped[~used]:
+        fused.append(np.append(row[:4], [row[4] / 2, row[5]]))
+    return np.array(fused).reshape(-1, 6)
+
+def plan_blocks(width: int, height: int, config: DetectionConfig, offset: Tuple[int, int] = (0, 0)) -> dict:
+    """
+    Group the same slice grid SAHI would use on the full image into read blocks.
+    Each block is read once with a halo wide enough to cover its edge slices, so
+    detections match the whole-image run while only one block is held in memory.
+    offset shifts the grid, for a width x height window starting at that (col, row).
+    """
+    slices = get_slice_bboxes(
+        image_height=height, image_width=width,
+        slice_height=config.slice_size, slice_width=config.slice_size,
+        overlap_height_ratio=config.slice_overlap, overlap_width_ratio=config.slice_overlap,
+    )
+    dx, dy = offset
+    blocks = {}
+    for x0, y0, x1, y1 in slices:
+        blocks.setdefault((y0 // config.block_size, x0 // config.block_size), []).append([x0 + dx, y0 + dy, x1 + dx, y1 + dy])
+    return blocks
+
+def clip_window(window: Tuple[int, int, int, int], width: int, height: int) -> Tuple[int, int, int, int]:
+    """Clip a (col_off, row_off, width, height) pixel window to the raster."""
+    col, row, w, h = (int(v) for v in window)
+    col, row = max(0, col), max(0, row)
+    w, h = min(w, width - col), min(h, height - row)
+    if w <= 0 or h <= 0:
+        raise ValueError(f"Window {window} is outside the {width}x{height} raster")
+    return col, row, w, h
+
+def to_detections(object_predictions: list) -> List[dict]:
+    """Convert SAHI object predictions to our detection dicts."""
+    detections = []
+    for obj in object_predictions:
+        bbox = obj.bbox.to_voc_bbox()  # [xmin, ymin, xmax, ymax]
+        detections.append({
+            'bbox': bbox,
+            'score': obj.score.value,
+            'category_id': obj.category.id,
+            'category_name': obj.category.name,
+            'position': {'x': (bbox[0] + bbox[2]) / 2, 'y': (bbox[1] + bbox[3]) / 2},
+        })
+    return detections
+
+class DetectionEngine:
+    """Loads the model and road buffer once and runs the windowed inference path."""
+
+    def __init__(self, config: DetectionConfig):
+        self.config = config
+        self.crs = CRS.from_epsg(config.crs_epsg)
+        self.model = UltralyticsDetectionModel(
+            model_path=config.model_path,
+            confidence_threshold=config.conf_threshold
+        )
+        print(f"Model loaded with confidence threshold: {config.conf_threshold}")
+        if config.class_thresholds:
+            print(f"Per-class thresholds: {config.class_thresholds}")
+        self.road_buffer = None
+        if config.buffer_geojson:
+            self.road_buffer = RoadBuffer.from_file(config.buffer_geojson, self.crs)
+            print(f"Road buffer loaded ({self.road_buffer.crs})")
+        # Same merge settings as get_sliced_prediction's defaults
+        self.postprocess = GreedyNMMPostprocess(match_threshold=0.5, match_metric="IOS", class_agnostic=False)
+
+        # With per-class thresholds the model runs at the lowest one and classes are cut after merging
+        self.class_thresholds = config.class_thresholds or {}
+        self.score_floor = min([config.conf_threshold, *self.class_thresholds.values()])
+        self.category_names = {int(k): v for k, v in self.model.category_mapping.items()}
+        self.tta_slices = 0
+
+        self.epoch_cache = None
+        if config.epoch_cache:
+            self.epoch_cache = EpochCache(config.epoch_cache, config.cell_size, config.crs_epsg,
+                                          config.change_threshold, self.epoch_config_hash())
+
+    def epoch_config_hash(self) -> str:
+        """Everything that shapes a cell's stored detections; a change invalidates the cached epoch."""
+        c = self.config
+        settings = {
+            'model_path': c.model_path, 'buffer_geojson': c.buffer_geojson, 'crs_epsg': c.crs_epsg,
+            'slice_size': c.slice_size, 'slice_overlap': c.slice_overlap, 'conf_threshold': c.conf_threshold,
+            'class_thresholds': c.class_thresholds or {}, 'tta': c.tta,
+            'tta_band': list(c.tta_band) if c.tta else None, 'tta_iou': c.tta_iou if c.tta else None,
+        }
+        return EpochCache.hash_settings(settings, [c.model_path, c.buffer_geojson])
+
+    def infer_batch(self, tiles: List[np.ndarray]) -> List[np.ndarray]:
+        """One batched model call; returns (N, 6) [x1, y1, x2, y2, score, cls] per RGB tile."""
+        # Ultralytics reads numpy input as BGR, same as SAHI's perform_inference
+        kwargs = {'conf': self.score_floor, 'verbose': False, 'device': self.model.device}
+        if self.model.image_size is not None:
+            kwargs['imgsz'] = self.model.image_size
+        results = self.model.model([np.ascontiguousarray(t[:, :, ::-1]) for t in tiles], **kwargs)
+        return [np.hstack([r.boxes.xyxy.cpu().numpy(), r.boxes.conf.cpu().numpy()[:, None],
+                           r.boxes.cls.cpu().numpy()[:, None]]) for r in results]
+
+    def predict_tiles(self, tiles: List[np.ndarray]) -> List[np.ndarray]:
+        """Infer a batch of slices, re-running only the uncertain ones horizontally flipped."""
+        outputs = self.infer_batch(tiles)
+        if not self.config.tta:
+            return outputs
+
+        low, high = self.config.tta_band
+        uncertain = [i for i, out in enumerate(outputs)
+                     if len(out) and low <= out[:, 4].max() < high]
+        if uncertain:
+            flipped = self.infer_batch([tiles[i][:, ::-1] for i in uncertain])
+            for i, rows in zip(uncertain, flipped):
+                width = tiles[i].shape[1]
+                rows[:, [0, 2]] = width - rows[:, [2, 0]]
+                outputs[i] = fuse_flip_tta(outputs[i], rows, self.config.tta_iou)
+            self.tta_slices += len(uncertain)
+        return outputs
+
+    def to_object_predictions(self, rows: np.ndarray, shift: List[int], full_shape: List[int]) -> list:
+        """Wrap tile rows as SAHI predictions in full-image coordinates."""
+        predictions = []
+        for x1, y1, x2, y2, score, cls in rows:
+            if score < self.score_floor:
+                continue
+            predictions.append(ObjectPrediction(
+                bbox=[float(x1), float(y1), float(x2), float(y2)],
+                category_id=int(cls),
+                category_name=self.category_names.get(int(cls), str(int(cls))),
+                score=float(score),
+                shift_amount=shift,
+                full_shape=full_shape,
+            ).get_shifted_object_prediction())
+        return predictions
+
+    def apply_class_thresholds(self, detections: List[dict]) -> List[dict]:
+        """Drop detections below their class threshold (global threshold for uncalibrated classes)."""
+        return [det for det in detections
+                if det['score'] >= self.class_thresholds.get(det['category_name'], self.config.conf_threshold)]
+
+    def predict(self, image_path: str, keep_slice: Optional[Callable] = None,
+                window: Optional[Tuple[int, int, int, int]] = None,
+                predict_tiles: Optional[Callable] = None) -> List[dict]:
+        """
+        Run sliced prediction block by block; returns detections in pixel coordinates.
+        keep_slice(bbox) can restrict inference to part of the raster; window (col_off, row_off,
+        width, height) slices only that part. predict_tiles replaces the model call (the
+        detection server passes one that batches slices across requests).
+        """
+        predict_tiles = predict_tiles or self.predict_tiles
+        predictions = []
+        # Blocks come through the shared imagery cache, so repeated passes (server, re-runs) skip the decode
+        raster = open_raster(image_path)
+        width, height = raster.width, raster.height
+        if window is None:
+            blocks = plan_blocks(width, height, self.config)
+        else:
+            col, row, w, h = clip_window(window, width, height)
+            blocks = plan_blocks(w, h, self.config, offset=(col, row))
+
+        for block_idx, slices in enumerate(blocks.values(), start=1):
+            tiles, shifts = [], []
+            if keep_slice is not None:
+                slices = [b for b in slices if keep_slice(b)]
+                if not slices:
+                    continue
+            xmin = min(b[0] for b in slices)
+            ymin = min(b[1] for b in slices)
+            xmax = max(b[2] for b in slices)
+            ymax = max(b[3] for b in slices)
+            window = Window.from_slices((ymin, ymax), (xmin, xmax))
+            block = raster.read(window)
+            alpha = raster.read_mask(window)  # alpha band or ingest nodata mask; None if the raster has neither
+
+            for sx0, sy0, sx1, sy1 in slices:
+                rows = slice(sy0 - ymin, sy1 - ymin)
+                cols = slice(sx0 - xmin, sx1 - xmin)
+                if self.config.skip_empty_slices:
+                    mask = alpha[rows, cols] if alpha is not None else block[rows, cols]
+                    if not mask.any():
+                        continue
+                tiles.append(block[rows, cols])
+                shifts.append([sx0, sy0])
+
+            for start in range(0, len(tiles), self.config.batch_size):
+                batch = slice(start, start + self.config.batch_size)
+                for rows, shift in zip(predict_tiles(tiles[batch]), shifts[batch]):
+                    predictions.extend(self.to_object_predictions(rows, shift, [height, width]))
+
+            if block_idx % 10 == 0:
+                print(f"  {block_idx}/{len(blocks)} blocks, {len(predictions)} raw predictions")
+
+        if self.config.tta:
+            print(f"  Flip-TTA ran on {self.tta_slices} uncertain slices so far")
+        return self.apply_class_thresholds(to_detections(self.postprocess(predictions)))
+
+    def georeference_and_filter(self, detections: List[dict], transform: Affine) -> List[dict]:
+        """Attach map coordinates and drop detections outside the road buffer."""
+        if self.road_buffer is None:
+            georeference(detections, transform)
+            return detections
+        kept = filter_detections_within_buffer(detections, transform, self.road_buffer)
+        print(f"  {len(kept)}/{len(detections)} detections within buffer")
+        return kept
+
+    def detect(self, image_path: str, window: Optional[Tuple[int, int, int, int]] = None,
+               predict_tiles: Optional[Callable] = None) -> Tuple[List[dict], Affine]:
+        """Predict, georeference and buffer-filter one image (or one window of it)."""
+        transform, _ = get_crs_and_transform(image_path, self.config.crs_epsg)
+        if self.epoch_cache is not None and window is None:
+            return self.detect_changed(image_path, transform), transform
+        detections = self.predict(image_path, window=window, predict_tiles=predict_tiles)
+        return self.georeference_and_filter(detections, transform), transform
+
+    def detect_changed(self, image_path: str, transform: Affine) -> List[dict]:
+        """
+        Re-infer only grid cells whose fingerprint moved since the stored epoch.
+        Unchanged cells return their stored detections; cells cut by the raster edge are always inferred.
+        """
+        cache = self.epoch_cache
+        with rasterio.open(image_path) as src:
+            cells = cache.cells_for_raster(transform, src.width, src.height)
+            prints = cache.fingerprints(src, cells)
+        stored = cache.load([cells[idx].key for idx in prints])
+
+        unchanged = set()
+        for idx, fingerprint in prints.items():
+            previous = stored.get(cells[idx].key)
+            if previous is not None and cache.distance(previous[0], fingerprint) <= cache.threshold:
+                unchanged.add(idx)
+
+        def keep_slice(box):
+            return any(idx not in unchanged for idx in cache.cells_for_pixel_box(transform, box))
+
+        detections = []
+        if len(unchanged) < len(cells):
+            detections = self.georeference_and_filter(self.predict(image_path, keep_slice), transform)
+
+        # New detections belong to the changed cells; the stored ones cover the rest
+        fresh = {}
+        for det in detections:
+            idx = cache.cell_index(*det['abs_coords'])
+            if idx not in unchanged:
+                fresh.setdefault(idx, []).append(det)
+
+        image_name = Path(image_path).name
+        for idx, fingerprint in prints.items():
+            if idx not in unchanged:
+                records = [cache.pack_detection(det, transform) for det in fresh.get(idx, [])]
+                cache.store(cells[idx].key, fingerprint, records, image_name)
+        cache.conn.commit()
+
+        carried = [cache.unpack_detection(record, transform)
+                   for idx in unchanged for record in stored[cells[idx].key][1]]
+        print(f"  Change detection: {len(cells) - len(unchanged)}/{len(cells)} cells re-inferred, "
+              f"{len(carried)} detections carried forward")
+        return [det for dets in fresh.values() for det in dets] + carried
+
+    def run(self, image_paths: List[str], sinks: list) -> List[dict]:
+        """Detect every image once and hand the results to each sink."""
+        all_detections = []
+        try:
+            for image_path in image_paths:
+                print(f"🔍 Processing: {image_path}")
+                detections, transform = self.detect(image_path)
+                for sink in sinks:
+                    sink.write(image_path, detections, transform, self.crs)
+                all_detections.extend(detections)
+        finally:
+            for sink in sinks:
+                sink.close()
+            if self.epoch_cache is not None:
+                self.epoch_cache.close()
+        return all_detections
+
+# --------------------------- SINKS ---------------------------
+
+class VectorSink:
+    """Collects detections from all images into one GeoJSON or GeoPackage (by extension)."""
+
+    def __init__(self, output_path: str):
+        self.output_path = output_path
+        self.rows = []
+        self.crs = None
+
+    def write(self, image_path, detections, transform, crs):
+        self.crs = self.crs or crs
+        for det in detections:
+            x, y = det['abs_coords']
+            self.rows.append({
+                "class": det['category_name'],
+                "confidence": round(det['score'], 4),
+                "x": x, "y": y,
+            })
+
+    def close(self):
+        if self.crs is None:
+            return
+        xs = [row.pop("x") for row in self.rows]
+        ys = [row.pop("y") for row in self.rows]
+        gdf = gpd.GeoDataFrame(self.rows, geometry=gpd.points_from_xy(xs, ys), crs=self.crs)
+        driver = "GPKG" if self.output_path.lower().endswith(".gpkg") else "GeoJSON"
+        gdf.to_file(self.output_path, driver=driver)
+        print(f"\n✅ Saved {driver} with {len(gdf)} detections:\n{self.output_path}")
+
+class CSVSink:
+    """Streams one row per detection as images finish."""
+
+    FIELDS = ['image', 'class', 'confidence', 'pixel_x', 'pixel_y', 'x', 'y']
+
+    def __init__(self, output_path: str):
+        self.output_path = output_path
+        self.file = open(output_path, 'w', newline='', encoding='utf-8')
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(self.FIELDS)
+        self.count = 0
+
+    def write(self, image_path, detections, transform, crs):
+        name = Path(image_path).name
+        for det in detections:
+            x, y = det['abs_coords']
+            self.writer.writerow([name, det['category_name'], round(det['score'], 4),
+                                  round(det['position']['x'], 2), round(det['position']['y'], 2), x, y])
+        self.count += len(detections)
+
+    def close(self):
+        self.file.close()
+        print(f"✅ Saved CSV with {self.count} detections: {self.output_path}")
+
+class OverlaySink:
+    """Per-image PNG figures (points and detailed) plus optional overview and tile pyramid."""
+
+    def __init__(self, output_dir: str, point_size: int = 6, figure_dpi: int = 300, max_labels: int = 500,
+                 write_overview: bool = True, overview_max_size: int = 4096,
+                 write_tiles: bool = False, tile_size: int = 256):
+        self.output_dir = output_dir
+        self.point_size = point_size
+        self.figure_dpi = figure_dpi
+        self.max_labels = max_labels
+        self.write_overview = write_overview
+        self.overview_max_size = overview_max_size
+        self.write_tiles = write_tiles
+        self.tile_size = tile_size
+        self.outputs = []
+
+    def write(self, image_path, detections, transform, crs):
+        # Figures and the overview only need a preview; large rasters are read decimated
+        full_detections = detections
+        image, scale = load_preview(image_path, self.overview_max_size)
+        if scale != 1.0:
+            detections = scale_detections(detections, scale)
+        stem = Path(image_path).stem
+        image_name = Path(image_path).name
+        image_array = np.asarray(image)
+
+        points_path = os.path.join(self.output_dir, f"{stem}_points.png")
+        detailed_path = os.path.join(self.output_dir, f"{stem}_detailed.png")
+        self.create_visualization(detections, image_array, image_name, points_path, detailed=False)
+        self.create_visualization(detections, image_array, image_name, detailed_path, detailed=True)
+        self.outputs += [points_path, detailed_path]
+
+        if self.write_overview:
+            overview_path = os.path.join(self.output_dir, f"{stem}_overview.png")
+            self.save_overview(self.render_overlay(image, detections), overview_path)
+            self.outputs.append(overview_path)
+        if self.write_tiles:
+            # Tiles are rendered from the full-resolution raster, whatever the preview scale
+            tiles_dir = os.path.join(self.output_dir, f"{stem}_tiles")
+            tile_count = self.save_tile_pyramid(image_path, full_detections, tiles_dir)
+            self.outputs.append(f"{tiles_dir} ({tile_count} tiles)")
+
+    def close(self):
+        for output in self.outputs:
+            print(f"🖼️  {output}")
+
+    @staticmethod
+    def group_by_class(detections: list) -> dict:
+        """Group detections into per-class (N, 3) arrays of x, y, confidence."""
+        grouped = {}
+        for det in detections:
+            grouped.setdefault(det['category_name'], []).append(
+                (det['position']['x'], det['position']['y'], det['score']))
+        return {cls: np.asarray(points, dtype=np.float32) for cls, points in grouped.items()}
+
+    def create_visualization(self, detections: list, image: np.ndarray, image_name: str,
+                             output_path: str, detailed: bool = False) -> None:
+        """Create matplotlib visualization with one point collection per class."""
+        grouped = self.group_by_class(detections)
+
+        # Create plot
+        fig, ax = plt.subplots(figsize=(20, 16) if detailed else (16, 12))
+        ax.imshow(image)
+        ax.set_xlim(0, image.shape[1])
+        ax.set_ylim(image.shape[0], 0)
+
+        # Plot detections
+        radius = self.point_size + (2 if detailed else 0)
+        label_budget = self.max_labels if detailed else 0
+        legend_elements = []
+        for cls, points in grouped.items():
+            color = CLASS_COLORS.get(cls, CLASS_COLORS['default'])
+            alpha = np.full(len(points), 0.8) if detailed else np.maximum(0.7, points[:, 2])
+
+            # EllipseCollection keeps the radius in pixel (data) units like the old Circle patches
+            diameters = np.full(len(points), radius * 2.0)
+            ax.add_collection(EllipseCollection(
+                diameters, diameters, np.zeros(len(points)), units='xy',
+                offsets=points[:, :2], offset_transform=ax.transData,
+                facecolors=to_rgba_array(color, alpha), edgecolors='white',
+                linewidths=3 if detailed else 2, zorder=10))
+
+            for x, y, conf in points[:label_budget]:
+                ax.text(x + radius + 5, y - radius - 5, f"{conf:.2f}", fontsize=8, color='white',
+                        bbox=dict(boxstyle="round,pad=0.2", facecolor=color, alpha=0.7), zorder=11)
+            label_budget = max(0, label_budget - len(points))
+
+            legend_elements.append(Patch(color=color, label=f"{cls} ({len(points)})"))
+
+        # Styling
+        title = f"{'Detailed ' if detailed else ''}Detection Results"
+        if detailed:
+            title += " with Confidence Values"
+            if len(detections) > self.max_labels:
+                title += f" (first {self.max_labels} labelled)"
+        title += f"\n{image_name} - Total: {len(detections)}"
+
+        ax.set_title(title, fontsize=18 if detailed else 16, fontweight='bold', pad=20)
+        ax.legend(handles=legend_elements, loc='upper right', bbox_to_anchor=(0.98, 0.98),
+                  fontsize=12, framealpha=0.9, fancybox=True, shadow=True)
+
+        if not detailed:
+            ax.text(0.02, 0.02, "Point Opacity = Confidence Level", transform=ax.transAxes,
+                    fontsize=10, bbox=dict(boxstyle="round,pad=0.3", facecolor='white', alpha=0.8))
+
+        ax.set_xticks([])
+        ax.set_yticks([])
+
+        plt.savefig(output_path, dpi=self.figure_dpi, bbox_inches='tight', facecolor='white')
+        plt.close(fig)
+
+    def render_overlay(self, image: Image.Image, detections: list) -> Image.Image:
+        """Rasterize detections straight onto the image at its resolution (no figure, no dpi scaling)."""
+        layer = Image.new("RGBA", image.size, (0, 0, 0, 0))
+        draw = ImageDraw.Draw(layer)
+        r = self.point_size
+        for cls, points in self.group_by_class(detections).items():
+            red, green, blue = (int(c * 255) for c in to_rgb(CLASS_COLORS.get(cls, CLASS_COLORS['default'])))
+            for x, y, conf in points:
+                fill = (red, green, blue, int(255 * max(0.7, float(conf))))
+                draw.ellipse((x - r, y - r, x + r, y + r), fill=fill, outline=(255, 255, 255, 255), width=2)
+        return Image.alpha_composite(image.convert("RGBA"), layer).convert("RGB")
+
+    def save_overview(self, overlay: Image.Image, output_path: str) -> None:
+        """Save a downsampled overview so whole-image QA stays cheap on large rasters."""
+        overview = overlay.copy()
+        overview.thumbnail((self.overview_max_size, self.overview_max_size), Image.Resampling.LANCZOS)
+        overview.save(output_path)
+
+    def save_tile_pyramid(self, image_path: str, detections: list, output_dir: str) -> int:
+        """
+        Write {zoom}/{col}_{row}.png tiles, halving resolution until one tile covers the image.
+        The full-resolution level is rendered tile by tile from windowed reads; each coarser tile
+        is built from its four children, so memory stays at a few tiles for any raster size.
+        """
+        tile_size = self.tile_size
+        raster = open_raster(image_path)
+        sizes = [(raster.width, raster.height)]
+        while max(sizes[-1]) > tile_size:
+            w, h = sizes[-1]
+            sizes.append((max(1, w // 2), max(1, h // 2)))
+        max_zoom = len(sizes) - 1
+
+        # Bucket detections by every full-resolution tile their marker touches
+        reach = self.point_size + 2
+        by_tile = {}
+        for det in detections:
+            x, y = det['position']['x'], det['position']['y']
+            for row in range(int((y - reach) // tile_size), int((y + reach) // tile_size) + 1):
+                for col in range(int((x - reach) // tile_size), int((x + reach) // tile_size) + 1):
+                    by_tile.setdefault((col, row), []).append(det)
+
+        def tile_path(zoom, col, row):
+            return os.path.join(output_dir, str(zoom), f"{col}_{row}.png")
+
+        tile_count = 0
+        for level, (w, h) in enumerate(sizes):
+            zoom = max_zoom - level
+            os.makedirs(os.path.join(output_dir, str(zoom)), exist_ok=True)
+            for top in range(0, h, tile_size):
+                for left in range(0, w, tile_size):
+                    col, row = left // tile_size, top // tile_size
+                    tw, th = min(tile_size, w - left), min(tile_size, h - top)
+                    if level == 0:
+                        tile = Image.fromarray(raster.read(Window(left, top, tw, th)))
+                        shifted = [{**det, 'position': {'x': det['position']['x'] - left,
+                                                        'y': det['position']['y'] - top}}
+                                   for det in by_tile.get((col, row), [])]
+                        if shifted:
+                            tile = self.render_overlay(tile, shifted)
+                    else:
+                        pw, ph = sizes[level - 1]
+                        cw, ch = min(2 * tile_size, pw - 2 * left), min(2 * tile_size, ph - 2 * top)
+                        canvas = Image.new("RGB", (cw, ch))
+                        for dy in (0, 1):
+                            for dx in (0, 1):
+                                if dx * tile_size < cw and dy * tile_size < ch:
+                                    with Image.open(tile_path(zoom + 1, 2 * col + dx, 2 * row + dy)) as child:
+                                        canvas.paste(child, (dx * tile_size, dy * tile_size))
+                        tile = canvas.resize((tw, th), Image.Resampling.BOX)
+                    tile.save(tile_path(zoom, col, row))
+                    tile_count += 1
+        return tile_count
+
+def build_sinks(kinds: List[str], output_dir: str, **overlay_options) -> list:
+    """Create sinks by name: geojson, gpkg, csv, png."""
+    os.makedirs(output_dir, exist_ok=True)
+    sinks = []
+    for kind in kinds:
+        if kind == 'geojson':
+            sinks.append(VectorSink(os.path.join(output_dir, "detections_output.geojson")))
+        elif kind == 'gpkg':
+            sinks.append(VectorSink(os.path.join(output_dir, "detections_output.gpkg")))
+        elif kind == 'csv':
+            sinks.append(CSVSink(os.path.join(output_dir, "detections_output.csv")))
+        elif kind == 'png':
+            sinks.append(OverlaySink(output_dir, **overlay_options))
+        else:
+            raise ValueError(f"Unknown sink: {kind}")
+    return sinks
+
+def print_summary(detections: List[dict]) -> None:
+    """Per-class counts and confidence range."""
+    class_counts = {}
+    for det in detections:
+        class_counts[det['category_name']] = class_counts.get(det['category_name'], 0) + 1
+
+    print("\n" + "="*50)
+    print("DETECTION SUMMARY")
+    print("="*50)
+    for cls, count in sorted(class_counts.items()):
+        color = CLASS_COLORS.get(cls, CLASS_COLORS['default'])
+        print(f"{cls:12s} ({color}): {count:3d} detections")
+
+    confidences = [det['score'] for det in detections]
+    if confidences:
+        print(f"\nTotal: {len(detections)} | Confidence - "
+              f"Mean: {np.mean(confidences):.3f}, Min: {np.min(confidences):.3f}, "
+              f"Max: {np.max(confidences):.3f}")
+
+# --------------------------- CLI ---------------------------
+
+def main(argv=None):
+    """Entry point."""
+    defaults = DetectionConfig()
+    parser = argparse.ArgumentParser(description="Detect road markings and export them to one or more sinks.")
+    parser.add_argument('inputs', nargs='+', help='Image files and/or folders of images')
+    parser.add_argument('--model', required=True, help='Path to YOLO weights (best.pt)')
+    parser.add_argument('--buffer', help='Road buffer GeoJSON; detections outside it are dropped')
+    parser.add_argument('--output-dir', default='DetectionOutputs', help='Output folder')
+    parser.add_argument('--sink', action='append', choices=['geojson', 'gpkg', 'csv', 'png'],
+                        help='Output format, repeatable (default: geojson)')
+    parser.add_argument('--conf', type=float, default=defaults.conf_threshold, help='Confidence threshold')
+    parser.add_argument('--thresholds', help='Per-class thresholds JSON from Calibrate.py')
+    parser.add_argument('--tta', action='store_true', help='Flip-TTA on slices whose max score is uncertain')
+    parser.add_argument('--tta-band', type=float, nargs=2, default=defaults.tta_band, metavar=('LOW', 'HIGH'),
+                        help='Max-score band that triggers TTA')
+    parser.add_argument('--epoch-cache', help='SQLite change cache; only cells that changed are re-inferred')
+    parser.add_argument('--cell-size', type=float, default=defaults.cell_size, help='Change grid cell size (map units)')
+    parser.add_argument('--change-threshold', type=float, default=defaults.change_threshold,
+                        help='Fingerprint distance that marks a cell as changed')
+    parser.add_argument('--batch', type=int, default=defaults.batch_size, help='Slices per model call')
+    parser.add_argument('--slice-size', type=int, default=defaults.slice_size, help='SAHI slice size')
+    parser.add_argument('--overlap', type=float, default=defaults.slice_overlap, help='SAHI slice overlap ratio')
+    parser.add_argument('--block-size', type=int, default=defaults.block_size, help='Raster read block size')
+    parser.add_argument('--epsg', type=int, default=defaults.crs_epsg, help='CRS of the imagery')
+    parser.add_argument('--tiles', action='store_true', help='Also write a tile pyramid for png output')
+    args = parser.parse_args(argv)
+
+    config = DetectionConfig(
+        model_path=args.model,
+        buffer_geojson=args.buffer,
+        crs_epsg=args.epsg,
+        slice_size=args.slice_size,
+        slice_overlap=args.overlap,
+        conf_threshold=args.conf,
+        block_size=args.block_size,
+        batch_size=args.batch,
+        class_thresholds=load_class_thresholds(args.thresholds) if args.thresholds else None,
+        tta=args.tta,
+        tta_band=tuple(args.tta_band),
+        epoch_cache=args.epoch_cache,
+        cell_size=args.cell_size,
+        change_threshold=args.change_threshold,
+    )
+    image_paths = list_images(args.inputs, config.image_extensions)
+    if not image_paths:
+        parser.error("No images found")
+
+    engine = DetectionEngine(config)
+    sinks = build_sinks(args.sink or ['geojson'], args.output_dir, write_tiles=args.tiles)
+    detections = engine.run(image_paths, sinks)
+    print_summary(detections)
+    print(f"\nDone: {len(detections)} detections from {len(image_paths)} image(s)")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,185 @@
+"""
+Imagery Epoch Cache
+Per map-grid cell fingerprints and detections from the last imagery epoch, kept in SQLite.
+
+On a refresh only cells whose fingerprint moved beyond the threshold are re-inferred;
+every other cell carries its stored detections forward. Cells are keyed by map
+coordinates (EPSG + grid column/row), not by file name, so re-tiled or re-named
+imagery still lines up with the previous epoch.
+
+Each row also records the hash of the settings that produced its detections (weights,
+thresholds, TTA, road buffer). A cell stored under a different hash counts as changed, so
+swapping the model or re-calibrating never carries stale detections forward.
+"""
+import hashlib
+import json
+import math
+import os
+import sqlite3
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from rasterio.enums import Resampling
+from rasterio.transform import Affine
+
+FINGERPRINT_SIZE = 16  # fingerprint is a FINGERPRINT_SIZE² grayscale thumbnail per cell
+
+@dataclass
+class Cell:
+    key: str
+    col: int
+    row: int
+    pixel_bounds: Tuple[float, float, float, float]  # xmin, ymin, xmax, ymax in raster pixels
+    complete: bool                                   # cell lies fully inside this raster
+
+class EpochCache:
+    """SQLite store of cell fingerprints and the detections inferred for them."""
+
+    def __init__(self, path: str, cell_size: float, epsg: int, threshold: float, config_hash: str = ''):
+        self.cell_size = cell_size
+        self.epsg = epsg
+        self.threshold = threshold
+        self.config_hash = config_hash
+        self.conn = sqlite3.connect(path)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS cells ("
+            " key TEXT PRIMARY KEY, fingerprint BLOB, detections TEXT, image TEXT, updated TEXT, config_hash TEXT)"
+        )
+        # Caches written before the hash column existed: their rows never match and get re-inferred
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(cells)")}
+        if 'config_hash' not in columns:
+            self.conn.execute("ALTER TABLE cells ADD COLUMN config_hash TEXT")
+
+    def close(self):
+        self.conn.commit()
+        self.conn.close()
+
+    # ---------------- grid ----------------
+
+    def cell_key(self, col: int, row: int) -> str:
+        return f"{self.epsg}:{self.cell_size:g}:{col}:{row}"
+
+    def cell_index(self, x: float, y: float) -> Tuple[int, int]:
+        return math.floor(x / self.cell_size), math.floor(y / self.cell_size)
+
+    def cells_for_raster(self, transform: Affine, width: int, height: int) -> Dict[Tuple[int, int], Cell]:
+        """All grid cells touching a north-up raster, with their pixel bounds."""
+        left, top = transform * (0, 0)
+        right, bottom = transform * (width, height)
+        col0, row0 = self.cell_index(min(left, right), min(top, bottom))
+        col1, row1 = self.cell_index(max(left, right) - 1e-9, max(top, bottom) - 1e-9)
+
+        inv = ~transform
+        cells = {}
+        for row in range(row0, row1 + 1):
+            for col in range(col0, col1 + 1):
+                x0, x1 = col * self.cell_size, (col + 1) * self.cell_size
+                y0, y1 = row * self.cell_size, (row + 1) * self.cell_size
+                (px0, py0), (px1, py1) = inv * (x0, y1), inv * (x1, y0)
+                bounds = (min(px0, px1), min(py0, py1), max(px0, px1), max(py0, py1))
+                complete = bounds[0] >= 0 and bounds[1] >= 0 and bounds[2] <= width and bounds[3] <= height
+                cells[(col, row)] = Cell(self.cell_key(col, row), col, row, bounds, complete)
+        return cells
+
+    def cells_for_pixel_box(self, transform: Affine, box: Tuple[int, int, int, int]) -> List[Tuple[int, int]]:
+        """Grid cells overlapped by a pixel-space box (e.g. an inference slice)."""
+        (x0, y0), (x1, y1) = transform * (box[0], box[1]), transform * (box[2], box[3])
+        col0, row0 = self.cell_index(min(x0, x1), min(y0, y1))
+        col1, row1 = self.cell_index(max(x0, x1) - 1e-9, max(y0, y1) - 1e-9)
+        return [(c, r) for r in range(row0, row1 + 1) for c in range(col0, col1 + 1)]
+
+    # ---------------- fingerprints ----------------
+
+    def fingerprints(self, src, cells: Dict[Tuple[int, int], Cell]) -> Dict[Tuple[int, int], np.ndarray]:
+        """One decimated read of the raster, cut into a small grayscale thumbnail per complete cell."""
+        cell_px = self.cell_size / abs(src.transform.a)
+        scale = min(1.0, FINGERPRINT_SIZE / cell_px)
+        out_shape = (max(1, math.ceil(src.height * scale)), max(1, math.ceil(src.width * scale)))
+        bands = [1, 2, 3] if src.count >= 3 else [1]
+        gray = src.read(bands, out_shape=out_shape, resampling=Resampling.average).astype(np.float32).mean(axis=0)
+
+        prints = {}
+        for idx, cell in cells.items():
+            if not cell.complete:
+                continue
+            xmin, ymin, xmax, ymax = (v * scale for v in cell.pixel_bounds)
+            rows = np.clip(np.linspace(ymin, ymax, FINGERPRINT_SIZE, endpoint=False).astype(int), 0, out_shape[0] - 1)
+            cols = np.clip(np.linspace(xmin, xmax, FINGERPRINT_SIZE, endpoint=False).astype(int), 0, out_shape[1] - 1)
+            prints[idx] = gray[np.ix_(rows, cols)].astype(np.uint8)
+        return prints
+
+    @staticmethod
+    def distance(a: np.ndarray, b: np.ndarray) -> float:
+        """Mean absolute difference of contrast-normalized thumbnails (robust to epoch-wide radiometry shifts)."""
+        def normalize(t):
+            t = t.astype(np.float32)
+            return (t - t.mean()) / max(float(t.std()), 8.0)
+        return float(np.abs(normalize(a) - normalize(b)).mean())
+
+    # ---------------- storage ----------------
+
+    @staticmethod
+    def hash_settings(settings: dict, files: List[Optional[str]]) -> str:
+        """Stable hash of detection settings plus the size/mtime of the files they point at."""
+        stamps = {}
+        for path in files:
+            if path and os.path.exists(path):
+                st = os.stat(path)
+                stamps[os.path.abspath(path)] = [st.st_size, st.st_mtime_ns]
+        payload = json.dumps({'settings': settings, 'files': stamps}, sort_keys=True, default=str)
+        return hashlib.sha1(payload.encode()).hexdigest()
+
+    def load(self, keys: List[str]) -> Dict[str, Tuple[np.ndarray, list]]:
+        """Stored cells produced under the current config hash; anything else reads as missing."""
+        stored = {}
+        for start in range(0, len(keys), 500):
+            chunk = keys[start:start + 500]
+            rows = self.conn.execute(
+                f"SELECT key, fingerprint, detections FROM cells"
+                f" WHERE config_hash = ? AND key IN ({','.join('?' * len(chunk))})", [self.config_hash, *chunk])
+            for key, blob, detections in rows:
+                fingerprint = np.frombuffer(blob, dtype=np.uint8).reshape(FINGERPRINT_SIZE, FINGERPRINT_SIZE)
+                stored[key] = (fingerprint, json.loads(detections))
+        return stored
+
+    def store(self, key: str, fingerprint: np.ndarray, detections: list, image_name: str):
+        self.conn.execute(
+            "INSERT OR REPLACE INTO cells (key, fingerprint, detections, image, updated, config_hash)"
+            " VALUES (?, ?, ?, ?, ?, ?)",
+            (key, fingerprint.tobytes(), json.dumps(detections), image_name, datetime.now().isoformat(),
+             self.config_hash))
+
+    # ---------------- detections ----------------
+
+    @staticmethod
+    def pack_detection(det: dict, transform: Affine) -> dict:
+        """Detection → map-coordinate record (pixel positions don't survive re-tiled imagery)."""
+        x1, y1 = transform * (det['bbox'][0], det['bbox'][1])
+        x2, y2 = transform * (det['bbox'][2], det['bbox'][3])
+        return {
+            'category_id': det['category_id'],
+            'category_name': det['category_name'],
+            'score': det['score'],
+            'abs_coords': list(det['abs_coords']),
+            'bbox_map': [x1, y1, x2, y2],
+        }
+
+    @staticmethod
+    def unpack_detection(record: dict, transform: Affine) -> dict:
+        """Stored record → detection dict in the current raster's pixel space."""
+        inv = ~transform
+        px1, py1 = inv * tuple(record['bbox_map'][:2])
+        px2, py2 = inv * tuple(record['bbox_map'][2:])
+        x, y = record['abs_coords']
+        cx, cy = inv * (x, y)
+        return {
+            'bbox': [min(px1, px2), min(py1, py2), max(px1, px2), max(py1, py2)],
+            'score': record['score'],
+            'category_id': record['category_id'],
+            'category_name': record['category_name'],
+            'position': {'x': cx, 'y': cy},
+            'abs_coords': (x, y),
+            'carried_forward': True,
+        }
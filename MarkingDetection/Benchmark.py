@@ -0,0 +1,433 @@
+"""
+Pipeline Benchmark
+Generates a synthetic georeferenced dataset (aerial-style rasters with painted road markings,
+YOLO labels and a matching road-buffer GeoJSON) at several scales and times each stage on it:
+split, patch generation, detection and buffer filtering. Every stage runs in its own process,
+so the report carries a clean peak RSS per stage. Everything is offline and CPU only.
+
+    python Benchmark.py --scales small medium --output bench_main.json
+    python Benchmark.py --scales small --output bench_branch.json --compare bench_main.json
+
+Detection uses a tiny stub detector (bright paint → one box per slice) so the engine's reading,
+slicing, batching, merging and georeferencing are measured without weights; pass --model
+(best.pt or an exported .onnx) to time a real model instead.
+"""
+import argparse
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+from queue import Empty
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+try:
+    import resource  # peak RSS (not available on Windows)
+except ImportError:
+    resource = None
+
+ROOT = Path(__file__).resolve().parent
+for stage_dir in ('0.Ingest', '1.DataPreperation', '3.Detection'):
+    sys.path.insert(0, str(ROOT / stage_dir))
+
+# --------------------------- CONFIG ---------------------------
+
+# name → (number of rasters, raster side in pixels)
+SCALES = {
+    'small': (4, 2048),
+    'medium': (4, 4096),
+    'large': (4, 8192),
+}
+CLASS_NAMES = ['StopBar', 'TurnArrow', 'CrossWalk', 'Diamond', 'CycleLane', 'Cross']
+EPSG = 26918
+PIXEL_SIZE = 0.075            # metres; 7.5 cm orthophoto
+ORIGIN = (500000.0, 4500000.0)
+ROAD_SPACING = 1024           # pixels between road centrelines (both directions)
+ROAD_WIDTH = 160              # pixels (12 m carriageway)
+MARKINGS_PER_KM = 150         # painted markings per km of road
+DISTRACTORS_PER_MP = 2        # unlabelled white roofs off the road, per megapixel
+BUFFER_POINTS = 200000        # random detections pushed through the buffer filter
+SEED = 0
+STAGE_TIMEOUT = 3600.0        # seconds before a stage process is abandoned
+
+# --------------------------- SYNTHETIC DATA ---------------------------
+
+def paint_marking(draw: ImageDraw.ImageDraw, class_id: int, cx: int, cy: int, horizontal: bool, rng) -> tuple:
+    """Paint one marking centred on (cx, cy); returns its pixel box (x1, y1, x2, y2)."""
+    white = (235, 235, 230)
+    name = CLASS_NAMES[class_id]
+    if name == 'StopBar':
+        w, h = (8, 70) if horizontal else (70, 8)
+        box = (cx - w // 2, cy - h // 2, cx + w // 2, cy + h // 2)
+        draw.rectangle(box, fill=white)
+    elif name == 'CrossWalk':
+        stripes, length = 6, 50
+        for i in range(stripes):
+            off = -stripes * 12 // 2 + i * 12
+            if horizontal:
+                draw.rectangle((cx - length // 2, cy + off, cx + length // 2, cy + off + 6), fill=white)
+            else:
+                draw.rectangle((cx + off, cy - length // 2, cx + off + 6, cy + length // 2), fill=white)
+        half_w, half_h = (length // 2, stripes * 6) if horizontal else (stripes * 6, length // 2)
+        box = (cx - half_w, cy - half_h, cx + half_w, cy + half_h)
+    elif name == 'TurnArrow':
+        shaft = [(-4, 20), (4, 20), (4, -4), (14, -4), (0, -20), (-14, -4), (-4, -4)]
+        if horizontal:
+            shaft = [(y, x) for x, y in shaft]
+        draw.polygon([(cx + x, cy + y) for x, y in shaft], fill=white)
+        box = (cx - 20, cy - 20, cx + 20, cy + 20)
+    elif name == 'Diamond':
+        draw.polygon([(cx, cy - 22), (cx + 10, cy), (cx, cy + 22), (cx - 10, cy)], outline=white, width=3)
+        box = (cx - 10, cy - 22, cx + 10, cy + 22)
+    elif name == 'CycleLane':
+        for dx in (-10, 10):
+            draw.ellipse((cx + dx - 7, cy - 7, cx + dx + 7, cy + 7), outline=white, width=2)
+        draw.line((cx - 10, cy, cx, cy - 10, cx + 10, cy), fill=white, width=2)
+        box = (cx - 17, cy - 12, cx + 17, cy + 7)
+    else:  # Cross
+        draw.line((cx - 14, cy - 14, cx + 14, cy + 14), fill=white, width=4)
+        draw.line((cx - 14, cy + 14, cx + 14, cy - 14), fill=white, width=4)
+        box = (cx - 15, cy - 15, cx + 15, cy + 15)
+    # Slight jitter in paint brightness, as worn markings would have
+    draw.point((cx, cy), fill=tuple(int(v) for v in rng.integers(200, 255, 3)))
+    return box
+
+def road_centres(size: int) -> list:
+    return list(range(ROAD_SPACING // 2, size, ROAD_SPACING))
+
+def synth_raster(size: int, rng) -> tuple:
+    """One size x size RGB raster; returns (array, [(class_id, box), ...])."""
+    # Vegetation with per-pixel noise (so the PNGs compress like real imagery, not like flat colour)
+    image = np.empty((size, size, 3), dtype=np.uint8)
+    noise = rng.integers(0, 28, (size, size, 1), dtype=np.uint8)
+    image[:] = np.array([62, 92, 48], dtype=np.uint8)
+    image += noise
+
+    half = ROAD_WIDTH // 2
+    centres = road_centres(size)
+    for c in centres:
+        image[max(0, c - half):c + half, :] = 78 + noise[max(0, c - half):c + half]
+        image[:, max(0, c - half):c + half] = 78 + noise[:, max(0, c - half):c + half]
+
+    pil = Image.fromarray(image)
+    draw = ImageDraw.Draw(pil)
+
+    # Off-road white roofs: unlabelled, bright, and only the road buffer removes them
+    for _ in range(int(DISTRACTORS_PER_MP * size * size / 1e6)):
+        x, y = (int(v) for v in rng.integers(0, size - 60, 2))
+        if any(abs(x + 30 - c) < half + 40 or abs(y + 30 - c) < half + 40 for c in centres):
+            continue
+        draw.rectangle((x, y, x + 50, y + 40), fill=(230, 230, 228))
+
+    objects = []
+    road_km = 2 * len(centres) * size * PIXEL_SIZE / 1000
+    for _ in range(int(MARKINGS_PER_KM * road_km)):
+        horizontal = bool(rng.integers(0, 2))
+        centre = int(rng.choice(centres))
+        along = int(rng.integers(40, size - 40))
+        across = centre + int(rng.integers(-half + 30, half - 30))
+        cx, cy = (along, across) if horizontal else (across, along)
+        class_id = int(rng.integers(0, len(CLASS_NAMES)))
+        objects.append((class_id, paint_marking(draw, class_id, cx, cy, horizontal, rng)))
+    return np.asarray(pil), objects
+
+def write_buffer_geojson(path: str, rasters: list) -> None:
+    """Road buffer polygons (one per road strip per raster) in EPSG:26918."""
+    features = []
+    for transform, size in rasters:
+        for c in road_centres(size):
+            lo, hi = c - ROAD_WIDTH / 2, c + ROAD_WIDTH / 2
+            for x0, y0, x1, y1 in ((0, lo, size, hi), (lo, 0, hi, size)):
+                ring = [transform * (x, y) for x, y in ((x0, y0), (x1, y0), (x1, y1), (x0, y1), (x0, y0))]
+                features.append({'type': 'Feature', 'properties': {},
+                                 'geometry': {'type': 'Polygon', 'coordinates': [ring]}})
+    with open(path, 'w') as f:
+        json.dump({'type': 'FeatureCollection',
+                   'crs': {'type': 'name', 'properties': {'name': f'urn:ogc:def:crs:EPSG::{EPSG}'}},
+                   'features': features}, f)
+
+def generate_dataset(root: str, count: int, size: int, seed: int = SEED) -> dict:
+    """DrapeYOLO-style layout under root (images/train, labels/train) plus roads.geojson."""
+    import rasterio
+    from rasterio.transform import from_origin
+
+    rng = np.random.default_rng(seed)
+    images_dir = os.path.join(root, 'images', 'train')
+    labels_dir = os.path.join(root, 'labels', 'train')
+    os.makedirs(images_dir, exist_ok=True)
+    os.makedirs(labels_dir, exist_ok=True)
+
+    rasters, labels = [], 0
+    for idx in range(count):
+        # Tiles laid side by side so the buffer and the rasters share one map
+        transform = from_origin(ORIGIN[0] + idx * size * PIXEL_SIZE, ORIGIN[1], PIXEL_SIZE, PIXEL_SIZE)
+        image, objects = synth_raster(size, rng)
+        name = f'synthetic_{idx:03d}'
+        # PNG + .png.aux.xml, the same pair the real exports (and Split.py) deal with
+        with rasterio.open(os.path.join(images_dir, name + '.png'), 'w', driver='PNG', width=size, height=size,
+                           count=3, dtype='uint8', crs=f'EPSG:{EPSG}', transform=transform) as dst:
+            dst.write(image.transpose(2, 0, 1))
+        with open(os.path.join(labels_dir, name + '.txt'), 'w') as f:
+            for class_id, (x1, y1, x2, y2) in objects:
+                f.write(f"{class_id} {(x1 + x2) / 2 / size:.6f} {(y1 + y2) / 2 / size:.6f} "
+                        f"{(x2 - x1) / size:.6f} {(y2 - y1) / size:.6f}\n")
+        rasters.append((transform, size))
+        labels += len(objects)
+
+    write_buffer_geojson(os.path.join(root, 'roads.geojson'), rasters)
+    return {'rasters': count, 'megapixels': round(count * size * size / 1e6, 1), 'labels': labels}
+
+# --------------------------- STAGES ---------------------------
+
+def stage_generate(root: str, settings: dict) -> dict:
+    start = time.perf_counter()
+    result = generate_dataset(root, settings['count'], settings['size'], settings['seed'])
+    return dict(result, seconds=time.perf_counter() - start)
+
+def stage_split(root: str, settings: dict) -> dict:
+    import Split
+    Split.DATASET_ROOT = root
+    Split.SEED = settings['seed']
+    start = time.perf_counter()
+    moved = Split.split_dataset()
+    return {'moved': moved, 'seconds': time.perf_counter() - start}
+
+def stage_patches(root: str, settings: dict) -> dict:
+    import PatchGeneration
+    PatchGeneration.DATASET_ROOT = root
+    PatchGeneration.OUTPUT_PATCHES_ROOT = os.path.join(root, 'patches')
+    start = time.perf_counter()
+    patches = PatchGeneration.main()
+    seconds = time.perf_counter() - start
+    return {'patches': patches, 'seconds': seconds, 'patches_per_s': patches / seconds if seconds else None}
+
+def stub_engine(config):
+    """A DetectionEngine whose model is a brightness threshold: one box around the paint in each slice."""
+    from pyproj import CRS
+    from sahi.postprocess.combine import GreedyNMMPostprocess
+    import DetectionEngine as de
+
+    class StubEngine(de.DetectionEngine):
+        def __init__(self, config):
+            self.config = config
+            self.crs = CRS.from_epsg(config.crs_epsg)
+            self.road_buffer = de.RoadBuffer.from_file(config.buffer_geojson, self.crs) if config.buffer_geojson else None
+            self.postprocess = GreedyNMMPostprocess(match_threshold=0.5, match_metric="IOS", class_agnostic=False)
+            self.class_thresholds = {}
+            self.score_floor = config.conf_threshold
+            self.category_names = dict(enumerate(CLASS_NAMES))
+            self.tta_slices = 0
+            self.epoch_cache = None
+
+        def infer_batch(self, tiles):
+            outputs = []
+            for tile in tiles:
+                ys, xs = np.nonzero(tile.min(axis=2) > 200)
+                if len(xs) < 20:
+                    outputs.append(np.empty((0, 6)))
+                    continue
+                outputs.append(np.array([[xs.min(), ys.min(), xs.max() + 1, ys.max() + 1, 0.9, 0]], dtype=float))
+            return outputs
+
+    return StubEngine(config)
+
+def stage_detect(root: str, settings: dict) -> dict:
+    try:
+        from DetectionEngine import DetectionConfig, DetectionEngine, list_images
+    except ImportError as e:
+        return {'skipped': f'detection dependencies missing ({e})'}
+    config = DetectionConfig(model_path=settings['model'] or 'stub',
+                             buffer_geojson=os.path.join(root, 'roads.geojson'), crs_epsg=EPSG)
+    load_start = time.perf_counter()
+    engine = DetectionEngine(config) if settings['model'] else stub_engine(config)
+    load_seconds = time.perf_counter() - load_start
+
+    tiles = 0
+    def counted(batch):
+        nonlocal tiles
+        tiles += len(batch)
+        return engine.predict_tiles(batch)
+
+    image_paths = list_images([os.path.join(root, 'images', split) for split in ('train', 'val')
+                               if os.path.isdir(os.path.join(root, 'images', split))], config.image_extensions)
+    detections = 0
+    start = time.perf_counter()
+    for image_path in image_paths:
+        found, _ = engine.detect(image_path, predict_tiles=counted)
+        detections += len(found)
+    seconds = time.perf_counter() - start
+    return {'model': settings['model'] or 'stub', 'load_seconds': load_seconds, 'tiles': tiles,
+            'detections': detections, 'seconds': seconds, 'tiles_per_s': tiles / seconds if seconds else None}
+
+def stage_buffer(root: str, settings: dict) -> dict:
+    try:
+        from pyproj import CRS
+        from rasterio.transform import from_origin
+        from DetectionEngine import RoadBuffer, filter_detections_within_buffer
+    except ImportError as e:
+        return {'skipped': f'buffer dependencies missing ({e})'}
+    load_start = time.perf_counter()
+    road_buffer = RoadBuffer.from_file(os.path.join(root, 'roads.geojson'), CRS.from_epsg(EPSG))
+    load_seconds = time.perf_counter() - load_start
+
+    # Random detections over the whole synthetic mosaic
+    rng = np.random.default_rng(settings['seed'])
+    width, height = settings['count'] * settings['size'], settings['size']
+    px, py = rng.uniform(0, width, BUFFER_POINTS), rng.uniform(0, height, BUFFER_POINTS)
+    detections = [{'position': {'x': float(x), 'y': float(y)}} for x, y in zip(px, py)]
+    transform = from_origin(ORIGIN[0], ORIGIN[1], PIXEL_SIZE, PIXEL_SIZE)
+
+    start = time.perf_counter()
+    kept = filter_detections_within_buffer(detections, transform, road_buffer)
+    seconds = time.perf_counter() - start
+    return {'load_seconds': load_seconds, 'points': BUFFER_POINTS, 'kept': len(kept), 'seconds': seconds,
+            'points_per_s': BUFFER_POINTS / seconds if seconds else None}
+
+STAGES = {
+    'generate': stage_generate,
+    'split': stage_split,
+    'patches': stage_patches,
+    'detect': stage_detect,
+    'buffer': stage_buffer,
+}
+
+# --------------------------- RUNNER ---------------------------
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    scale = 1024 * 1024 if sys.platform == 'darwin' else 1024
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale, 1)
+
+def _stage_worker(name: str, root: str, settings: dict, verbose: bool, queue) -> None:
+    start = time.perf_counter()
+    try:
+        out = io.StringIO() if not verbose else sys.stdout
+        with contextlib.redirect_stdout(out):
+            result = STAGES[name](root, settings)
+    except Exception as e:
+        result = {'error': f'{type(e).__name__}: {e}'}
+    result['wall_seconds'] = time.perf_counter() - start
+    result['peak_rss_mb'] = peak_rss_mb()
+    queue.put(result)
+
+def run_stage(name: str, root: str, settings: dict, verbose: bool = False, timeout: float = STAGE_TIMEOUT) -> dict:
+    """
+    Run one stage in a fresh process (cold caches, own peak RSS).
+    A worker that dies without reporting (OOM kill, native crash) or outlives timeout is
+    recorded as an error instead of hanging the benchmark.
+    """
+    ctx = multiprocessing.get_context('spawn')
+    queue = ctx.Queue()
+    proc = ctx.Process(target=_stage_worker, args=(name, root, settings, verbose, queue))
+    proc.start()
+    deadline = time.monotonic() + timeout
+    result = None
+    while result is None:
+        try:
+            result = queue.get(timeout=1.0)
+        except Empty:
+            if not proc.is_alive():
+                try:
+                    result = queue.get(timeout=1.0)  # the result may land just as the process exits
+                except Empty:
+                    break
+            elif time.monotonic() > deadline:
+                proc.terminate()
+                result = {'error': f'timed out after {timeout:g}s'}
+    proc.join()
+    if result is None:
+        result = {'error': f'exit code {proc.exitcode}'}
+    return {k: round(v, 4) if isinstance(v, float) else v for k, v in result.items()}
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+# Metrics where a larger value is better; everything else (seconds, RSS) is better smaller
+HIGHER_IS_BETTER = ('patches_per_s', 'tiles_per_s', 'points_per_s')
+
+def compare(base: dict, report: dict) -> None:
+    """Print every numeric metric of report next to the same metric in base."""
+    print(f"\n📊 {base.get('git_commit')} → {report.get('git_commit')}")
+    for scale, stages in report['scales'].items():
+        for stage, metrics in stages.items():
+            old = base.get('scales', {}).get(scale, {}).get(stage, {})
+            for key, value in metrics.items():
+                before = old.get(key)
+                if not isinstance(value, (int, float)) or not isinstance(before, (int, float)) or not before:
+                    continue
+                change = (value - before) / before * 100
+                better = change > 0 if key in HIGHER_IS_BETTER else change < 0
+                flag = '✅' if better and abs(change) >= 5 else '⚠️ ' if abs(change) >= 5 else '  '
+                print(f"  {flag} {scale:<7} {stage:<9} {key:<15} {before:>12.4g} → {value:<12.4g} ({change:+.1f}%)")
+
+def main(argv=None):
+    """Entry point."""
+    parser = argparse.ArgumentParser(description="Benchmark the data preparation and detection stages on synthetic data.")
+    parser.add_argument('--scales', nargs='+', default=['small'], choices=list(SCALES), help='Dataset sizes to run')
+    parser.add_argument('--stages', nargs='+', default=list(STAGES), choices=list(STAGES),
+                        help='Stages to time (generate always runs)')
+    parser.add_argument('--model', default=None, help='YOLO weights or exported model; default is the stub detector')
+    parser.add_argument('--output', default='benchmark.json', help='JSON report to write')
+    parser.add_argument('--compare', default=None, help='Earlier report to compare against')
+    parser.add_argument('--workdir', default=None, help='Where to build the datasets (default: a temp folder)')
+    parser.add_argument('--keep', action='store_true', help='Keep the generated datasets')
+    parser.add_argument('--seed', type=int, default=SEED)
+    parser.add_argument('--verbose', action='store_true', help="Show the stages' own output")
+    parser.add_argument('--timeout', type=float, default=STAGE_TIMEOUT, help='Seconds before a stage is abandoned')
+    args = parser.parse_args(argv)
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix='marking_bench_')
+    report = {
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'git_commit': git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'settings': {'model': args.model or 'stub', 'seed': args.seed, 'buffer_points': BUFFER_POINTS},
+        'scales': {},
+    }
+    try:
+        for scale in args.scales:
+            count, size = SCALES[scale]
+            root = os.path.join(workdir, scale)
+            shutil.rmtree(root, ignore_errors=True)
+            settings = {'count': count, 'size': size, 'seed': args.seed, 'model': args.model}
+            print(f"\n=== {scale}: {count} rasters of {size}x{size} ===")
+            results = {}
+            # Split must precede patch generation (it moves train → val), so the stage order is fixed
+            for stage in [s for s in STAGES if s == 'generate' or s in args.stages]:
+                results[stage] = run_stage(stage, root, settings, args.verbose, args.timeout)
+                shown = {k: v for k, v in results[stage].items() if k != 'wall_seconds'}
+                print(f"  ⏱  {stage:<9} {shown}")
+            report['scales'][scale] = results
+    finally:
+        if not args.keep and not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\n✅ Report saved to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), report)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,129 @@
+"""
+Offline crawler benchmark against a synthetic portal.
+
+For each org size a MockPortal serves a synthetic_org() inventory, crawler.main() runs
+against it through FakeGIS (full crawl, then optionally a delta crawl after touching a few
+items), and the per-phase timings and counters from the run's metrics record are collected.
+No network access or portal credentials needed; the crawler itself is unchanged.
+
+    python bench.py --sizes 1000 10000 --delta 50
+    python bench.py --sizes 100000 --latency 0.005 --output bench_100k.json
+"""
+import argparse
+import contextlib
+import io
+import json
+import logging
+import os
+import random
+import tempfile
+import time
+
+import crawler
+import metrics
+import mock_portal
+
+def configure_crawler(args):
+    """Point the crawler at the mock portal with benchmark-friendly settings."""
+    crawler.GRAPH_ENGINE = args.engine
+    crawler.ENRICH_RATE = args.client_rate
+    crawler.SIZE_FETCH_THREADS = args.connections
+    crawler.SEARCH_PARTITION = args.partition
+    crawler.SAVE_GML = args.gml
+    crawler.WEB_SHARDS = args.shards
+    crawler.INCREMENTAL = True
+
+def run_crawl(portal, verbose=False):
+    """One crawler.main() run in the current directory; returns its metrics record."""
+    crawler.connect_to_gis = lambda *a, **kw: mock_portal.FakeGIS(portal.rest_url)
+    requests_before = portal.stats["requests"]
+    sink = contextlib.nullcontext() if verbose else contextlib.redirect_stdout(io.StringIO())
+    if not verbose:
+        logging.disable(logging.INFO)  # crawler mirrors every message to the log handler
+    try:
+        with sink:
+            crawler.main()
+    finally:
+        logging.disable(logging.NOTSET)
+    record = metrics.load_runs(crawler.METRICS_FILE)[-1]
+    record["portal_requests"] = portal.stats["requests"] - requests_before
+    return record
+
+def bench_size(size, args):
+    start = time.time()
+    items, data = mock_portal.synthetic_org(size, seed=args.seed)
+    print(f"[OK] Synthetic org: {size} items, {len(data)} item data documents ({time.time() - start:.1f}s)")
+
+    result = {"items": size}
+    previous = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix=f"bench_{size}_") as workdir, \
+            mock_portal.MockPortal(items, data, rate=args.portal_rate, latency=args.latency) as portal:
+        os.chdir(workdir)
+        try:
+            result["full"] = run_crawl(portal, args.verbose)
+            if args.delta:
+                touched = random.Random(args.seed).sample(list(items), min(args.delta, len(items)))
+                portal.touch(touched)
+                result["delta"] = run_crawl(portal, args.verbose)
+                result["delta"]["touched"] = len(touched)
+            result["output_bytes"] = {
+                name: os.path.getsize(name) for name in (crawler.OUTPUT_FILE, crawler.GML_FILE) if os.path.exists(name)
+            }
+        finally:
+            os.chdir(previous)
+    return result
+
+def print_table(results):
+    phases = list(dict.fromkeys(p for r in results for run in ("full", "delta") if run in r for p in r[run]["spans"]))
+    columns = [(r["items"], run) for r in results for run in ("full", "delta") if run in r]
+    print("\n" + "=" * 70)
+    print("CRAWLER BENCHMARK")
+    print("=" * 70)
+    print(f"{'phase':<14}" + "".join(f"{f'{n} {run}':>16}" for n, run in columns))
+    by_key = {(r["items"], run): r[run] for r in results for run in ("full", "delta") if run in r}
+    for phase in phases + ["total"]:
+        cells = []
+        for key in columns:
+            record = by_key[key]
+            seconds = record["total_seconds"] if phase == "total" else record["spans"].get(phase, {}).get("seconds")
+            cells.append(f"{seconds:>15.2f}s" if seconds is not None else f"{'-':>16}")
+        print(f"{phase:<14}" + "".join(cells))
+    print(f"{'items/s':<14}" + "".join(f"{key[0] / by_key[key]['total_seconds']:>16.0f}" for key in columns))
+    print(f"{'requests':<14}" + "".join(f"{by_key[key]['portal_requests']:>16}" for key in columns))
+    print(f"{'peak RSS MB':<14}" + "".join(f"{by_key[key].get('peak_rss_mb', '-'):>16}" for key in columns))
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark crawler.py against a synthetic mock portal.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000], help="Org sizes (items)")
+    parser.add_argument("--delta", type=int, default=50, help="Items touched before a delta run (0 = full only)")
+    parser.add_argument("--engine", default="native", choices=["native", "itemgraph"],
+                        help="Dependency engine (itemgraph needs a real portal)")
+    parser.add_argument("--partition", default="owner", help='SEARCH_PARTITION ("owner", "type" or "none")')
+    parser.add_argument("--connections", type=int, default=20, help="Concurrent enrichment/data requests")
+    parser.add_argument("--client-rate", type=float, default=2000, help="Crawler request rate limit (req/s)")
+    parser.add_argument("--portal-rate", type=float, help="Mock portal throttling threshold (req/s)")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to every mock response")
+    parser.add_argument("--gml", action="store_true", help="Include the GML export in the save phase")
+    parser.add_argument("--shards", action="store_true", help="Include the sharded viewer output in the save phase")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--verbose", action="store_true", help="Show crawler output")
+    parser.add_argument("--output", default="bench_report.json", help="JSON report path")
+    args = parser.parse_args()
+    if args.partition == "none":
+        args.partition = None
+
+    configure_crawler(args)
+    results = [bench_size(size, args) for size in args.sizes]
+    print_table(results)
+
+    report = {
+        "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "settings": {k: v for k, v in vars(args).items() if k not in ("output", "verbose")},
+        "results": results,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"\n[OK] Report saved to {args.output}")
+
+if __name__ == "__main__":
+    main()
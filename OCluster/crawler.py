@@ -1,13 +1,28 @@
 from arcgis.gis import GIS
-from arcgis.apps.itemgraph import ItemGraph, create_dependency_graph 
+from arcgis.apps.itemgraph import create_dependency_graph
 import json
 import urllib3
 import logging
 import time
 import os
-from datetime import datetime
+import queue
+import threading
+from datetime import datetime, timedelta
 from concurrent.futures import ThreadPoolExecutor, as_completed
 
+import graph_stats
+import history
+import metrics
+import shards
+import snapshot
+
+try:
+    import portal_client  # needs aiohttp
+    import dependency_engine
+except ImportError:
+    portal_client = None
+    dependency_engine = None
+
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
@@ -15,16 +30,35 @@ logger = logging.getLogger(__name__)
 # ================= CONFIGURATION =================
 OUTPUT_FILE = "Inventory_graph.json"
 GML_FILE = "Inventory_graph.gml"
-CACHE_FILE = "Inventory_cache.json"
+CACHE_DIR = "Inventory_snapshot"        # Binary snapshot (memory-mapped .npy columns) used as the crawl cache
+LEGACY_CACHE_FILE = "Inventory_cache.json"  # JSON cache from older versions, read once if no snapshot exists
+HISTORY_DIR = "Inventory_history"       # Append-only run history (deltas + checkpoints, see history.py); None disables
 
-MAX_ITEMS = 3000
+MAX_ITEMS = None   # Optional cap (e.g. for testing); None crawls the whole inventory
 SEARCH_QUERY = ""  # Leave empty for full inventory
 
 # Performance Toggles
-SAVE_GML = True                 # Set False to skip GML save/load (slower reloads)
+SAVE_GML = True                 # Write the GML export (Gephi / NetworkX), derived from the snapshot
 FETCH_MISSING_SIZES = True      # Set False to skip size enrichment
-SIZE_FETCH_THREADS = 20         # Parallel threads for size fetching
-CACHE_MAX_AGE_HOURS = 24        # Rebuild graph if cache is older than this
+SIZE_FETCH_THREADS = 20         # Parallel requests for size fetching
+ENRICH_ASYNC = True             # Async client with rate limiting and retries (threads if aiohttp is missing)
+ENRICH_RATE = 50                # Max enrichment requests per second (halves on each 429)
+SEARCH_PAGE_SIZE = 100          # Results per search page (portal maximum is 100)
+SEARCH_THREADS = 8              # Partitions searched concurrently
+SEARCH_PARTITION = "owner"      # Split the search by "owner", "type", or None for a single query
+SEARCH_RESULT_LIMIT = 10000     # Portal stops paging a query here; larger partitions are split by upload date
+INCREMENTAL = True              # Delta crawl (items modified since last run) when a cache exists
+CACHE_MAX_AGE_HOURS = 24 * 7    # Full rebuild if cache is older than this, as a periodic safety net
+DELTA_OVERLAP_MINUTES = 10      # Re-scan this far before the last crawl start to absorb clock skew
+GRAPH_ENGINE = "itemgraph"      # "itemgraph" (arcgis ItemGraph) or "native" (parallel item data parsing, needs aiohttp)
+WEB_SHARDS = True               # Also write the sharded viewer output (index, per-owner shards, neighbourhoods)
+WEB_DIR = "Inventory_web"       # Directory for the sharded output
+WEB_SHARD_BY = "owner"          # Shard by "owner" or "type"
+WEB_LAYOUT = True               # Precompute initial node positions for the viewers
+METRICS_FILE = "crawler_metrics.jsonl"  # One JSON record per run: phase timings, counters, peak memory
+PROFILE_RUN = False             # cProfile the whole run (top functions go into the metrics record)
+PROFILE_FILE = "crawler_profile.prof"   # Full profile for snakeviz / pstats when PROFILE_RUN is on
+TRACE_MEMORY = False            # tracemalloc peak of Python allocations (slows the run down)
 # =================================================
 
 # Suppress HTTPS warnings
@@ -42,30 +76,37 @@ def warn(message):
     print(f"[WARN] {message}")
     logger.warning(message)
 
-def connect_to_gis():
+def connect_to_gis(profile=None):
+    """Connect with a stored arcgis profile (see multi_portal.py), or the active "home" session."""
     try:
-        gis = GIS("home")
+        gis = GIS(profile=profile) if profile else GIS("home")
         ok(f"Connected to portal: {gis.properties.portalName}")
         return gis
     except Exception as e:
         err(f"Failed to connect to GIS: {e}")
         raise
 
-def extract_item_metadata(item):
+# Item types searched as their own partitions when SEARCH_PARTITION = "type"; everything else is one remainder query
+PARTITION_TYPES = [
+    "Feature Service", "Map Service", "Vector Tile Service", "Image Service", "Web Map", "Web Scene",
+    "Dashboard", "Web Experience", "Web Mapping Application", "StoryMap", "Form", "Hub Site Application",
+    "Hub Page", "CSV", "Shapefile", "File Geodatabase", "Microsoft Excel", "PDF", "Notebook",
+]
+
+def extract_item_metadata(info):
     """
-    Extract metadata from Item._item_info to avoid lazy loading.
+    Compact node dict from a raw search result (or Item._item_info) to avoid lazy loading.
     Ensures all original keys are present for visualization compatibility.
     """
-    info = getattr(item, '_item_info', {}) or {}
     return {
-        "id": item.id,
-        "label": info.get("title") or getattr(item, 'title', ''),
-        "type": info.get("type") or getattr(item, 'type', ''),
-        "owner": info.get("owner") or getattr(item, 'owner', ''),
+        "id": info["id"],
+        "label": info.get("title") or "",
+        "type": info.get("type") or "",
+        "owner": info.get("owner") or "",
         "views": info.get("numViews", 0),
         "access": info.get("access", "private"),
-        "url": info.get("url") or getattr(item, 'homepage', ''),
-        "modified": info.get("modified") or getattr(item, 'modified', None),
+        "url": info.get("url") or "",
+        "modified": info.get("modified"),
         "created": info.get("created"),
         "size": info.get("size"),
         "tags": info.get("tags", []),
@@ -73,13 +114,17 @@ def extract_item_metadata(item):
         "is_abandoned": True
     }
 
+# PortalClient counter -> run metrics counter
+CLIENT_COUNTER_NAMES = {"requests": "api_calls", "bytes": "bytes_downloaded", "failures": "api_failures"}
+
 def fetch_size_direct(gis, item_id):
-    """Fetch size using direct API connection."""
+    """Fetch size using direct API connection; returns (item_id, size, error)."""
     try:
+        metrics.count("api_calls")
         resp = gis._con.get(f"content/items/{item_id}", {"f": "json"})
-        return item_id, resp.get("size") if resp else None
-    except Exception:
-        return item_id, None
+        return item_id, resp.get("size") if resp else None, None
+    except Exception as e:
+        return item_id, None, str(e)
 
 def parallel_size_enrichment(gis, nodes):
     """Update nodes with accurate size using parallel direct API calls."""
@@ -91,37 +136,64 @@ def parallel_size_enrichment(gis, nodes):
         if node.get("size") in (None, -1, 0)
     ]
     
+    metrics.count("sizes_from_search", len(nodes) - len(items_to_fetch))
     if not items_to_fetch:
         ok("All items have valid size; skipping enrichment")
         return nodes
     
-    ok(f"Enriching size for {len(items_to_fetch)} items ({SIZE_FETCH_THREADS} threads)...")
-    start = time.time()
-    
-    with ThreadPoolExecutor(max_workers=SIZE_FETCH_THREADS) as executor:
-        future_to_id = {executor.submit(fetch_size_direct, gis, iid): iid for iid in items_to_fetch}
-        for future in as_completed(future_to_id):
-            item_id, size = future.result()
-            if size is not None and item_id in nodes:
-                nodes[item_id]["size"] = size
-    
-    ok(f"Size enrichment complete in {time.time() - start:.2f}s")
+    with metrics.span("enrichment") as span:
+        errors = enrich_sizes(gis, nodes, items_to_fetch)
+    if errors:
+        sample_id, sample_error = next(iter(errors.items()))
+        warn(f"Size lookup failed for {len(errors)} items (e.g. {sample_id}: {sample_error})")
+    ok(f"Size enrichment complete in {span.elapsed:.2f}s")
     return nodes
 
+def enrich_sizes(gis, nodes, items_to_fetch):
+    """Fill node sizes for the given ids in place; returns {id: error} for failed lookups."""
+    errors = {}
+    if ENRICH_ASYNC and portal_client is not None:
+        ok(f"Enriching size for {len(items_to_fetch)} items (async, {SIZE_FETCH_THREADS} connections, {ENRICH_RATE} req/s)...")
+        sizes, errors, counters = portal_client.fetch_sizes(
+            gis, items_to_fetch, concurrency=SIZE_FETCH_THREADS, rate=ENRICH_RATE
+        )
+        for item_id, size in sizes.items():
+            nodes[item_id]["size"] = size
+        metrics.add_counters(counters, CLIENT_COUNTER_NAMES)
+        ok(f"  {counters['requests']} requests, {counters['retries']} retries, {counters['throttled']} throttled")
+    else:
+        ok(f"Enriching size for {len(items_to_fetch)} items ({SIZE_FETCH_THREADS} threads)...")
+        with ThreadPoolExecutor(max_workers=SIZE_FETCH_THREADS) as executor:
+            future_to_id = {executor.submit(fetch_size_direct, gis, iid): iid for iid in items_to_fetch}
+            for future in as_completed(future_to_id):
+                item_id, size, error = future.result()
+                if error:
+                    errors[item_id] = error
+                elif size is not None and item_id in nodes:
+                    nodes[item_id]["size"] = size
+    return errors
+
 def load_cache():
-    """Load previous run data if available."""
-    if not os.path.exists(CACHE_FILE):
-        return None
+    """Load previous run data if available (snapshot, or the legacy JSON cache)."""
     try:
-        with open(CACHE_FILE, "r", encoding="utf-8") as f:
-            return json.load(f)
+        if os.path.isdir(CACHE_DIR):
+            start = time.time()
+            cache = snapshot.load(CACHE_DIR).to_graph_data()
+            ok(f"Loaded snapshot cache ({len(cache['nodes'])} items) in {time.time() - start:.2f}s")
+            return cache
+        if os.path.exists(LEGACY_CACHE_FILE):
+            with open(LEGACY_CACHE_FILE, "r", encoding="utf-8") as f:
+                return json.load(f)
     except Exception as e:
         warn(f"Cache load failed: {e}")
-        return None
+    return None
 
 def should_rebuild_graph(cache):
-    """Determine if we need to rebuild the dependency graph."""
-    if not cache:
+    """Determine if we need a full crawl instead of a delta crawl."""
+    if not cache or not INCREMENTAL:
+        return True
+    if "edges" not in cache or "crawl_started" not in cache.get("summary", {}):
+        ok("Cache predates incremental crawling")
         return True
     
     try:
@@ -135,37 +207,264 @@ def should_rebuild_graph(cache):
     
     return False
 
-def main():
-    start_total = time.time()
-    gis = connect_to_gis()
-
-    # Load cache for incremental logic
-    cache = load_cache()
-    cache_nodes = {n["id"]: n for n in cache.get("nodes", [])} if cache else {}
-    rebuild_graph = should_rebuild_graph(cache)
-
-    # Step 1: Search Items
-    ok("Fetching portal content...")
-    start_search = time.time()
-    
+def search_query(gis, *clauses):
+    """AND the configured SEARCH_QUERY (default: the whole org) with extra clauses."""
+    base = SEARCH_QUERY or f"orgid:{gis.properties.id}"
+    return " AND ".join([f"({base})"] + list(clauses))
+
+def search_total(gis, query):
+    """Number of items matching a query, without fetching any results."""
+    metrics.count("api_calls")
+    return gis._con.get("search", {"q": query, "num": 0, "f": "json"}).get("total", 0)
+
+def iter_search_pages(gis, query):
+    """Yield raw result pages for one query, following nextStart."""
+    start = 1
+    while start > 0:
+        metrics.count("api_calls")
+        metrics.count("search_pages")
+        resp = gis._con.get("search", {
+            "q": query, "start": start, "num": SEARCH_PAGE_SIZE,
+            "sortField": "uploaded", "sortOrder": "asc", "f": "json"
+        })
+        results = resp.get("results", [])
+        if results:
+            yield results
+        start = resp.get("nextStart", -1)
+
+def list_org_usernames(gis):
+    """Usernames in the org, paged from portals/self/users."""
+    usernames = []
+    start = 1
+    while start > 0:
+        metrics.count("api_calls")
+        resp = gis._con.get("portals/self/users", {"start": start, "num": 100, "f": "json"})
+        usernames.extend(u["username"] for u in resp.get("users", []))
+        start = resp.get("nextStart", -1)
+    return usernames
+
+def uploaded_clause(low_ms, high_ms):
+    """Portal search range on the uploaded (created) field, inclusive, in epoch ms."""
+    return f"uploaded:[{low_ms:019d} TO {high_ms:019d}]"
+
+def split_by_uploaded(gis, query):
+    """
+    Queries covering the same items as query, each within SEARCH_RESULT_LIMIT results.
+    Upload-date ranges are halved until they fit (one count query per split).
+    """
     try:
-        all_items = gis.content.advanced_search(query=SEARCH_QUERY, max_items=MAX_ITEMS)
-    except Exception:
-        all_items = gis.content.search(query=SEARCH_QUERY, max_items=MAX_ITEMS)
-    
-    ok(f"Found {len(all_items)} items in {time.time() - start_search:.2f}s")
+        total = search_total(gis, query)
+    except Exception as e:
+        warn(f"Count query failed ({e}); results past {SEARCH_RESULT_LIMIT} may be missed for {query}")
+        return [query]
+    if total <= SEARCH_RESULT_LIMIT:
+        return [query]
+
+    parts = []
+    ranges = [(0, int(time.time() * 1000) + 86400000, total)]
+    while ranges:
+        low, high, count = ranges.pop()
+        if count <= SEARCH_RESULT_LIMIT or low >= high:
+            if count > SEARCH_RESULT_LIMIT:
+                warn(f"{count} items uploaded in the same millisecond; only {SEARCH_RESULT_LIMIT} can be paged")
+            if count:
+                parts.append(f"{query} AND {uploaded_clause(low, high)}")
+            continue
+        mid = (low + high) // 2
+        left = search_total(gis, f"{query} AND {uploaded_clause(low, mid)}")
+        ranges.append((mid + 1, high, count - left))
+        ranges.append((low, mid, left))
+    ok(f"Split a {total}-item partition into {len(parts)} upload-date ranges")
+    return parts
+
+def within_result_limit(gis, queries):
+    """Check every query's total and split the ones over SEARCH_RESULT_LIMIT."""
+    with ThreadPoolExecutor(max_workers=SEARCH_THREADS) as executor:
+        return [part for parts in executor.map(lambda q: split_by_uploaded(gis, q), queries) for part in parts]
+
+def search_partitions(gis, *clauses):
+    """
+    Split the inventory query into disjoint partitions that can be paged concurrently.
+    Also keeps each query under the portal's 10,000-result paging limit on large orgs.
+    """
+    if SEARCH_PARTITION == "owner":
+        try:
+            owners = list_org_usernames(gis)
+        except Exception as e:
+            warn(f"Owner listing failed ({e}); searching as one partition")
+            owners = []
+        if owners:
+            return within_result_limit(gis, [search_query(gis, *clauses, f'owner:"{u}"') for u in owners])
+    elif SEARCH_PARTITION == "type":
+        remainder = " AND ".join(f'NOT type:"{t}"' for t in PARTITION_TYPES)
+        return within_result_limit(gis, [search_query(gis, *clauses, f'type:"{t}"') for t in PARTITION_TYPES] +
+                                   [search_query(gis, *clauses, remainder)])
+    return within_result_limit(gis, [search_query(gis, *clauses)])
+
+def stream_inventory(gis, *clauses, partitioned=True):
+    """
+    Yield pages of node dicts for every item matching the query.
+    Partitions are paged concurrently into a bounded queue, so only a few pages of raw
+    results are alive at once and no Item objects are created.
+    """
+    partitions = search_partitions(gis, *clauses) if partitioned else within_result_limit(gis, [search_query(gis, *clauses)])
+    pages = queue.Queue(maxsize=SEARCH_THREADS * 2)
+    stop = threading.Event()  # set when the consumer stops early (e.g. MAX_ITEMS)
+
+    def put(page):
+        while not stop.is_set():
+            try:
+                pages.put(page, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+
+    def page_worker(query):
+        try:
+            for results in iter_search_pages(gis, query):
+                if stop.is_set():
+                    return
+                put([extract_item_metadata(info) for info in results])
+        finally:
+            put(None)
+
+    with ThreadPoolExecutor(max_workers=SEARCH_THREADS) as executor:
+        futures = [executor.submit(page_worker, q) for q in partitions]
+        try:
+            remaining = len(partitions)
+            while remaining:
+                page = pages.get()
+                if page is None:
+                    remaining -= 1
+                    continue
+                yield page
+            for future in futures:
+                future.result()  # surface search errors
+        finally:
+            stop.set()
+
+def modified_clause(since, until):
+    """Portal search range on the modified field (epoch ms, zero padded as the search API expects)."""
+    to_ms = lambda dt: int(dt.timestamp() * 1000)
+    return f"modified:[{to_ms(since):019d} TO {to_ms(until):019d}]"
+
+def fetch_current_ids(gis, expected_ids):
+    """
+    Ids of every item matching SEARCH_QUERY.
+    A count query is enough when it matches what we expect; the id sweep only runs when items were deleted.
+    """
+    try:
+        count = search_total(gis, search_query(gis))
+        if count == len(expected_ids):
+            return set(expected_ids)
+        ok(f"Portal reports {count} items vs {len(expected_ids)} expected; sweeping ids")
+    except Exception as e:
+        warn(f"Count query failed ({e}); sweeping ids")
+    return {node["id"] for page in stream_inventory(gis) for node in page}
+
+def resolve_graph_engine():
+    """Engine that will actually run: native needs aiohttp, otherwise fall back to ItemGraph."""
+    if GRAPH_ENGINE == "native":
+        if dependency_engine is not None:
+            return "native"
+        warn("GRAPH_ENGINE='native' needs aiohttp; using ItemGraph")
+    return "itemgraph"
+
+def native_edges(gis, nodes, only=None):
+    """Dependency edges from the native engine, warning about items whose data could not be read."""
+    edges, errors, counters = dependency_engine.build_edges(
+        gis, nodes, only=only, concurrency=SIZE_FETCH_THREADS, rate=ENRICH_RATE, log=ok
+    )
+    metrics.add_counters(counters, CLIENT_COUNTER_NAMES)
+    if errors:
+        warn(f"Item data unavailable for {len(errors)} items; their outgoing dependencies are missing")
+    return edges
+
+def delta_crawl(gis, cache, crawl_started, engine="itemgraph"):
+    """
+    Patch the cached nodes and edges with items modified since the previous crawl.
+    Only changed items get metadata and size enrichment. A reference lives in the referencing
+    item's data, so only changed items can gain or lose outgoing edges, with one exception: an
+    unchanged item whose reference resolves differently now (its target was deleted, or a
+    service URL it names moved to or from a changed item) is re-extracted too, so the edge set
+    matches what a full crawl would build. Other dependents just get their counts recomputed.
+    """
+    nodes = {n["id"]: n for n in cache.get("nodes", [])}
+    edges = cache.get("edges", []) + cache.get("external_edges", [])
+    since = datetime.fromisoformat(cache["summary"]["crawl_started"]) - timedelta(minutes=DELTA_OVERLAP_MINUTES)
+
+    # Step 1: Search only modified items
+    ok(f"Delta crawl: items modified since {since.isoformat(timespec='seconds')}...")
+    with metrics.span("search") as span:
+        current_nodes = {
+            node["id"]: node
+            for page in stream_inventory(gis, modified_clause(since, crawl_started), partitioned=False)
+            for node in page
+        }
+    changed = set(current_nodes)
+    ok(f"Found {len(changed)} modified items in {span.elapsed:.2f}s")
+
+    # Step 2: Detect deletions
+    with metrics.span("deletions"):
+        current_ids = fetch_current_ids(gis, set(nodes) | changed)
+    deleted = set(nodes) - current_ids
+    metrics.count("cache_hits", len(set(nodes) - changed - deleted))
+    for iid in deleted:
+        nodes.pop(iid)
+    if deleted:
+        ok(f"Removed {len(deleted)} deleted items from cache")
+
+    # Step 3: Size for changed items only
+    current_nodes = parallel_size_enrichment(gis, current_nodes)
+    moved = {iid for iid in changed if iid in nodes and nodes[iid].get("url") != current_nodes[iid].get("url")}
+    nodes.update(current_nodes)
+
+    # Step 4: Recompute outgoing dependencies of changed items (and of items whose references
+    # now resolve differently) and patch the edge set
+    affected = changed | deleted
+    dependents = {e["source"] for e in edges if e["target"] in affected} - affected
+    stale_targets = deleted | moved
+    if engine == "native":
+        # Unresolved URLs a new or changed item now registers
+        stale_targets |= {dependency_engine.normalize_service_url(current_nodes[iid].get("url")) for iid in changed}
+    refetch = changed | ({e["source"] for e in edges if e["target"] in stale_targets} - deleted)
+    edges = [e for e in edges if e["source"] not in refetch and e["source"] not in deleted]
+    if refetch:
+        with metrics.span("graph_build") as span:
+            if engine == "native":
+                edges.extend(native_edges(gis, nodes, only=refetch))
+            else:
+                subgraph = create_dependency_graph(gis, list(refetch), outside_org=True, include_reverse=False)
+                edges.extend(
+                    {"source": s, "target": t, "type": "dependency"}
+                    for s, t in subgraph.edges() if s in refetch
+                )
+        ok(f"Dependencies for {len(refetch)} items rebuilt in {span.elapsed:.2f}s")
+
+    ok(f"Patched graph: {len(changed)} changed, {len(deleted)} deleted, {len(dependents)} dependents affected, "
+       f"{len(refetch - changed)} re-extracted")
+    return nodes, edges
+
+def full_crawl(gis, cache, engine="itemgraph"):
+    """Search every item and rebuild the dependency graph from scratch."""
+    cache_nodes = {n["id"]: n for n in cache.get("nodes", [])} if cache else {}
 
-    # Step 2: Extract Metadata (No Lazy Loads)
-    ok("Extracting metadata...")
-    start_nodes = time.time()
-    
+    # Steps 1-2: Stream search pages straight into node dicts (No Item objects, no lazy loads)
+    ok(f"Fetching portal content (partitioned by {SEARCH_PARTITION or 'nothing'})...")
     current_nodes = {}
-    for idx, item in enumerate(all_items):
-        if idx % 1000 == 0 and idx > 0:
-            ok(f"  Processed {idx}/{len(all_items)}...")
-        current_nodes[item.id] = extract_item_metadata(item)
+    next_report = 1000
+    with metrics.span("search") as span:
+        for page in stream_inventory(gis):
+            for node in page:
+                current_nodes[node["id"]] = node
+            if len(current_nodes) >= next_report:
+                ok(f"  Fetched {len(current_nodes)} items...")
+                next_report += 1000
+            if MAX_ITEMS and len(current_nodes) >= MAX_ITEMS:
+                warn(f"Stopped at MAX_ITEMS={MAX_ITEMS}")
+                break
     
-    ok(f"Metadata extracted in {time.time() - start_nodes:.2f}s")
+    ok(f"Found {len(current_nodes)} items in {span.elapsed:.2f}s")
 
     # Step 3: Enrich Size (Parallel Direct API)
     current_nodes = parallel_size_enrichment(gis, current_nodes)
@@ -183,37 +482,47 @@ def main():
     if deleted_count > 0:
         ok(f"Removed {deleted_count} deleted items from cache")
 
-    # Step 5: Build or Load Dependency Graph
-    itemgraph = None
-    start_graph = time.time()
-    
+    # Step 5: Build Dependency Graph
+    ok(f"Rebuilding dependency graph ({engine})...")
+    with metrics.span("graph_build") as span:
+        if engine == "native":
+            edges = native_edges(gis, nodes)
+        else:
+            try:
+                itemgraph = create_dependency_graph(
+                    gis, list(current_nodes), outside_org=True, include_reverse=True
+                )
+            except Exception as e:
+                err(f"Graph build failed: {e}")
+                raise
+            edges = [{"source": s, "target": t, "type": "dependency"} for s, t in itemgraph.edges()]
+    ok(f"Graph built in {span.elapsed:.2f}s")
+    return nodes, edges
+
+def main(profile=None):
+    start_total = time.time()
+    crawl_started = datetime.now()
+    metrics.start(profile=PROFILE_RUN, trace_memory=TRACE_MEMORY, profile_file=PROFILE_FILE if PROFILE_RUN else None)
+    with metrics.span("connect"):
+        gis = connect_to_gis(profile)
+
+    # Load cache for incremental logic
+    with metrics.span("load_cache"):
+        cache = load_cache()
+    rebuild_graph = should_rebuild_graph(cache)
+    engine = resolve_graph_engine()
+
+    # Steps 1-5: Full crawl, or patch the cache with items modified since the last run
     if rebuild_graph:
-        ok("Rebuilding dependency graph...")
-        try:
-            itemgraph = create_dependency_graph(
-                gis, all_items, outside_org=True, include_reverse=True
-            )
-            ok(f"Graph built in {time.time() - start_graph:.2f}s")
-        except Exception as e:
-            err(f"Graph build failed: {e}")
-            raise
+        nodes, edges = full_crawl(gis, cache, engine)
     else:
-        ok("Loading graph from cache...")
-        try:
-            if SAVE_GML and os.path.exists(GML_FILE):
-                itemgraph = ItemGraph.load_from_file(GML_FILE, gis, retrieve_items=False)
-                ok(f"Graph loaded in {time.time() - start_graph:.2f}s")
-            else:
-                warn("GML missing; forcing rebuild")
-                itemgraph = create_dependency_graph(gis, all_items, outside_org=True, include_reverse=True)
-        except Exception as e:
-            warn(f"Load failed ({e}); rebuilding...")
-            itemgraph = create_dependency_graph(gis, all_items, outside_org=True, include_reverse=True)
+        nodes, edges = delta_crawl(gis, cache, crawl_started, engine)
 
     # Step 6: Process Edges and Stats
-    edges = [{"source": s, "target": t, "type": "dependency"} for s, t in itemgraph.edges()]
-    connected_ids = {sid for e in edges for sid in (e["source"], e["target"])}
-    
+    # Only relationships inside the inventory count: references to deleted or foreign items and
+    # unresolved service URLs go to external_edges, and never make an item "connected" or add to its stats
+    item_edges = [e for e in edges if e["source"] in nodes and e["target"] in nodes]
+    connected_ids = {sid for e in item_edges for sid in (e["source"], e["target"])}
     abandoned_count = 0
     for iid in nodes:
         is_connected = iid in connected_ids
@@ -225,42 +534,25 @@ def main():
 
     # Step 7: Dependency Stats
     ok("Calculating dependency stats...")
-    start_stats = time.time()
+    with metrics.span("stats") as span:
+        # One pass over the edge list (SCC condensation + bitset reachability), same for every engine
+        item_dependency_stats = graph_stats.dependency_stats(nodes.keys(), item_edges)
+        for item_id, info in item_dependency_stats.items():
+            nodes[item_id]["dependency_info"] = info
     
-    item_dependency_stats = {}
-    for item_id in nodes.keys():
-        try:
-            node = itemgraph.get_node(item_id)
-            if node:
-                stats = {
-                    "total_required_by": len(node.required_by()),
-                    "total_requires": len(node.requires())
-                }
-                item_dependency_stats[item_id] = stats
-                nodes[item_id]["dependency_info"] = {
-                    "immediate_dependencies": len(node.contains()),
-                    "immediate_dependents": len(node.contained_by()),
-                    "total_recursive_dependencies": stats["total_requires"],
-                    "total_recursive_dependents": stats["total_required_by"]
-                }
-        except Exception:
-            continue
-    
-    ok(f"Stats complete in {time.time() - start_stats:.2f}s")
+    ok(f"Stats complete in {span.elapsed:.2f}s")
 
     # Step 8: Filter Edges for JSON
-    filtered_edges = [e for e in edges if e["source"] in nodes and e["target"] in nodes]
-    ok(f"Filtered to {len(filtered_edges)} internal relationships")
+    # References leaving the org (foreign item ids, unregistered service URLs) are kept apart so
+    # delta crawls carry them forward and multi_portal.py can resolve them against other portals
+    filtered_edges, external_edges = [], []
+    for e in edges:
+        if e["source"] in nodes:
+            (filtered_edges if e["target"] in nodes else external_edges).append(e)
+    ok(f"Filtered to {len(filtered_edges)} internal relationships ({len(external_edges)} external references)")
 
     # Step 9: High Risk Items
-    critical_items = sorted(
-        [
-            {"id": iid, "title": nodes[iid]["label"], "type": nodes[iid]["type"], "dependents_count": s["total_required_by"]}
-            for iid, s in item_dependency_stats.items() if s.get("total_required_by", 0) > 0
-        ],
-        key=lambda x: x["dependents_count"],
-        reverse=True
-    )[:50]
+    critical_items = graph_stats.high_risk_items(nodes, item_dependency_stats, limit=50)
 
     # Step 10: Save Outputs
     graph_data = {
@@ -270,28 +562,44 @@ def main():
             "connected_count": len(connected_ids),
             "total_relationships": len(filtered_edges),
             "analysis_date": datetime.now().isoformat(),
-            "graph_method": "ItemGraph",
+            "crawl_started": crawl_started.isoformat(),
+            "graph_method": ("Native" if engine == "native" else "ItemGraph") + ("" if rebuild_graph else " (delta)"),
             "rebuilt_graph": rebuild_graph
         },
         "high_risk_items": critical_items,
         "nodes": list(nodes.values()),
-        "edges": filtered_edges
+        "edges": filtered_edges,
+        "external_edges": external_edges
     }
 
-    with open(OUTPUT_FILE, "w", encoding="utf-8") as f:
-        json.dump(graph_data, f, indent=2)
-    ok(f"JSON saved to {OUTPUT_FILE}")
-
-    with open(CACHE_FILE, "w", encoding="utf-8") as f:
-        json.dump(graph_data, f, indent=2)
-    ok(f"Cache saved to {CACHE_FILE}")
-
-    if SAVE_GML and itemgraph:
-        try:
-            itemgraph.write_to_file(GML_FILE)
-            ok(f"GML saved to {GML_FILE}")
-        except Exception as e:
-            warn(f"GML save failed: {e}")
+    with metrics.span("save"):
+        # Web JSON is minified (viewers don't need the whitespace); the cache is the binary snapshot
+        with open(OUTPUT_FILE, "w", encoding="utf-8") as f:
+            json.dump(graph_data, f, separators=(",", ":"))
+        ok(f"JSON saved to {OUTPUT_FILE}")
+
+        if WEB_SHARDS:
+            index = shards.write_shards(WEB_DIR, graph_data, by=WEB_SHARD_BY, layout=WEB_LAYOUT)
+            ok(f"Viewer shards saved to {WEB_DIR} ({len(index['shards'])} shards, {len(index['neighbourhoods'])} neighbourhoods)")
+
+        snapshot.save(CACHE_DIR, graph_data)
+        ok(f"Snapshot saved to {CACHE_DIR}")
+
+        if SAVE_GML:
+            try:
+                snapshot.write_gml(snapshot.load(CACHE_DIR), GML_FILE)
+                ok(f"GML saved to {GML_FILE}")
+            except Exception as e:
+                warn(f"GML save failed: {e}")
+
+    if HISTORY_DIR:
+        with metrics.span("history"):
+            try:
+                run = history.HistoryStore(HISTORY_DIR).record(graph_data)
+                ok(f"Run {run['run']} added to {HISTORY_DIR}: +{run.get('added', 0)} -{run.get('removed', 0)} "
+                   f"~{run.get('changed', 0)} items, +{run.get('edges_added', 0)} -{run.get('edges_removed', 0)} relationships")
+            except Exception as e:
+                warn(f"History update failed: {e}")
 
     # Final Summary
     total_time = time.time() - start_total
@@ -302,9 +610,19 @@ def main():
     ok(f"Items: {len(nodes)} | Orphaned: {abandoned_count} | Relations: {len(filtered_edges)}")
     ok("="*70)
 
+    run = metrics.finish(
+        METRICS_FILE, mode="full" if rebuild_graph else "delta", engine=engine,
+        items=len(nodes), relationships=len(filtered_edges),
+    )
+    phases = ", ".join(f"{name} {span['seconds']:.1f}s" for name, span in run["spans"].items())
+    ok(f"Run metrics appended to {METRICS_FILE} ({phases})")
+
 if __name__ == "__main__":
     main()
 
 # Unlike previous versions of the code, This will take a while to go through the items and give you an output,
 # Let it run during end of the day or during the weekend (It might take anywhere from 20mins to 2 hours if there are too many items to go through
 # The slowness is due to graph api's working.
+# After the first full run, later runs are delta crawls: only items modified since the previous crawl are
+# fetched and re-analysed, so a nightly run with few changes finishes in seconds. A full rebuild still
+# happens when the cache is older than CACHE_MAX_AGE_HOURS (or set INCREMENTAL = False to force one).
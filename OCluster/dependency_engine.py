@@ -0,0 +1,147 @@
+"""
+Native dependency extraction for crawler.py (GRAPH_ENGINE = "native").
+
+Instead of ItemGraph's serial traversal, every item's /data JSON is fetched concurrently
+(web map operationalLayers/baseMap, Dashboard and Experience Builder dataSources, app
+configs, embedded URLs) and scanned with two compiled patterns:
+  * 32-hex item ids that exist in the inventory
+  * ArcGIS service URLs, resolved to the item that registers the service through a
+    prebuilt URL -> item index
+Edges use the crawler's convention: source requires target. References that don't resolve
+inside this inventory are kept as external edges (target = foreign item id, or the normalized
+service URL with type "service_url") so a multi-portal merge can resolve them later.
+"""
+import asyncio
+import json
+import re
+import time
+from urllib.parse import urlsplit
+
+from portal_client import PortalClient, PortalRequestError
+
+ITEM_ID_PATTERN = re.compile(r'(?<![0-9a-f])[0-9a-f]{32}(?![0-9a-f])')
+SERVICE_URL_PATTERN = re.compile(
+    r'https?://[^\s"\'<>\\]+?/(?:FeatureServer|MapServer|ImageServer|VectorTileServer|SceneServer|GeocodeServer|GPServer)'
+    r'(?:/\d+)?',
+    re.IGNORECASE,
+)
+# Only ids under item-reference keys count as external (bare 32-hex strings elsewhere may be anything)
+EXTERNAL_ID_PATTERN = re.compile(r'"(?:itemId|webmap|portalItemId|sourceItemId|mapId)":"([0-9a-f]{32})"')
+SERVICE_SUFFIX = re.compile(r'/(FeatureServer|MapServer|ImageServer|VectorTileServer|SceneServer|GeocodeServer|GPServer)(/\d+)?$', re.I)
+
+# Item types whose /data is a JSON document that can reference other items.
+# File items (CSV, PDF, File Geodatabase, ...) are skipped: their /data is the file itself.
+DATA_TYPES = {
+    "Web Map", "Web Scene", "Dashboard", "Web Experience", "Web Mapping Application", "StoryMap",
+    "Hub Site Application", "Hub Page", "Site Application", "Site Page", "Form", "QuickCapture Project",
+    "Workforce Project", "Insights Workbook", "Application", "Feature Collection", "Group Layer",
+    "Map Service", "Feature Service", "Vector Tile Service", "Image Service", "Scene Service",
+    "Web Experience Template", "Solution", "Operation View", "Survey123 Connect Form",
+}
+
+# Item types that publish a service; they win a shared URL over items that merely point at it
+SERVICE_TYPES = {
+    "Feature Service", "Map Service", "Image Service", "Vector Tile Service", "Scene Service",
+    "Geocoding Service", "Geoprocessing Service", "WMS", "WFS", "WMTS",
+}
+
+def normalize_service_url(url):
+    """Canonical key for a service URL: no scheme, query, trailing slash or layer index; lower case."""
+    if not url:
+        return None
+    parts = urlsplit(url.strip())
+    path = SERVICE_SUFFIX.sub(lambda m: "/" + m.group(1), parts.path.rstrip("/"))
+    return f"{parts.netloc}{path}".lower()
+
+def _registration_rank(iid, node):
+    """Service items first, then the oldest, then the lowest id (independent of search order)."""
+    created = node.get("created")
+    return (node.get("type") not in SERVICE_TYPES, created if created is not None else float("inf"), iid)
+
+def build_url_index(nodes):
+    """Map normalized service URL -> id of the item that registers it."""
+    index, ranks = {}, {}
+    for iid, node in nodes.items():
+        key = normalize_service_url(node.get("url"))
+        if key and SERVICE_SUFFIX.search(key):
+            # Several items can register one URL (a layer and its registered copies); pick the same one every run
+            rank = _registration_rank(iid, node)
+            if key not in ranks or rank < ranks[key]:
+                index[key], ranks[key] = iid, rank
+    return index
+
+def extract_references(item_id, text, known_ids, url_index):
+    """
+    References in one item's JSON text: (item ids in the inventory, foreign item ids, unresolved
+    normalized service URLs). Ids match directly, service URLs through the index.
+    """
+    refs = {m for m in ITEM_ID_PATTERN.findall(text) if m in known_ids}
+    foreign = {m for m in EXTERNAL_ID_PATTERN.findall(text) if m not in known_ids}
+    urls = set()
+    for url in SERVICE_URL_PATTERN.findall(text):
+        key = normalize_service_url(url)
+        target = url_index.get(key)
+        if target:
+            refs.add(target)
+        else:
+            urls.add(key)
+    refs.discard(item_id)
+    return refs, foreign, urls
+
+async def _fetch_all(client, item_ids, on_data):
+    async def one(iid):
+        try:
+            on_data(iid, await client.fetch_item_data(iid))
+        except PortalRequestError as e:
+            on_data(iid, None, str(e))
+    await asyncio.gather(*(one(iid) for iid in item_ids))
+
+def build_edges(gis, nodes, only=None, concurrency=20, rate=50.0, log=print):
+    """
+    Edge dicts for items in `only` (default: every node). Returns (edges, errors, client counters).
+    The URL index always covers the whole inventory, so a delta run resolves references
+    to unchanged items too.
+    """
+    start = time.time()
+    known_ids = set(nodes)
+    url_index = build_url_index(nodes)
+    sources = only if only is not None else nodes.keys()
+
+    edges, errors = [], {}
+    fetch_ids = []
+    for iid in sources:
+        node = nodes.get(iid)
+        if node is None:
+            continue
+        # The item's own URL can point at another item's service (e.g. a view or a registered layer)
+        own = url_index.get(normalize_service_url(node.get("url")))
+        if own and own != iid:
+            edges.append({"source": iid, "target": own, "type": "dependency"})
+        if node.get("type") in DATA_TYPES:
+            fetch_ids.append(iid)
+
+    def on_data(iid, data, error=None):
+        if error:
+            errors[iid] = error
+            return
+        if not data:
+            return
+        text = json.dumps(data, separators=(",", ":"))
+        refs, foreign, urls = extract_references(iid, text, known_ids, url_index)
+        urls.discard(normalize_service_url(nodes[iid].get("url")))  # a service describing itself
+        for target in refs | foreign:
+            edges.append({"source": iid, "target": target, "type": "dependency"})
+        for key in urls:
+            edges.append({"source": iid, "target": key, "type": "service_url"})
+
+    async def run():
+        async with PortalClient.from_gis(gis, concurrency=concurrency, rate=rate) as client:
+            await _fetch_all(client, fetch_ids, on_data)
+            return client.counters
+
+    counters = asyncio.run(run()) if fetch_ids else {"requests": 0, "retries": 0, "throttled": 0, "failures": 0, "bytes": 0}
+    unique = {(e["source"], e["target"]): e for e in edges}
+    external = sum(1 for e in unique.values() if e["target"] not in known_ids)
+    log(f"Native engine: {len(unique)} edges ({external} external) from {len(fetch_ids)} item data documents "
+        f"({counters['requests']} requests, {counters['retries']} retries) in {time.time() - start:.2f}s")
+    return list(unique.values()), errors, counters
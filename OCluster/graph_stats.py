@@ -0,0 +1,153 @@
+"""
+Dependency metrics for crawler.py in a single pass over the edge list.
+
+Strongly connected components are collapsed (iterative Tarjan, so deep chains don't hit the
+recursion limit) and reachability is propagated over the condensed DAG in topological order
+with Python ints as bitsets. Counts are exact: an item in a cycle reaches the rest of its
+cycle plus everything downstream of it, never itself.
+"""
+import heapq
+
+def _popcount(x):
+    return x.bit_count() if hasattr(x, "bit_count") else bin(x).count("1")
+
+def index_graph(node_ids, edges):
+    """Dense ids and deduplicated successor lists (source requires target); edge endpoints outside node_ids are kept."""
+    ids = list(node_ids)
+    index = {iid: i for i, iid in enumerate(ids)}
+    for e in edges:
+        for iid in (e["source"], e["target"]):
+            if iid not in index:
+                index[iid] = len(ids)
+                ids.append(iid)
+    succ = [set() for _ in ids]
+    for e in edges:
+        s, t = index[e["source"]], index[e["target"]]
+        if s != t:
+            succ[s].add(t)
+    return ids, index, [list(s) for s in succ]
+
+def strongly_connected_components(succ):
+    """Iterative Tarjan. Returns (component of each vertex, components in reverse topological order)."""
+    n = len(succ)
+    order = [-1] * n
+    low = [0] * n
+    on_stack = [False] * n
+    comp = [-1] * n
+    stack, components = [], []
+    counter = 0
+
+    for root in range(n):
+        if order[root] != -1:
+            continue
+        work = [(root, 0)]
+        while work:
+            v, pos = work[-1]
+            if pos == 0:
+                order[v] = low[v] = counter
+                counter += 1
+                stack.append(v)
+                on_stack[v] = True
+            children = succ[v]
+            while pos < len(children):
+                w = children[pos]
+                pos += 1
+                if order[w] == -1:
+                    work[-1] = (v, pos)
+                    work.append((w, 0))
+                    break
+                if on_stack[w]:
+                    low[v] = min(low[v], order[w])
+            else:
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    low[parent] = min(low[parent], low[v])
+                if low[v] == order[v]:
+                    members = []
+                    while True:
+                        w = stack.pop()
+                        on_stack[w] = False
+                        comp[w] = len(components)
+                        members.append(w)
+                        if w == v:
+                            break
+                    components.append(members)
+    return comp, components
+
+def _reach_counts(order, components, comp_adj):
+    """
+    Vertices reachable from each component, excluding the component itself. `order` must visit
+    every component after all of its comp_adj neighbours (a topological order of the DAG).
+    """
+    waiting = [0] * len(components)
+    for targets in comp_adj:
+        for d in targets:
+            waiting[d] += 1
+    reach = [0] * len(components)
+    counts = [0] * len(components)
+    offset = 0
+    for c in order:
+        bits = 0
+        for d in comp_adj[c]:
+            bits |= reach[d]
+            waiting[d] -= 1
+            if not waiting[d]:
+                reach[d] = 0  # last consumer done: drop the bitset to bound memory on long chains
+        if bits:
+            counts[c] = _popcount(bits)
+        if waiting[c]:
+            # Only components someone reaches need bits; each gets a contiguous run in visiting order
+            size = len(components[c])
+            reach[c] = bits | (((1 << size) - 1) << offset)
+            offset += size
+    return counts
+
+def dependency_stats(node_ids, edges):
+    """{id: immediate/recursive dependency and dependent counts} for every id in node_ids."""
+    node_ids = list(node_ids)
+    ids, index, succ = index_graph(node_ids, edges)
+    in_degree = [0] * len(ids)
+    for targets in succ:
+        for t in targets:
+            in_degree[t] += 1
+
+    # Condensed DAG: component successor sets and predecessor lists
+    comp, components = strongly_connected_components(succ)
+    down = []
+    up = [[] for _ in components]
+    for c, members in enumerate(components):
+        if len(members) == 1:
+            targets = {comp[t] for t in succ[members[0]]}
+        else:
+            targets = {comp[t] for v in members for t in succ[v]}
+            targets.discard(c)
+        down.append(targets)
+        for d in targets:
+            up[d].append(c)
+
+    # Tarjan emits sinks first: forward order for dependencies, reversed for dependents
+    requires = _reach_counts(range(len(components)), components, down)
+    required_by = _reach_counts(range(len(components) - 1, -1, -1), components, up)
+
+    stats = {}
+    for iid in node_ids:
+        v = index[iid]
+        c = comp[v]
+        cycle = len(components[c]) - 1
+        stats[iid] = {
+            "immediate_dependencies": len(succ[v]),
+            "immediate_dependents": in_degree[v],
+            "total_recursive_dependencies": requires[c] + cycle,
+            "total_recursive_dependents": required_by[c] + cycle,
+        }
+    return stats
+
+def high_risk_items(nodes, stats, limit=50):
+    """Top `limit` items by recursive dependents (ties keep inventory order)."""
+    candidates = (
+        {"id": iid, "title": nodes[iid]["label"], "type": nodes[iid]["type"],
+         "dependents_count": s["total_recursive_dependents"]}
+        for iid, s in stats.items() if s["total_recursive_dependents"] > 0
+    )
+    return heapq.nlargest(limit, candidates, key=lambda x: x["dependents_count"])
@@ -0,0 +1,431 @@
+"""
+Append-only run history for the crawler.
+
+Every crawl is recorded as a delta against the previous one: new nodes in full, changed nodes with
+only their changed columns filled in (a bitmask per row says which), removed ids, and added / removed
+edges, all as compressed snapshot columns. Counters that move on most items every run (COUNTERS,
+i.e. views) are kept out of that comparison: an item's count is only re-recorded once it leaves the
+log bucket of its last recorded value, so history returns it to within a factor of 2 ** COUNTER_STEP
+(exact at checkpoints) and a crawl where only view counts ticked up writes a near-empty delta.
+A full compressed snapshot is written when the deltas since the last one add up to more than
+CHECKPOINT_RATIO times its size, so checkpoints cost at most about as much as the deltas they
+follow and rebuilding a run reads at most about (1 + CHECKPOINT_RATIO) snapshots' worth of data.
+Storage therefore grows with what changed, plus a fixed amount per run that does not depend on
+inventory size.
+  runs.jsonl               one line per run: number, time, counts of what changed
+  head.npz                 the latest run in full (what the next run is diffed against) plus the
+                           counter values history holds for it (recorded_<counter>)
+  checkpoints/run_N.npz    full snapshot columns + CSR edges
+  deltas/run_N.npz         changes from run N - 1; <counter>_ids / <counter>_values for re-recorded counters
+The .npz files hold the same columns as snapshot.py (snapshot.encode), so any of them opens
+as a snapshot.Snapshot.
+
+    store = history.HistoryStore("Inventory_history")
+    store.record(graph_data)                    # crawler.py does this after each run
+    store.blast_radius_growth(since="30d")      # items whose recursive dependents grew
+    python history.py size-by-owner --since 2026-09-01
+"""
+import argparse
+import json
+import math
+import os
+from datetime import datetime, timedelta
+
+import numpy as np
+
+import snapshot
+
+# ================= CONFIGURATION =================
+HISTORY_DIR = "Inventory_history"
+CHECKPOINT_RATIO = 1.0          # Full snapshot once the deltas since the last one outgrow this fraction of its size
+COUNTER_STEP = 0.25             # Counters are re-recorded after moving one log2 step (2 ** 0.25: ~19%)
+# Columns compared by diff() when none are given ("views" is left out: it changes on nearly every item every run)
+DIFF_COLUMNS = ("label", "owner", "type", "access", "url", "size", "modified", "is_abandoned",
+                "total_recursive_dependents", "total_recursive_dependencies")
+# =================================================
+
+# Volatile per-node counters, stored apart from the structural columns (see module docstring)
+COUNTERS = ("views",)
+# Per-node fields tracked for changes; a delta row's bitmask has bit k set when COLUMNS[k] changed
+COLUMNS = tuple(k for k in snapshot.NODE_KEYS if k not in ("id", *COUNTERS)) + snapshot.DEPENDENCY_COLUMNS + ("extras",)
+BITS = {c: 1 << k for k, c in enumerate(COLUMNS)}
+ALL_BITS = (1 << len(COLUMNS)) - 1  # a new node
+
+def _flat(node):
+    """Node dict -> {column: value} over COLUMNS (dependency_info flattened, extra keys grouped)."""
+    row = {k: node.get(k) for k in snapshot.NODE_KEYS if k != "id"}
+    info = node.get("dependency_info") or {}
+    row.update((k, info.get(k)) for k in snapshot.DEPENDENCY_COLUMNS)
+    row["extras"] = {k: v for k, v in node.items() if k not in snapshot.KNOWN_KEYS}
+    return row
+
+def _partial(node_id, row, columns):
+    """Node dict holding only `columns`; the rest encode as empty values and compress away."""
+    node = {"id": node_id}
+    for c in columns:
+        if c in snapshot.DEPENDENCY_COLUMNS:
+            node.setdefault("dependency_info", {})[c] = row[c]
+        elif c == "extras":
+            node.update(row[c])
+        else:
+            node[c] = row[c]
+    return node
+
+def _bucket(value):
+    """Log bucket of a counter; a recorded value is kept while the live one stays in its bucket."""
+    return -1 if value is None else int(math.log2(max(value, 0) + 1) / COUNTER_STEP)
+
+def _int_array(values):
+    return np.array([snapshot.NULL_INT if v is None else int(v) for v in values], dtype=np.int64)
+
+def _int_values(array):
+    return [None if v == snapshot.NULL_INT else v for v in array.tolist()]
+
+def _write_npz(path, meta, arrays):
+    tmp = path + ".tmp.npz"
+    np.savez_compressed(tmp, meta=np.array(json.dumps(meta, separators=(",", ":"))), **arrays)
+    os.replace(tmp, path)
+
+def _read_npz(path):
+    """(meta, arrays) from a history .npz; arrays are decompressed on access."""
+    with np.load(path) as z:
+        arrays = {name: z[name] for name in z.files}
+    return json.loads(str(arrays.pop("meta"))), arrays
+
+def _id_array(ids):
+    ids = list(ids)
+    return np.array(ids, dtype=f"S{max((len(i) for i in ids), default=1)}")
+
+def _ids(array):
+    return [i.decode("ascii") for i in array.tolist()]
+
+def _edge_set(snap):
+    ids = snap.ids
+    indptr = snap.arrays["indptr"]
+    sources = np.repeat(np.arange(len(snap)), np.diff(indptr)).tolist()
+    return {(ids[s], ids[t]) for s, t in zip(sources, snap.arrays["indices"].tolist())}
+
+def _parse_when(when):
+    """datetime from a datetime, an ISO date/time string, or "<n>d" (n days ago)."""
+    if isinstance(when, datetime):
+        return when
+    if isinstance(when, str) and when.endswith("d") and when[:-1].isdigit():
+        return datetime.now() - timedelta(days=int(when[:-1]))
+    return datetime.fromisoformat(when)
+
+class HistoryStore:
+    """One history directory; runs are numbered from 1 in the order they were recorded."""
+
+    def __init__(self, path=HISTORY_DIR, checkpoint_ratio=CHECKPOINT_RATIO):
+        self.path = path
+        self.checkpoint_ratio = checkpoint_ratio
+        self.index_file = os.path.join(path, "runs.jsonl")
+
+    def _file(self, kind, run):
+        return os.path.join(self.path, kind, f"run_{run:06d}.npz")
+
+    def runs(self):
+        """Run records, oldest first."""
+        if not os.path.exists(self.index_file):
+            return []
+        with open(self.index_file, "r", encoding="utf-8") as f:
+            return [json.loads(line) for line in f if line.strip()]
+
+    # ---- writing ----
+    def record(self, graph_data, started=None):
+        """Append one run (crawler graph_data) and return its run record."""
+        os.makedirs(os.path.join(self.path, "checkpoints"), exist_ok=True)
+        os.makedirs(os.path.join(self.path, "deltas"), exist_ok=True)
+        runs = self.runs()
+        run = runs[-1]["run"] + 1 if runs else 1
+        summary = graph_data.get("summary", {})
+        started = started or summary.get("crawl_started") or summary.get("analysis_date") or datetime.now().isoformat()
+
+        # Round-trip through the snapshot encoding so old and new nodes compare field for field
+        meta, arrays = snapshot.encode(graph_data)
+        current = snapshot.Snapshot(meta, arrays)
+        record = {"run": run, "started": started, "items": len(current), "relationships": meta["edge_count"]}
+
+        head_file = os.path.join(self.path, "head.npz")
+        recorded = None
+        if runs and os.path.exists(head_file):
+            previous = snapshot.Snapshot(*_read_npz(head_file))
+            recorded = self._write_delta(run, previous, current, graph_data, record)
+        record["checkpoint"] = recorded is None or self._chain_bytes(runs, run) > self.checkpoint_ratio * os.path.getsize(
+            self._file("checkpoints", self._last_checkpoint(runs)))
+        if record["checkpoint"]:
+            _write_npz(self._file("checkpoints", run), meta, arrays)
+            recorded = {c: current.column(c) for c in COUNTERS}
+        _write_npz(head_file, meta, {**arrays, **{f"recorded_{c}": _int_array(recorded[c]) for c in COUNTERS}})
+
+        with open(self.index_file, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record, separators=(",", ":")) + "\n")
+        return record
+
+    @staticmethod
+    def _last_checkpoint(runs):
+        return max(r["run"] for r in runs if r.get("checkpoint"))
+
+    def _chain_bytes(self, runs, run):
+        """Bytes of the deltas written since the last checkpoint, up to and including `run`."""
+        first = self._last_checkpoint(runs) + 1
+        return sum(os.path.getsize(self._file("deltas", r)) for r in range(first, run + 1))
+
+    def _write_delta(self, run, previous, current, graph_data, record):
+        """Write deltas/run_N.npz, add its counts to `record`; return the counter values now on record."""
+        old = {iid: _flat(n) for iid, n in zip(previous.ids, previous.nodes())}
+        upserted, masks = [], []
+        column_changes = dict.fromkeys(COLUMNS, 0)
+        for node in current.nodes():
+            before = old.pop(node["id"], None)
+            if before is None:
+                upserted.append(node)
+                masks.append(ALL_BITS)
+                continue
+            row = _flat(node)
+            changed = [c for c in COLUMNS if before[c] != row[c]]
+            if changed:
+                upserted.append(_partial(node["id"], row, changed))
+                masks.append(sum(BITS[c] for c in changed))
+                for c in changed:
+                    column_changes[c] += 1
+        removed = list(old)
+
+        # Counters: only items that are new or left the bucket of their last recorded value
+        counters, recorded = {}, {}
+        for c in COUNTERS:
+            key = f"recorded_{c}"
+            last = dict(zip(previous.ids, _int_values(previous.arrays[key]) if key in previous.arrays
+                            else previous.column(c)))
+            moved, recorded[c] = [], []
+            for iid, value in zip(current.ids, current.column(c)):
+                if iid in last and _bucket(last[iid]) == _bucket(value):
+                    value = last[iid]
+                else:
+                    moved.append((iid, value))
+                recorded[c].append(value)
+            counters[f"{c}_ids"] = _id_array(iid for iid, _ in moved)
+            counters[f"{c}_values"] = _int_array(v for _, v in moved)
+            record[f"{c}_recorded"] = len(moved)
+
+        old_edges, new_edges = _edge_set(previous), _edge_set(current)
+        added_edges, removed_edges = sorted(new_edges - old_edges), sorted(old_edges - new_edges)
+
+        meta, arrays = snapshot.encode({
+            "summary": graph_data.get("summary", {}), "high_risk_items": graph_data.get("high_risk_items", []),
+            "nodes": upserted, "edges": [], "external_edges": graph_data.get("external_edges", []),
+        })
+        arrays.update({
+            "mask": np.array(masks, dtype=np.int64),
+            "removed": _id_array(removed),
+            "edges_added_source": _id_array(s for s, _ in added_edges),
+            "edges_added_target": _id_array(t for _, t in added_edges),
+            "edges_removed_source": _id_array(s for s, _ in removed_edges),
+            "edges_removed_target": _id_array(t for _, t in removed_edges),
+            **counters,
+        })
+        _write_npz(self._file("deltas", run), meta, arrays)
+        added = masks.count(ALL_BITS)
+        record.update({"added": added, "changed": len(upserted) - added, "removed": len(removed),
+                       "edges_added": len(added_edges), "edges_removed": len(removed_edges),
+                       "changed_columns": {c: n for c, n in column_changes.items() if n}})
+        return recorded
+
+    # ---- reading ----
+    def run_at(self, when):
+        """Run number for an int run, or the last run started at or before a date ("2026-09-01", "30d")."""
+        runs = self.runs()
+        if not runs:
+            raise ValueError(f"No runs recorded in {self.path}")
+        if when is None:
+            return runs[-1]["run"]
+        if isinstance(when, int):
+            return when
+        cutoff = _parse_when(when)
+        earlier = [r["run"] for r in runs if datetime.fromisoformat(r["started"]) <= cutoff]
+        return earlier[-1] if earlier else runs[0]["run"]
+
+    def _replay(self, run):
+        """(checkpoint Snapshot, delta (meta, arrays) list) that rebuild `run`."""
+        runs = {r["run"]: r for r in self.runs()}
+        if run not in runs:
+            raise KeyError(f"run {run}")
+        base = max(r for r, rec in runs.items() if rec.get("checkpoint") and r <= run)
+        deltas = [_read_npz(self._file("deltas", r)) for r in range(base + 1, run + 1)]
+        return snapshot.Snapshot(*_read_npz(self._file("checkpoints", base))), deltas
+
+    def state(self, run=None, columns=DIFF_COLUMNS):
+        """{item id: {column: value}} as of `run` (default: latest); only the asked-for columns are decoded.
+
+        COUNTERS columns come back as last recorded (within 2 ** COUNTER_STEP of the crawled value).
+        """
+        base, deltas = self._replay(self.run_at(run))
+        values = [base.column(c) for c in columns]
+        rows = {iid: dict(zip(columns, row)) for iid, row in zip(base.ids, zip(*values) if columns else ((),) * len(base))}
+        structural = [c for c in columns if c in BITS]
+        for meta, arrays in deltas:
+            for iid in _ids(arrays["removed"]):
+                rows.pop(iid, None)
+            upserted = snapshot.Snapshot(meta, arrays)
+            values = {c: upserted.column(c) for c in structural}
+            for i, (iid, mask) in enumerate(zip(upserted.ids, arrays["mask"].tolist())):
+                row = rows.setdefault(iid, {})
+                row.update((c, values[c][i]) for c in structural if mask & BITS[c])
+            for c in columns:
+                if c in COUNTERS:
+                    for iid, value in zip(_ids(arrays[f"{c}_ids"]), _int_values(arrays[f"{c}_values"])):
+                        rows[iid][c] = value
+        return rows
+
+    def edges(self, run=None):
+        """Set of (source, target) edges as of `run`."""
+        base, deltas = self._replay(self.run_at(run))
+        edges = _edge_set(base)
+        for _, arrays in deltas:
+            edges -= set(zip(_ids(arrays["edges_removed_source"]), _ids(arrays["edges_removed_target"])))
+            edges |= set(zip(_ids(arrays["edges_added_source"]), _ids(arrays["edges_added_target"])))
+        return edges
+
+    def graph_data(self, run=None):
+        """Full nodes and edges of a past run, in the crawler's schema."""
+        run = self.run_at(run)
+        base, deltas = self._replay(run)
+        nodes = {n["id"]: n for n in base.nodes()}
+        summary, high_risk, external = base.summary, base.high_risk_items, base.external_edges()
+        for meta, arrays in deltas:
+            for iid in _ids(arrays["removed"]):
+                nodes.pop(iid, None)
+            upserted = snapshot.Snapshot(meta, arrays)
+            for i, (iid, mask) in enumerate(zip(upserted.ids, arrays["mask"].tolist())):
+                if mask == ALL_BITS:
+                    nodes[iid] = upserted.node(i)
+                    continue
+                node = nodes[iid]
+                for c in COLUMNS:
+                    if not mask & BITS[c]:
+                        continue
+                    if c in snapshot.DEPENDENCY_COLUMNS:
+                        node.setdefault("dependency_info", {})[c] = upserted.value(c, i)
+                    elif c == "extras":
+                        for k in [k for k in node if k not in snapshot.KNOWN_KEYS]:
+                            del node[k]
+                        node.update(meta["extras"].get(str(i), {}))
+                    else:
+                        node[c] = upserted.value(c, i)
+            for c in COUNTERS:
+                for iid, value in zip(_ids(arrays[f"{c}_ids"]), _int_values(arrays[f"{c}_values"])):
+                    nodes[iid][c] = value
+            summary, high_risk, external = upserted.summary, upserted.high_risk_items, upserted.external_edges()
+        return {
+            "summary": summary,
+            "high_risk_items": high_risk,
+            "nodes": list(nodes.values()),
+            "edges": [{"source": s, "target": t, "type": "dependency"} for s, t in sorted(self.edges(run))],
+            "external_edges": external,
+        }
+
+    # ---- queries ----
+    def diff(self, since, until=None, columns=DIFF_COLUMNS):
+        """Items added / removed / changed (per column: [old, new]) and edges added / removed between two runs."""
+        a, b = self.run_at(since), self.run_at(until)
+        old, new = self.state(a, columns), self.state(b, columns)
+        changed = {}
+        for iid in old.keys() & new.keys():
+            cols = {c: [old[iid][c], new[iid][c]] for c in columns if old[iid][c] != new[iid][c]}
+            if cols:
+                changed[iid] = cols
+        old_edges, new_edges = self.edges(a), self.edges(b)
+        return {
+            "from_run": a, "to_run": b,
+            "added": sorted(new.keys() - old.keys()),
+            "removed": sorted(old.keys() - new.keys()),
+            "changed": changed,
+            "edges_added": sorted(new_edges - old_edges),
+            "edges_removed": sorted(old_edges - new_edges),
+        }
+
+    def blast_radius_growth(self, since, until=None, min_growth=1, limit=50):
+        """Items whose recursive dependent count grew by at least min_growth (new items count from 0)."""
+        columns = ("label", "type", "owner", "total_recursive_dependents")
+        a, b = self.run_at(since), self.run_at(until)
+        old, new = self.state(a, columns), self.state(b, columns)
+        rows = []
+        for iid, row in new.items():
+            before = (old.get(iid) or {}).get("total_recursive_dependents") or 0
+            after = row["total_recursive_dependents"] or 0
+            if after - before >= min_growth:
+                rows.append({"id": iid, "title": row["label"], "type": row["type"], "owner": row["owner"],
+                             "dependents_before": before, "dependents_after": after, "growth": after - before,
+                             "new": iid not in old})
+        rows.sort(key=lambda r: r["growth"], reverse=True)
+        return {"from_run": a, "to_run": b, "count": len(rows), "items": rows[:limit]}
+
+    def size_growth_by_owner(self, since, until=None):
+        """Per owner: item count and total size (bytes) at both runs, largest growth first."""
+        a, b = self.run_at(since), self.run_at(until)
+        totals = {}
+        for slot, state in ((0, self.state(a, ("owner", "size"))), (1, self.state(b, ("owner", "size")))):
+            for row in state.values():
+                entry = totals.setdefault(row["owner"], [[0, 0], [0, 0]])
+                entry[slot][0] += 1
+                entry[slot][1] += row["size"] or 0
+        rows = [{"owner": owner, "items_before": before[0], "items_after": after[0],
+                 "size_before": before[1], "size_after": after[1], "growth": after[1] - before[1]}
+                for owner, (before, after) in totals.items()]
+        rows.sort(key=lambda r: r["growth"], reverse=True)
+        return {"from_run": a, "to_run": b, "owners": rows}
+
+    def storage_bytes(self):
+        """Bytes on disk per file kind (checkpoints, deltas, head, index)."""
+        usage = {}
+        for root, _, files in os.walk(self.path):
+            kind = os.path.basename(root) if root != self.path else "head"
+            for name in files:
+                key = "index" if name == "runs.jsonl" else kind
+                usage[key] = usage.get(key, 0) + os.path.getsize(os.path.join(root, name))
+        return usage
+
+def main():
+    parser = argparse.ArgumentParser(description="Query the crawler's run history.")
+    parser.add_argument("--path", default=HISTORY_DIR, help="History directory (default: %(default)s)")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("runs", help="List recorded runs and storage use")
+    p = sub.add_parser("record", help="Append a graph JSON (e.g. an old Inventory_graph.json) as a run")
+    p.add_argument("graph_json")
+    p.add_argument("--started", help="Run time, if the file's summary has none")
+    p = sub.add_parser("diff", help="What changed between two runs")
+    p.add_argument("since", help="Run number, date (2026-09-01) or days ago (30d)")
+    p.add_argument("until", nargs="?", help="Default: latest run")
+    p = sub.add_parser("blast-radius", help="Items whose recursive dependents grew")
+    p.add_argument("--since", default="30d")
+    p.add_argument("--until")
+    p.add_argument("--min-growth", type=int, default=1)
+    p.add_argument("--limit", type=int, default=50)
+    p = sub.add_parser("size-by-owner", help="Size growth per owner")
+    p.add_argument("--since", default="30d")
+    p.add_argument("--until")
+    args = parser.parse_args()
+
+    def when(value):
+        return int(value) if value is not None and value.isdigit() else value
+
+    store = HistoryStore(args.path)
+    if args.command == "runs":
+        for r in store.runs():
+            print(f"{r['run']:>5}  {r['started'][:19]}  items {r['items']:>7}  +{r.get('added', 0)} -{r.get('removed', 0)} "
+                  f"~{r.get('changed', 0)}  views {r.get('views_recorded', 0)}  edges +{r.get('edges_added', 0)} -{r.get('edges_removed', 0)}"
+                  f"{'  [checkpoint]' if r.get('checkpoint') else ''}")
+        print(json.dumps(store.storage_bytes()))
+    elif args.command == "record":
+        with open(args.graph_json, "r", encoding="utf-8") as f:
+            print(json.dumps(store.record(json.load(f), started=args.started)))
+    elif args.command == "diff":
+        print(json.dumps(store.diff(when(args.since), when(args.until)), indent=2))
+    elif args.command == "blast-radius":
+        print(json.dumps(store.blast_radius_growth(when(args.since), when(args.until), args.min_growth, args.limit),
+                         indent=2))
+    else:
+        print(json.dumps(store.size_growth_by_owner(when(args.since), when(args.until)), indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+"""
+Lightweight run instrumentation for crawler.py.
+
+Phases are timed with context-manager spans, work is tallied with counters (API calls,
+retries, bytes, cache hits, ...), and every run appends one JSON line to a metrics file so
+phase timings can be compared across runs. cProfile and tracemalloc can be switched on for
+a run without touching the phase code.
+
+    metrics.start(profile=False, trace_memory=False)
+    with metrics.span("search") as s:
+        ...
+        ok(f"done in {s.elapsed:.2f}s")
+    metrics.count("api_calls", 3)
+    metrics.finish("crawler_metrics.jsonl", mode="full")
+"""
+import argparse
+import cProfile
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+
+try:
+    import resource  # peak RSS (not available on Windows)
+except ImportError:
+    resource = None
+
+PROFILE_TOP = 15  # functions kept in the JSONL record when profiling
+
+class Span:
+    """Elapsed time of a running (or finished) phase."""
+
+    def __init__(self, name):
+        self.name = name
+        self.started = time.perf_counter()
+        self.ended = None
+
+    @property
+    def elapsed(self):
+        return (self.ended or time.perf_counter()) - self.started
+
+class Metrics:
+    """Spans and counters for one run; safe to update from worker threads."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self, profile=False, trace_memory=False, profile_file=None):
+        self.started = datetime.now()
+        self.clock = time.perf_counter()
+        self.spans = {}
+        self.counters = {}
+        self.profile_file = profile_file
+        self.profiler = cProfile.Profile() if profile else None
+        self.trace_memory = trace_memory
+        if self.profiler:
+            self.profiler.enable()
+        if trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    @contextmanager
+    def span(self, name):
+        """Time a phase; repeated spans with the same name accumulate."""
+        current = Span(name)
+        try:
+            yield current
+        finally:
+            current.ended = time.perf_counter()
+            with self.lock:
+                entry = self.spans.setdefault(name, {"seconds": 0.0, "calls": 0})
+                entry["seconds"] += current.elapsed
+                entry["calls"] += 1
+
+    def count(self, name, value=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def add_counters(self, counters, names=None):
+        """Fold a counters dict (e.g. PortalClient.counters) into the run counters."""
+        for name, value in counters.items():
+            key = (names or {}).get(name, name)
+            self.count(key, value)
+
+    def _profile_summary(self):
+        self.profiler.disable()
+        if self.profile_file:
+            self.profiler.dump_stats(self.profile_file)
+        top = []
+        for (filename, line, func), (_, calls, _, cumulative, _) in pstats.Stats(self.profiler).stats.items():
+            top.append((cumulative, f"{os.path.basename(filename)}:{line}({func})", calls))
+        top.sort(reverse=True)
+        return [{"function": f, "cumulative_s": round(c, 3), "calls": n} for c, f, n in top[:PROFILE_TOP]]
+
+    def record(self, **meta):
+        """The run record: timings, counters, memory and any extra fields."""
+        record = {
+            "started": self.started.isoformat(timespec="seconds"),
+            "finished": datetime.now().isoformat(timespec="seconds"),
+            "total_seconds": round(time.perf_counter() - self.clock, 3),
+            **meta,
+            "spans": {name: {"seconds": round(v["seconds"], 3), "calls": v["calls"]}
+                      for name, v in self.spans.items()},
+            "counters": dict(self.counters),
+        }
+        if self.trace_memory and tracemalloc.is_tracing():
+            record["python_peak_mb"] = round(tracemalloc.get_traced_memory()[1] / 2**20, 1)
+            tracemalloc.stop()
+        if resource is not None:
+            # ru_maxrss is KiB on Linux, bytes on macOS
+            scale = 2**20 if sys.platform == "darwin" else 2**10
+            record["peak_rss_mb"] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale, 1)
+        if self.profiler:
+            record["profile"] = self._profile_summary()
+            if self.profile_file:
+                record["profile_file"] = self.profile_file
+            self.profiler = None
+        return record
+
+    def finish(self, path, **meta):
+        """Append this run's record to a JSONL file and return it."""
+        record = self.record(**meta)
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record, separators=(",", ":")) + "\n")
+        return record
+
+def load_runs(path):
+    """All run records from a metrics JSONL file (oldest first)."""
+    if not os.path.exists(path):
+        return []
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare phase timings of recent crawler runs.")
+    parser.add_argument("path", nargs="?", default="crawler_metrics.jsonl", help="Metrics JSONL file")
+    parser.add_argument("--last", type=int, default=5, help="Number of most recent runs to show")
+    args = parser.parse_args()
+
+    runs = load_runs(args.path)[-args.last:]
+    if not runs:
+        print(f"No runs in {args.path}")
+        return
+    phases = list(dict.fromkeys(name for run in runs for name in run["spans"]))
+    print(f"{'phase':<16}" + "".join(f"{run['started'][5:16]:>14}" for run in runs))
+    for name in phases + ["total"]:
+        cells = []
+        for run in runs:
+            seconds = run["total_seconds"] if name == "total" else run["spans"].get(name, {}).get("seconds")
+            cells.append(f"{seconds:>13.1f}s" if seconds is not None else f"{'-':>14}")
+        print(f"{name:<16}" + "".join(cells))
+    for key in sorted({k for run in runs for k in run["counters"]}):
+        print(f"{key:<16}" + "".join(f"{run['counters'].get(key, '-'):>14}" for run in runs))
+
+# Module-level instance used by the crawler and its helpers
+_current = Metrics()
+start = _current.reset
+span = _current.span
+count = _current.count
+add_counters = _current.add_counters
+record = _current.record
+finish = _current.finish
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,397 @@
+"""
+Local stand-in for the portal sharing/rest API.
+
+Serves search pages, item JSON and item data from an in-memory inventory, with optional
+throttling (HTTP 429 + Retry-After) and random 5xx errors, so the crawler's REST layer can
+be exercised without a live portal.
+
+    python mock_portal.py --items 2000 --rate 100 --error-rate 0.02
+    # -> http://127.0.0.1:8765/sharing/rest/
+
+    with MockPortal(make_items(500), rate=50) as portal:
+        ...  # portal.rest_url
+
+synthetic_org() builds a realistic inventory (layers -> web maps -> apps, with item data to
+parse) and FakeGIS lets crawler.py run against the server unchanged; see bench.py.
+"""
+import argparse
+import json
+import random
+import re
+import threading
+import time
+import urllib.request
+import uuid
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from urllib.parse import parse_qs, urlencode, urlparse
+
+ITEM_PATH = re.compile(r"^/sharing/rest/content/items/([0-9a-f]{32})(/data)?$")
+RANGE_CLAUSE = re.compile(r'^(\w+):\[(\d+) TO (\d+)\]$')
+FIELD_CLAUSE = re.compile(r'^(\w+):"?([^"]*)"?$')
+
+def make_items(count, owners=5, seed=0):
+    """Simple flat inventory: item info dicts keyed by id (see synthetic_org for a realistic one)."""
+    rng = random.Random(seed)
+    types = ["Feature Service", "Web Map", "Dashboard", "Web Experience", "CSV"]
+    items = {}
+    for idx in range(count):
+        item_id = uuid.UUID(int=rng.getrandbits(128)).hex
+        items[item_id] = {
+            "id": item_id,
+            "title": f"Item {idx}",
+            "type": rng.choice(types),
+            "owner": f"user{idx % owners}",
+            "orgId": "MOCKORG",
+            "numViews": rng.randint(0, 5000),
+            "access": rng.choice(["private", "org", "public"]),
+            "url": None,
+            "created": 1600000000000 + idx * 1000,
+            "modified": 1600000000000 + idx * 1000,
+            "size": rng.choice([-1, rng.randint(1000, 10_000_000)]),
+            "tags": [],
+            "typeKeywords": [],
+        }
+    return items
+
+def _split_top(query, sep):
+    """Split on a separator outside parentheses and quotes."""
+    parts, depth, quoted, start = [], 0, False, 0
+    i = 0
+    while i < len(query):
+        ch = query[i]
+        if ch == '"':
+            quoted = not quoted
+        elif not quoted and ch == '(':
+            depth += 1
+        elif not quoted and ch == ')':
+            depth -= 1
+        elif not quoted and depth == 0 and query.startswith(sep, i):
+            parts.append(query[start:i])
+            i += len(sep)
+            start = i
+            continue
+        i += 1
+    parts.append(query[start:])
+    return [p.strip() for p in parts if p.strip()]
+
+def compile_query(query):
+    """
+    Predicate for the subset of portal search syntax the crawler uses (AND / OR / NOT,
+    field:value, ranges). Parsed once per query so large inventories can be scanned quickly.
+    """
+    query = query.strip()
+    if not query or query == "*":
+        return lambda info: True
+    ands = _split_top(query, " AND ")
+    if len(ands) > 1:
+        parts = [compile_query(q) for q in ands]
+        return lambda info: all(p(info) for p in parts)
+    ors = _split_top(query, " OR ")
+    if len(ors) > 1:
+        parts = [compile_query(q) for q in ors]
+        return lambda info: any(p(info) for p in parts)
+    if query.startswith("(") and query.endswith(")"):
+        return compile_query(query[1:-1])
+    if query.startswith("NOT "):
+        inner = compile_query(query[4:])
+        return lambda info: not inner(info)
+
+    m = RANGE_CLAUSE.match(query)
+    if m:
+        field, low, high = m.group(1), int(m.group(2)), int(m.group(3))
+        field = "created" if field == "uploaded" else field  # search's uploaded is the item's created
+        return lambda info: low <= (info.get(field) or 0) <= high
+    m = FIELD_CLAUSE.match(query)
+    if m:
+        field, value = m.groups()
+        if field == "orgid":
+            return lambda info: info.get("orgId") == value
+        value = value.lower()
+        return lambda info: str(info.get(field, "")).lower() == value
+    text = query.lower()
+    return lambda info: text in str(info.get("title", "")).lower()
+
+def matches(query, info):
+    """Evaluate a search query against one item info dict."""
+    return compile_query(query)(info)
+
+def synthetic_org(count, seed=0, org_id="MOCKORG"):
+    """
+    Realistic inventory shaped like content_graph.json: hosted feature layers, web maps that
+    reference them (by item id and by service URL), and dashboards / experiences / apps built
+    on the maps, plus file items and unused content. Returns (items, data) for MockPortal.
+    """
+    rng = random.Random(seed)
+    owners = [f"{dept}_{role}" for dept in ("GIS", "PLAN", "UTIL", "PARKS", "TAX", "ENV", "EM", "REC", "TRANS", "CORP")
+              for role in ("Admin", "Staff")]
+    owners += [f"user{i}" for i in range(max(0, count // 400 - len(owners)))]
+    mix = [("Feature Service", 0.15), ("Web Map", 0.25), ("Dashboard", 0.15), ("Web Experience", 0.15),
+           ("Web Mapping Application", 0.15), ("CSV", 0.08), ("PDF", 0.07)]
+    types = rng.choices([t for t, _ in mix], weights=[w for _, w in mix], k=count)
+
+    items, data = {}, {}
+    by_type = {}
+    for idx, item_type in enumerate(types):
+        item_id = uuid.UUID(int=rng.getrandbits(128)).hex
+        owner = rng.choice(owners)
+        created = 1600000000000 + idx * 60_000
+        info = {
+            "id": item_id,
+            "title": f"{owner.split('_')[0]} {item_type} {idx}",
+            "type": item_type,
+            "owner": owner,
+            "orgId": org_id,
+            "numViews": int(rng.paretovariate(1.2) * 50),
+            "access": rng.choice(["private", "org", "org", "public"]),
+            "url": None,
+            "created": created,
+            "modified": created + rng.randint(0, 10**9),
+            # Hosted services usually report -1 in search, which sends them to size enrichment
+            "size": -1 if item_type == "Feature Service" else rng.randint(1_000, 5_000_000),
+            "tags": rng.sample(["roads", "parcels", "water", "parks", "zoning", "transit", "public"], 2),
+            "typeKeywords": [],
+        }
+        if item_type == "Feature Service":
+            info["url"] = f"https://services.mock.example/{org_id}/arcgis/rest/services/Layer_{idx}/FeatureServer"
+        items[item_id] = info
+        by_type.setdefault(item_type, []).append(item_id)
+
+    layers = by_type.get("Feature Service", [])
+    maps = by_type.get("Web Map", [])
+    # Popular layers and maps get reused far more than the rest (power-law fan-in)
+    pick = lambda pool: pool[min(len(pool) - 1, int(rng.paretovariate(1.1)) - 1)] if rng.random() < 0.3 else rng.choice(pool)
+    for map_id in maps:
+        if not layers or rng.random() < 0.1:
+            continue  # unused / empty map
+        operational = []
+        for layer_id in {pick(layers) for _ in range(rng.randint(1, 8))}:
+            layer = {"title": items[layer_id]["title"], "url": items[layer_id]["url"] + f"/{rng.randint(0, 3)}"}
+            if rng.random() < 0.7:
+                layer["itemId"] = layer_id  # older maps reference layers by URL only
+            operational.append(layer)
+        data[map_id] = {"operationalLayers": operational, "baseMap": {"title": "Topographic"}}
+    for app_type in ("Dashboard", "Web Experience", "Web Mapping Application"):
+        for app_id in by_type.get(app_type, []):
+            if not maps or rng.random() < 0.1:
+                continue
+            used = list({pick(maps) for _ in range(rng.randint(1, 3))})
+            if app_type == "Web Mapping Application":
+                data[app_id] = {"values": {"webmap": used[0], "title": items[app_id]["title"]}}
+            elif app_type == "Dashboard":
+                widgets = [{"type": "mapWidget", "itemId": m} for m in used]
+                if layers and rng.random() < 0.3:
+                    widgets.append({"type": "indicatorWidget", "datasets": [{"dataSource": {"itemId": pick(layers)}}]})
+                data[app_id] = {"widgets": widgets}
+            else:
+                data[app_id] = {"dataSources": {f"ds{i}": {"itemId": m, "type": "WEB_MAP"} for i, m in enumerate(used)}}
+    return items, data
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 256  # default listen backlog (5) drops concurrent connects into 1s SYN retries
+
+class MockPortal:
+    """Threaded HTTP server over an inventory dict; usable as a context manager."""
+
+    def __init__(self, items, data=None, host="127.0.0.1", port=0, rate=None, error_rate=0.0, latency=0.0, seed=0,
+                 max_results=10000):
+        self.items = items
+        self.data = data or {}
+        self.max_results = max_results  # search stops paging past this many results, like a real portal
+        self.rate = rate                # requests/s before answering 429 (None = unlimited)
+        self.retry_after = 1            # seconds announced in Retry-After on a 429
+        self.retry_after_date = False   # send Retry-After as an HTTP-date instead of delta-seconds
+        self.error_rate = error_rate    # fraction of requests answered with a random 5xx
+        self.latency = latency          # seconds added to every response
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.window = []
+        self.stats = {"requests": 0, "throttled": 0, "errors": 0}
+        self.version = 0                # bump after editing items so cached search results are dropped
+        self.search_cache = {}
+        # portals/self reports the org the items belong to, so several mock orgs can run side by side
+        self.org_id = next((i.get("orgId") for i in items.values() if i.get("orgId")), "MOCKORG")
+        self.server = _Server((host, port), self._handler())
+        self.thread = None
+
+    @property
+    def rest_url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/sharing/rest/"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _admit(self):
+        """Decide whether to serve, throttle or fail this request."""
+        with self.lock:
+            self.stats["requests"] += 1
+            if self.rate:
+                now = time.monotonic()
+                self.window = [t for t in self.window if now - t < 1.0]
+                if len(self.window) >= self.rate:
+                    self.stats["throttled"] += 1
+                    return 429
+                self.window.append(now)
+            if self.error_rate and self.rng.random() < self.error_rate:
+                self.stats["errors"] += 1
+                return self.rng.choice([500, 502, 503])
+        return 200
+
+    def search(self, params):
+        query = params.get("q", "")
+        start = int(params.get("start", 1))
+        num = int(params.get("num", 10))
+        sort_field = params.get("sortField")
+        cache_key = (query, sort_field, params.get("sortOrder"), self.version)
+        hits = self.search_cache.get(cache_key)
+        if hits is None:
+            # Pages of one query share a single scan (the crawler pages every partition to the end)
+            predicate = compile_query(query)
+            hits = [info for info in self.items.values() if predicate(info)]
+            if sort_field:
+                key = "created" if sort_field == "uploaded" else sort_field
+                hits.sort(key=lambda info: info.get(key) or 0, reverse=params.get("sortOrder") == "desc")
+            with self.lock:
+                if len(self.search_cache) > 256:
+                    self.search_cache.clear()
+                self.search_cache[cache_key] = hits
+        reachable = hits[:self.max_results]
+        page = reachable[start - 1:start - 1 + num]
+        next_start = start + num if start - 1 + num < len(reachable) else -1
+        return {"query": query, "total": len(hits), "start": start, "num": num,
+                "nextStart": next_start, "results": page}
+
+    def touch(self, item_ids, when_ms=None):
+        """Mark items as modified now (for delta-crawl runs) and drop cached searches."""
+        when_ms = when_ms or int(time.time() * 1000)
+        for item_id in item_ids:
+            self.items[item_id]["modified"] = when_ms
+        self.version += 1
+
+    def remove(self, item_ids):
+        for item_id in item_ids:
+            self.items.pop(item_id, None)
+            self.data.pop(item_id, None)
+        self.version += 1
+
+    def users(self, params):
+        owners = sorted({info["owner"] for info in self.items.values()})
+        start = int(params.get("start", 1))
+        num = int(params.get("num", 100))
+        page = owners[start - 1:start - 1 + num]
+        next_start = start + num if start - 1 + num < len(owners) else -1
+        return {"total": len(owners), "nextStart": next_start, "users": [{"username": u} for u in page]}
+
+    def _handler(self):
+        portal = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _send(self, status, payload, headers=None):
+                # bytes are sent as-is (item data that isn't JSON: files, HTML error pages)
+                raw = isinstance(payload, bytes)
+                body = payload if raw else json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/octet-stream" if raw else "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                if portal.latency:
+                    time.sleep(portal.latency)
+                status = portal._admit()
+                if status == 429:
+                    retry_after = (formatdate(time.time() + portal.retry_after, usegmt=True)
+                                   if portal.retry_after_date else str(portal.retry_after))
+                    return self._send(429, {"error": {"code": 429, "message": "Too many requests"}},
+                                      {"Retry-After": retry_after})
+                if status != 200:
+                    return self._send(status, {"error": {"code": status, "message": "Server error"}})
+
+                url = urlparse(self.path)
+                params = {k: v[-1] for k, v in parse_qs(url.query).items()}
+                if url.path == "/sharing/rest/search":
+                    return self._send(200, portal.search(params))
+                if url.path == "/sharing/rest/portals/self/users":
+                    return self._send(200, portal.users(params))
+                if url.path == "/sharing/rest/portals/self":
+                    return self._send(200, {"id": portal.org_id, "portalName": f"Mock Portal ({portal.org_id})"})
+                m = ITEM_PATH.match(url.path)
+                if m and m.group(1) in portal.items:
+                    if m.group(2):
+                        return self._send(200, portal.data.get(m.group(1), {}))
+                    return self._send(200, portal.items[m.group(1)])
+                # Portal style: HTTP 200 with an error body
+                self._send(200, {"error": {"code": 400, "message": f"Item or path not found: {url.path}"}})
+
+        return Handler
+
+class FakeConnection:
+    """The slice of arcgis' connection object the crawler uses: get(path, params) -> JSON."""
+
+    def __init__(self, rest_url, timeout=60):
+        self.base_url = rest_url.rstrip("/") + "/"
+        self.timeout = timeout
+        self.token = None
+        self._verify_cert = True
+
+    def get(self, path, params=None):
+        url = self.base_url + path.lstrip("/") + "?" + urlencode(params or {"f": "json"})
+        with urllib.request.urlopen(url, timeout=self.timeout) as resp:
+            data = json.loads(resp.read())
+        if isinstance(data, dict) and "error" in data:
+            raise RuntimeError(f"{path}: {data['error'].get('message')}")
+        return data
+
+class FakeGIS:
+    """
+    Stand-in for arcgis.gis.GIS backed by a MockPortal, so crawler.py can run offline:
+        crawler.connect_to_gis = lambda *a: FakeGIS(portal.rest_url)
+    """
+
+    def __init__(self, rest_url):
+        self._con = FakeConnection(rest_url)
+        self._portal = SimpleNamespace(resturl=self._con.base_url)
+        self.properties = SimpleNamespace(**self._con.get("portals/self"))
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve a mock portal REST API.")
+    parser.add_argument("--items", type=int, default=1000, help="Number of items")
+    parser.add_argument("--synthetic", action="store_true", help="Realistic org with layer -> map -> app fan-out")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--rate", type=float, help="Requests/s before throttling with 429")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of random 5xx responses")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to each response")
+    args = parser.parse_args()
+
+    items, data = synthetic_org(args.items) if args.synthetic else (make_items(args.items), {})
+    portal = MockPortal(items, data, port=args.port, rate=args.rate,
+                        error_rate=args.error_rate, latency=args.latency)
+    print(f"[OK] Mock portal serving {args.items} items at {portal.rest_url}")
+    try:
+        portal.server.serve_forever()
+    except KeyboardInterrupt:
+        portal.stop()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,192 @@
+"""
+Crawl several portals / orgs concurrently and merge them into one estate graph.
+
+Each entry in PORTALS names a stored arcgis profile (GIS(profile=...)). Every portal is
+crawled by crawler.main() in its own process and its own directory under PORTALS_DIR, so
+each keeps its own snapshot cache and delta crawls stay per-portal. The per-portal graphs are
+then merged: nodes get a "portal" field, and references one portal could not resolve
+(external_edges: foreign item ids and unregistered service URLs) are resolved against the
+other portals by item id and normalized service URL. Dependency stats, orphan flags and
+high-risk items are recomputed over the merged graph.
+
+    python multi_portal.py              # crawl every portal, then merge
+    python multi_portal.py --merge-only # re-merge the last per-portal snapshots
+"""
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+
+import crawler
+import graph_stats
+import shards
+import snapshot
+from crawler import ok, warn, err
+
+try:
+    from dependency_engine import build_url_index  # needs aiohttp
+except ImportError:
+    build_url_index = None
+
+# ================= CONFIGURATION =================
+PORTALS = [
+    # name: directory / label in the merged graph; profile: stored arcgis profile for that portal
+    {"name": "enterprise", "profile": "enterprise_admin"},
+    {"name": "online", "profile": "online_admin"},
+]
+PORTALS_DIR = "portals"                 # One sub-directory (cache, outputs, metrics) per portal
+MAX_PROCESSES = None                    # Concurrent portal crawls; None = one process per portal
+OUTPUT_FILE = "Estate_graph.json"       # Merged graph for the viewers
+WEB_SHARDS = True                       # Sharded viewer output for the merged graph
+WEB_DIR = "Estate_web"
+WEB_SHARD_BY = "portal"                 # "portal", "owner" or "type"
+# =================================================
+
+def portal_dir(portal):
+    return os.path.join(PORTALS_DIR, portal["name"])
+
+def crawl_portal(portal, workdir):
+    """Run one portal's crawl in the current (worker) process; returns (name, seconds)."""
+    start = time.time()
+    os.makedirs(workdir, exist_ok=True)
+    os.chdir(workdir)  # crawler paths are relative, so each portal keeps its own cache
+    crawler.main(profile=portal.get("profile"))
+    return portal["name"], time.time() - start
+
+def crawl_all(portals):
+    """Crawl portals concurrently, one process each; returns the names that finished."""
+    finished = []
+    with ProcessPoolExecutor(max_workers=MAX_PROCESSES or len(portals)) as pool:
+        futures = {pool.submit(crawl_portal, p, os.path.abspath(portal_dir(p))): p["name"] for p in portals}
+        for future in as_completed(futures):
+            try:
+                name, seconds = future.result()
+                ok(f"Portal {name} crawled in {seconds:.1f}s")
+                finished.append(name)
+            except Exception as e:
+                err(f"Portal {futures[future]} failed: {e}")
+    return finished
+
+def load_portal(portal):
+    """The portal's last graph_data from its snapshot cache (None if it was never crawled)."""
+    path = os.path.join(portal_dir(portal), crawler.CACHE_DIR)
+    if not os.path.exists(os.path.join(path, "meta.json")):
+        return None
+    return snapshot.load(path).to_graph_data()
+
+def merge_graphs(portal_graphs):
+    """
+    Merge [(name, graph_data), ...] into one graph_data. An item id seen in several portals keeps
+    the first portal's node. References still unresolved stay in external_edges, tagged with their portal.
+    """
+    nodes = {}
+    duplicates = 0
+    for name, graph in portal_graphs:
+        for n in graph["nodes"]:
+            if n["id"] in nodes:
+                duplicates += 1
+                continue
+            nodes[n["id"]] = dict(n, portal=name)
+    if duplicates:
+        warn(f"{duplicates} item ids appear in more than one portal; kept the first")
+
+    if build_url_index is None:
+        warn("dependency_engine unavailable (aiohttp missing); cross-portal service URLs are not resolved")
+    url_index = build_url_index(nodes) if build_url_index else {}
+
+    edges, unresolved = {}, []
+    cross_portal = 0
+    for name, graph in portal_graphs:
+        for e in graph["edges"]:
+            edges.setdefault((e["source"], e["target"]), e)
+        for e in graph.get("external_edges", []):
+            target = url_index.get(e["target"]) if e.get("type") == "service_url" else e["target"]
+            if target in nodes and target != e["source"]:
+                edges.setdefault((e["source"], target), {"source": e["source"], "target": target, "type": "dependency"})
+                cross_portal += 1
+            else:
+                unresolved.append(dict(e, portal=name))
+    edges = list(edges.values())
+    ok(f"Merged {len(portal_graphs)} portals: {len(nodes)} items, {len(edges)} relationships "
+       f"({cross_portal} cross-portal, {len(unresolved)} still external)")
+
+    # Orphans and stats over the merged graph (same rule as crawler.main step 6: only edges between
+    # items in the graph count; whatever is still unresolved stays in external_edges)
+    item_edges = [e for e in edges if e["source"] in nodes and e["target"] in nodes]
+    connected_ids = {iid for e in item_edges for iid in (e["source"], e["target"])}
+    abandoned_count = 0
+    for iid, node in nodes.items():
+        node["is_abandoned"] = iid not in connected_ids
+        abandoned_count += node["is_abandoned"]
+    stats = graph_stats.dependency_stats(nodes.keys(), item_edges)
+    for iid, info in stats.items():
+        nodes[iid]["dependency_info"] = info
+
+    summaries = {name: graph.get("summary", {}) for name, graph in portal_graphs}
+    graph_data = {
+        "summary": {
+            "total_items": len(nodes),
+            "abandoned_count": abandoned_count,
+            "connected_count": len(connected_ids),
+            "total_relationships": len(edges),
+            "cross_portal_relationships": cross_portal,
+            "analysis_date": datetime.now().isoformat(),
+            "graph_method": "Merged",
+            "portals": {
+                name: {"total_items": s.get("total_items"), "crawl_started": s.get("crawl_started"),
+                       "graph_method": s.get("graph_method")}
+                for name, s in summaries.items()
+            },
+        },
+        "high_risk_items": graph_stats.high_risk_items(nodes, stats, limit=50),
+        "nodes": list(nodes.values()),
+        "edges": edges,
+        "external_edges": unresolved,
+    }
+    return graph_data
+
+def main():
+    parser = argparse.ArgumentParser(description="Crawl several portals concurrently and merge their graphs.")
+    parser.add_argument("--merge-only", action="store_true", help="Skip crawling, merge the existing per-portal caches")
+    parser.add_argument("--portals", nargs="+", help="Only these portal names (default: all of PORTALS)")
+    args = parser.parse_args()
+
+    start_total = time.time()
+    portals = [p for p in PORTALS if not args.portals or p["name"] in args.portals]
+    if not portals:
+        err("No portals selected")
+        return
+
+    # Step 1: Crawl every portal in its own process
+    if not args.merge_only:
+        ok(f"Crawling {len(portals)} portals: {', '.join(p['name'] for p in portals)}")
+        crawl_all(portals)
+
+    # Step 2: Load per-portal graphs (a failed crawl falls back to that portal's previous snapshot)
+    portal_graphs = []
+    for portal in portals:
+        graph = load_portal(portal)
+        if graph is None:
+            warn(f"No snapshot for portal {portal['name']}; left out of the merge")
+            continue
+        portal_graphs.append((portal["name"], graph))
+
+    # Step 3: Merge and save
+    graph_data = merge_graphs(portal_graphs)
+    with open(OUTPUT_FILE, "w", encoding="utf-8") as f:
+        json.dump(graph_data, f, separators=(",", ":"))
+    ok(f"Estate graph saved to {OUTPUT_FILE}")
+    if WEB_SHARDS:
+        index = shards.write_shards(WEB_DIR, graph_data, by=WEB_SHARD_BY, layout=True)
+        ok(f"Viewer shards saved to {WEB_DIR} ({len(index['shards'])} shards)")
+
+    summary = graph_data["summary"]
+    ok("=" * 70)
+    ok(f"Portals: {len(portal_graphs)} | Items: {summary['total_items']} | Relations: {summary['total_relationships']} "
+       f"| Cross-portal: {summary['cross_portal_relationships']} | Orphaned: {summary['abandoned_count']}")
+    ok(f"Total Time: {time.time() - start_total:.2f}s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,226 @@
+"""
+Async portal REST client used by crawler.py for enrichment calls.
+
+One pooled keep-alive aiohttp session, a token-bucket rate limiter shared by every request,
+and exponential backoff on throttling (HTTP 429, or the portal's JSON error codes) and 5xx.
+Failed lookups are reported instead of silently turning into missing values.
+"""
+import asyncio
+import random
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+import aiohttp
+
+RETRY_STATUS = {429, 500, 502, 503, 504}
+SEARCH_BATCH = 100  # ids per batched search request (portal page maximum)
+
+class PortalRequestError(Exception):
+    """Request still failing after all retries."""
+
+def parse_retry_after(value):
+    """Seconds to wait from a Retry-After header (delta-seconds or HTTP-date); None if absent or malformed."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+
+class TokenBucket:
+    """
+    Allow `rate` requests per second on average with bursts up to `burst`.
+    The rate adapts AIMD-style: halved on throttling (at most once per second, since a burst
+    of concurrent requests is throttled together) and nudged back up on each success.
+    """
+
+    def __init__(self, rate, burst):
+        self.max_rate = rate
+        self.rate = rate
+        self.capacity = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.last_slowdown = 0.0
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def slow_down(self):
+        """Halve the rate after the portal throttles us (never below 1 req/s)."""
+        now = time.monotonic()
+        if now - self.last_slowdown >= 1.0:
+            self.rate = max(1.0, self.rate / 2)
+            self.last_slowdown = now
+
+    def speed_up(self):
+        self.rate = min(self.max_rate, self.rate + 0.1)
+
+class PortalClient:
+    """
+    Minimal async client for the portal sharing/rest API.
+
+        async with PortalClient(base_url, token) as client:
+            sizes = await client.fetch_sizes(ids)
+    """
+
+    def __init__(self, base_url, token=None, concurrency=20, rate=50.0, burst=20,
+                 max_retries=5, backoff=0.5, timeout=60, verify_ssl=True):
+        self.base_url = base_url.rstrip("/") + "/"
+        self.token = token
+        self.concurrency = concurrency
+        self.limiter = TokenBucket(rate, burst)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self.verify_ssl = verify_ssl
+        self.session = None
+        self.semaphore = None
+        self.counters = {"requests": 0, "retries": 0, "throttled": 0, "failures": 0, "bytes": 0}
+
+    @classmethod
+    def from_gis(cls, gis, **kwargs):
+        """Build a client from an authenticated arcgis GIS (base URL, token, certificate setting)."""
+        return cls(
+            gis._portal.resturl,
+            token=getattr(gis._con, "token", None),
+            verify_ssl=getattr(gis._con, "_verify_cert", True),
+            **kwargs,
+        )
+
+    async def __aenter__(self):
+        connector = aiohttp.TCPConnector(limit=self.concurrency, ssl=None if self.verify_ssl else False)
+        self.session = aiohttp.ClientSession(connector=connector, timeout=self.timeout)
+        self.semaphore = asyncio.Semaphore(self.concurrency)
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.session.close()
+
+    async def get_json(self, path, params=None):
+        """GET a sharing/rest path as JSON, retrying throttled and transient failures."""
+        query = {"f": "json", **(params or {})}
+        if self.token:
+            query["token"] = self.token
+        url = self.base_url + path.lstrip("/")
+
+        for attempt in range(self.max_retries + 1):
+            await self.limiter.acquire()
+            retry_after = None
+            try:
+                async with self.semaphore:
+                    self.counters["requests"] += 1
+                    async with self.session.get(url, params=query) as resp:
+                        body = await resp.read()
+                        self.counters["bytes"] += len(body)
+                        if resp.status in RETRY_STATUS:
+                            retry_after = resp.headers.get("Retry-After")
+                            reason = f"HTTP {resp.status}"
+                        elif resp.status >= 400:
+                            self.counters["failures"] += 1
+                            raise PortalRequestError(f"{path}: HTTP {resp.status}")
+                        else:
+                            try:
+                                data = await resp.json(content_type=None)
+                            except ValueError as e:
+                                # HTML error pages, binary item data, truncated bodies: fail this request only
+                                self.counters["failures"] += 1
+                                raise PortalRequestError(f"{path}: invalid JSON ({type(e).__name__})") from e
+                            # The portal reports many errors (including throttling) as HTTP 200 + error JSON
+                            code = (data.get("error") or {}).get("code") if isinstance(data, dict) else None
+                            if code is None:
+                                self.limiter.speed_up()
+                                return data
+                            if code not in RETRY_STATUS:
+                                self.counters["failures"] += 1
+                                raise PortalRequestError(f"{path}: portal error {code}: {data['error'].get('message')}")
+                            reason = f"portal error {code}"
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                reason = type(e).__name__
+
+            if reason.endswith("429"):
+                self.counters["throttled"] += 1
+                self.limiter.slow_down()
+            if attempt == self.max_retries:
+                break
+            self.counters["retries"] += 1
+            # Retry-After is a floor: jitter only ever pushes the retry later than the portal asked
+            wait = parse_retry_after(retry_after)
+            if wait is None:
+                delay = self.backoff * (2 ** attempt) * (0.5 + random.random())
+            else:
+                delay = wait + self.backoff * random.random()
+            await asyncio.sleep(delay)
+
+        self.counters["failures"] += 1
+        raise PortalRequestError(f"{path}: gave up after {self.max_retries} retries ({reason})")
+
+    async def search(self, query, start=1, num=100, **params):
+        return await self.get_json("search", {"q": query, "start": start, "num": num, **params})
+
+    async def fetch_item(self, item_id):
+        return await self.get_json(f"content/items/{item_id}")
+
+    async def fetch_item_data(self, item_id):
+        return await self.get_json(f"content/items/{item_id}/data")
+
+    async def fetch_sizes(self, item_ids, batch_search=False):
+        """
+        Sizes for many items via per-item lookups. The portal has no batch item endpoint; with
+        batch_search, `id:a OR id:b ...` searches (100 ids per request) are tried first and only
+        ids they don't resolve are looked up one by one. Only useful when the ids did not come
+        from a search already (search and item JSON report the same size field).
+        Returns ({id: size}, {id: error}).
+        """
+        item_ids = list(item_ids)
+        sizes, errors = {}, {}
+
+        async def batch(ids):
+            try:
+                resp = await self.search(" OR ".join(f"id:{i}" for i in ids), num=len(ids))
+                for info in resp.get("results", []):
+                    if info.get("size") not in (None, -1):
+                        sizes[info["id"]] = info["size"]
+            except PortalRequestError as e:
+                for i in ids:
+                    errors[i] = str(e)
+
+        if batch_search:
+            await asyncio.gather(*(batch(item_ids[i:i + SEARCH_BATCH])
+                                   for i in range(0, len(item_ids), SEARCH_BATCH)))
+
+        async def single(item_id):
+            try:
+                resp = await self.fetch_item(item_id)
+                if resp.get("size") is not None:
+                    sizes[item_id] = resp["size"]
+                errors.pop(item_id, None)
+            except PortalRequestError as e:
+                errors[item_id] = str(e)
+
+        await asyncio.gather(*(single(i) for i in item_ids if i not in sizes))
+        return sizes, errors
+
+def fetch_sizes(gis, item_ids, **kwargs):
+    """Blocking wrapper for crawler.py: returns ({id: size}, {id: error}, counters)."""
+    async def run():
+        async with PortalClient.from_gis(gis, **kwargs) as client:
+            sizes, errors = await client.fetch_sizes(item_ids)
+            return sizes, errors, client.counters
+    return asyncio.run(run())
@@ -0,0 +1,376 @@
+"""
+Indexed dependency queries over the crawler output.
+
+The crawler's snapshot (or an Inventory_graph.json) is loaded once into CSR adjacency in both
+directions plus owner / type / access code columns, so questions that used to mean loading
+Nebula.html or re-walking the JSON are answered in milliseconds:
+  * downstream(id)   items that require it, transitively ("what breaks if I delete this layer?")
+  * upstream(id)     items it requires, transitively (its lineage back to the source data)
+  * path(a, b)       shortest lineage path between two items, in whichever direction exists
+  * orphans()        items with no relationships; items(): owner / type / access filters
+Edges follow the crawler's convention: source requires target.
+
+    idx = query.load("Inventory_snapshot")
+    idx.downstream(item_id)["count"]
+    python query.py downstream <item_id> --depth 2
+    python query.py serve --port 8770   # GET /downstream?id=...  (JSON, CORS enabled)
+
+The server re-opens the snapshot when the crawler replaces it, so it can stay up between runs.
+It reads the arrays into memory instead of memory-mapping them: an open mapping of the live
+Inventory_snapshot would make the crawler's directory swap fail on Windows.
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+
+import snapshot
+
+# ================= CONFIGURATION =================
+SOURCE = "Inventory_snapshot"   # crawler.CACHE_DIR, or a graph JSON such as Inventory_graph.json
+HOST = "127.0.0.1"              # Local only; the viewers and cleanup scripts run on the same machine
+PORT = 8770
+DEFAULT_LIMIT = 1000            # Items returned per answer unless ?limit= says otherwise
+# =================================================
+
+def _gather(indptr, indices, frontier):
+    """All neighbours of the frontier nodes in one vectorized CSR read: (neighbours, their source node)."""
+    starts = indptr[frontier]
+    lengths = indptr[frontier + 1] - starts
+    total = int(lengths.sum())
+    if not total:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(total)
+    return indices[offsets].astype(np.int64), np.repeat(frontier, lengths)
+
+class UnknownItem(LookupError):
+    """An item id that isn't in the loaded inventory."""
+
+def _reverse(indptr, indices, n):
+    """CSR of the transposed graph (target -> sources)."""
+    sources = np.repeat(np.arange(n, dtype=np.int64), np.diff(indptr))
+    order = np.argsort(indices, kind="stable")
+    return np.searchsorted(indices[order], np.arange(n + 1)).astype(np.int64), sources[order]
+
+class GraphIndex:
+    """Forward and reverse adjacency over one snapshot, with per-node code columns for filtering."""
+
+    def __init__(self, snap):
+        self.snap = snap
+        self.n = len(snap)
+        self.indptr = np.asarray(snap.arrays["indptr"], dtype=np.int64)
+        self.indices = np.asarray(snap.arrays["indices"], dtype=np.int64)
+        self.rindptr, self.rindices = _reverse(self.indptr, self.indices, self.n)
+        self.codes = {key: np.asarray(snap.arrays[key]) for key in snapshot.INTERNED}
+        self.lookup = {key: {v: c for c, v in enumerate(table)} for key, table in snap.tables.items()}
+        self.abandoned = np.asarray(snap.arrays["is_abandoned"], dtype=bool)
+        if self.n:
+            snap.index_of(snap.ids[0])  # build the id -> position dict now rather than on the first query
+
+    # ---- helpers ----
+    def position(self, item_id):
+        """Node position of an item id (UnknownItem if it's not in the inventory)."""
+        try:
+            return self.snap.index_of(item_id)
+        except KeyError:
+            raise UnknownItem(item_id) from None
+
+    def summary_of(self, i, **extra):
+        snap = self.snap
+        row = {"id": snap.ids[i], "title": snap.value("label", i), "type": snap.value("type", i),
+               "owner": snap.value("owner", i)}
+        row.update(extra)
+        return row
+
+    def mask(self, owner=None, type=None, access=None):
+        """Boolean node mask for the given attribute values (None = any); a value nobody has matches nothing."""
+        keep = np.ones(self.n, dtype=bool)
+        for key, value in (("owner", owner), ("type", type), ("access", access)):
+            if value is None:
+                continue
+            code = self.lookup[key].get(value)
+            if code is None:
+                return np.zeros(self.n, dtype=bool)
+            keep &= self.codes[key] == code
+        return keep
+
+    def _page(self, positions, limit, offset=0, extra=None):
+        limit = DEFAULT_LIMIT if limit is None else limit
+        chosen = positions[offset:offset + limit]
+        return {
+            "count": int(len(positions)),
+            "items": [self.summary_of(int(i), **({k: int(v[j]) for k, v in extra.items()} if extra else {}))
+                      for j, i in enumerate(chosen, start=offset)],
+        }
+
+    # ---- queries ----
+    def closure(self, item_id, reverse=False, depth=None, owner=None, type=None, limit=None):
+        """Transitive neighbourhood of one item by BFS over the CSR; items come nearest first."""
+        indptr, indices = (self.rindptr, self.rindices) if reverse else (self.indptr, self.indices)
+        start = self.position(item_id)
+        seen = np.zeros(self.n, dtype=bool)
+        seen[start] = True
+        frontier = np.array([start], dtype=np.int64)
+        found, levels = [], []
+        level = 0
+        while frontier.size and (depth is None or level < depth):
+            neighbours, _ = _gather(indptr, indices, frontier)
+            frontier = np.unique(neighbours[~seen[neighbours]])
+            seen[frontier] = True
+            level += 1
+            found.append(frontier)
+            levels.append(np.full(frontier.size, level))
+        positions = np.concatenate(found) if found else np.empty(0, dtype=np.int64)
+        levels = np.concatenate(levels) if levels else np.empty(0, dtype=np.int64)
+        if owner is not None or type is not None:
+            keep = self.mask(owner=owner, type=type)[positions]
+            positions, levels = positions[keep], levels[keep]
+        result = {"id": item_id, "direction": "upstream" if not reverse else "downstream"}
+        result.update(self._page(positions, limit, extra={"depth": levels}))
+        return result
+
+    def downstream(self, item_id, depth=None, owner=None, type=None, limit=None):
+        """Items that require item_id, directly or through others: what breaks if it's deleted."""
+        return self.closure(item_id, reverse=True, depth=depth, owner=owner, type=type, limit=limit)
+
+    def upstream(self, item_id, depth=None, owner=None, type=None, limit=None):
+        """Items item_id requires, directly or through others."""
+        return self.closure(item_id, reverse=False, depth=depth, owner=owner, type=type, limit=limit)
+
+    def _bfs_path(self, start, goal, indptr, indices):
+        parent = np.full(self.n, -1, dtype=np.int64)
+        parent[start] = start
+        frontier = np.array([start], dtype=np.int64)
+        while frontier.size and parent[goal] < 0:
+            neighbours, sources = _gather(indptr, indices, frontier)
+            fresh = parent[neighbours] < 0
+            neighbours, sources = neighbours[fresh], sources[fresh]
+            frontier, first = np.unique(neighbours, return_index=True)
+            parent[frontier] = sources[first]
+        if parent[goal] < 0:
+            return None
+        path = [goal]
+        while path[-1] != start:
+            path.append(int(parent[path[-1]]))
+        return path[::-1]
+
+    def path(self, source_id, target_id):
+        """
+        Shortest lineage path. "requires": source_id requires target_id through the listed items;
+        "required_by": the reverse. path is None when the two aren't connected either way.
+        """
+        start, goal = self.position(source_id), self.position(target_id)
+        for direction, (indptr, indices) in (("requires", (self.indptr, self.indices)),
+                                             ("required_by", (self.rindptr, self.rindices))):
+            found = self._bfs_path(start, goal, indptr, indices)
+            if found is not None:
+                return {"from": source_id, "to": target_id, "direction": direction, "length": len(found) - 1,
+                        "path": [self.summary_of(i) for i in found]}
+        return {"from": source_id, "to": target_id, "direction": None, "length": None, "path": None}
+
+    def orphans(self, owner=None, type=None, limit=None, offset=0):
+        """Items with no relationships (the crawler's is_abandoned flag)."""
+        return self._page(np.flatnonzero(self.abandoned & self.mask(owner=owner, type=type)), limit, offset)
+
+    def items(self, owner=None, type=None, access=None, limit=None, offset=0):
+        """Items matching every given attribute value, in inventory order."""
+        return self._page(np.flatnonzero(self.mask(owner=owner, type=type, access=access)), limit, offset)
+
+    def item(self, item_id):
+        """Full node dict plus immediate neighbour ids."""
+        i = self.position(item_id)
+        ids = self.snap.ids
+        node = self.snap.node(i)
+        node["requires"] = [ids[j] for j in self.indices[self.indptr[i]:self.indptr[i + 1]].tolist()]
+        node["required_by"] = [ids[j] for j in self.rindices[self.rindptr[i]:self.rindptr[i + 1]].tolist()]
+        return node
+
+    def counts(self, key):
+        """{value: item count} for owner, type or access."""
+        tallies = np.bincount(self.codes[key], minlength=len(self.snap.tables[key]))
+        return {value: int(c) for value, c in zip(self.snap.tables[key], tallies) if c}
+
+def load(source=SOURCE, mmap=True):
+    """GraphIndex over a snapshot directory or a crawler graph JSON file (mmap=False holds no file handles)."""
+    if os.path.isdir(source):
+        return GraphIndex(snapshot.load(source, mmap=mmap))
+    with open(source, "r", encoding="utf-8") as f:
+        return GraphIndex(snapshot.from_graph_data(json.load(f)))
+
+# ================= HTTP =================
+
+def _source_stamp(source):
+    """Changes whenever the crawler rewrites the source (the snapshot is swapped in as a new directory)."""
+    path = os.path.join(source, "meta.json") if os.path.isdir(source) else source
+    try:
+        st = os.stat(path)
+        return st.st_mtime_ns, st.st_ino
+    except OSError:
+        return None
+
+class QueryService:
+    """Holds the current GraphIndex and swaps in a fresh one after each crawl."""
+
+    def __init__(self, source=SOURCE):
+        self.source = source
+        self.lock = threading.Lock()
+        self.stamp = _source_stamp(source)
+        self.index = load(source, mmap=False)
+        self.loaded = time.time()
+
+    def current(self):
+        stamp = _source_stamp(self.source)
+        if stamp is not None and stamp != self.stamp:
+            with self.lock:
+                if stamp != self.stamp:
+                    self.index = load(self.source, mmap=False)
+                    self.stamp, self.loaded = stamp, time.time()
+        return self.index
+
+    def handle(self, route, params):
+        """(status, payload) for one GET request."""
+        index = self.current()
+
+        def arg(name, cast=str):
+            value = params.get(name, [None])[0]
+            return None if value in (None, "") else cast(value)
+
+        def required(name):
+            value = arg(name)
+            if value is None:
+                raise ValueError(f"missing ?{name}=")
+            return value
+
+        filters = {"owner": arg("owner"), "type": arg("type")}
+        page = {"limit": arg("limit", int), "offset": arg("offset", int) or 0}
+        if route == "/summary":
+            return 200, {"source": self.source, "loaded": self.loaded, "summary": index.snap.summary,
+                         "items": index.n, "relationships": int(len(index.indices)),
+                         "owners": index.counts("owner"), "types": index.counts("type")}
+        if route == "/item":
+            return 200, index.item(required("id"))
+        if route in ("/downstream", "/upstream"):
+            query = index.downstream if route == "/downstream" else index.upstream
+            return 200, query(required("id"), depth=arg("depth", int), limit=page["limit"], **filters)
+        if route == "/path":
+            return 200, index.path(required("from"), required("to"))
+        if route == "/orphans":
+            return 200, index.orphans(**filters, **page)
+        if route == "/items":
+            return 200, index.items(access=arg("access"), **filters, **page)
+        if route == "/high_risk":
+            return 200, {"items": index.snap.high_risk_items}
+        return 404, {"error": f"unknown endpoint {route}",
+                     "endpoints": ["/summary", "/item", "/downstream", "/upstream", "/path", "/orphans", "/items",
+                                   "/high_risk"]}
+
+def make_handler(service):
+    class Handler(BaseHTTPRequestHandler):
+        def _send(self, status, payload):
+            body = json.dumps(payload, separators=(",", ":")).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            # Viewers are opened from file:// or another local port
+            self.send_header("Access-Control-Allow-Origin", "*")
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_OPTIONS(self):
+            self.send_response(204)
+            self.send_header("Access-Control-Allow-Origin", "*")
+            self.send_header("Access-Control-Allow-Methods", "GET, OPTIONS")
+            self.send_header("Access-Control-Allow-Headers", "Content-Type")
+            self.end_headers()
+
+        def do_GET(self):
+            url = urlsplit(self.path)
+            start = time.perf_counter()
+            try:
+                status, payload = service.handle(url.path.rstrip("/") or "/summary", parse_qs(url.query))
+            except UnknownItem as e:
+                status, payload = 404, {"error": f"item {e.args[0]} not in the inventory"}
+            except ValueError as e:
+                status, payload = 400, {"error": str(e)}
+            except OSError as e:
+                # The crawler is swapping the snapshot in; the next request loads the new one
+                status, payload = 503, {"error": f"snapshot not readable right now ({e}); retry shortly"}
+            if isinstance(payload, dict):
+                payload["elapsed_ms"] = round((time.perf_counter() - start) * 1000, 2)
+            self._send(status, payload)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+def serve(source=SOURCE, host=HOST, port=PORT):
+    service = QueryService(source)
+    server = ThreadingHTTPServer((host, port), make_handler(service))
+    print(f"[OK] {service.index.n} items from {source} | http://{host}:{port}/summary")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Query the crawler's dependency graph, or serve the queries over HTTP.")
+    parser.add_argument("--source", default=SOURCE, help="Snapshot directory or graph JSON (default: %(default)s)")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("serve", help="Local HTTP endpoint")
+    p.add_argument("--host", default=HOST)
+    p.add_argument("--port", type=int, default=PORT)
+    for name in ("downstream", "upstream"):
+        p = sub.add_parser(name, help=f"{name} closure of one item")
+        p.add_argument("id")
+        p.add_argument("--depth", type=int)
+        p.add_argument("--owner")
+        p.add_argument("--type")
+        p.add_argument("--limit", type=int)
+    p = sub.add_parser("path", help="Shortest lineage path between two items")
+    p.add_argument("source_id")
+    p.add_argument("target_id")
+    for name in ("orphans", "items"):
+        p = sub.add_parser(name, help="Orphaned items" if name == "orphans" else "Items by owner / type / access")
+        p.add_argument("--owner")
+        p.add_argument("--type")
+        if name == "items":
+            p.add_argument("--access")
+        p.add_argument("--limit", type=int)
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        serve(args.source, args.host, args.port)
+        return
+
+    start = time.perf_counter()
+    index = load(args.source)
+    loaded = time.perf_counter()
+    try:
+        if args.command in ("downstream", "upstream"):
+            result = getattr(index, args.command)(args.id, depth=args.depth, owner=args.owner, type=args.type,
+                                                  limit=args.limit)
+        elif args.command == "path":
+            result = index.path(args.source_id, args.target_id)
+        elif args.command == "orphans":
+            result = index.orphans(owner=args.owner, type=args.type, limit=args.limit)
+        else:
+            result = index.items(owner=args.owner, type=args.type, access=args.access, limit=args.limit)
+    except UnknownItem as e:
+        print(f"[ERROR] Item {e.args[0]} not in the inventory")
+        return
+    print(json.dumps(result, indent=2))
+    # stderr, so the JSON on stdout can be piped into cleanup scripts
+    print(f"[OK] Loaded in {(loaded - start) * 1000:.0f} ms, answered in {(time.perf_counter() - loaded) * 1000:.1f} ms",
+          file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+"""
+Sharded web output for the Nebula / Grid viewers on large orgs.
+
+Instead of one content_graph.json holding everything, the crawler writes a flat directory:
+  index.json                  summary, high-risk items, per-owner/type counts and the shard manifest
+  shard_<by>_<key>.json       nodes of one owner (or type) and the edges leaving them
+  neighbourhood_<id>.json     blast-radius subgraph (dependents and dependencies) of each high-risk item
+  layout.json                 optional precomputed positions, {id: [x, y]} in [-1, 1]
+Everything sits next to index.json so one multi-file selection in a viewer picks up the lot.
+The union of all shards is exactly the graph in content_graph.json; viewers paint the
+neighbourhoods first and append shards as they arrive.
+"""
+import hashlib
+import json
+import math
+import os
+import re
+import shutil
+from collections import defaultdict, deque
+
+GOLDEN_ANGLE = math.pi * (3 - math.sqrt(5))
+
+def shard_file(by, key):
+    """Filesystem-safe, collision-free shard name for an owner/type value."""
+    slug = re.sub(r"[^A-Za-z0-9_-]+", "_", key or "none").strip("_")[:40] or "none"
+    digest = hashlib.sha1((key or "").encode("utf-8")).hexdigest()[:8]
+    return f"shard_{by}_{slug}_{digest}.json"
+
+def _write(path, payload):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(payload, f, separators=(",", ":"))
+
+def _sunflower(count, radius):
+    """Evenly spread points in a disc (phyllotaxis)."""
+    return [
+        (radius * math.sqrt((i + 0.5) / count) * math.cos(i * GOLDEN_ANGLE),
+         radius * math.sqrt((i + 0.5) / count) * math.sin(i * GOLDEN_ANGLE))
+        for i in range(count)
+    ]
+
+def compute_layout(groups, weight):
+    """
+    Deterministic clustered layout: one disc per group (area proportional to its size), discs
+    placed on a sunflower spiral largest-first, and the most depended-on items at each disc's
+    centre. Returns {id: [x, y]} normalized to [-1, 1].
+    """
+    ordered = sorted(groups.items(), key=lambda kv: (-len(kv[1]), kv[0]))
+    total = sum(len(members) for _, members in ordered) or 1
+    centres = _sunflower(len(ordered), 1.0)
+    positions = {}
+    for (key, members), (cx, cy) in zip(ordered, centres):
+        radius = 0.9 * math.sqrt(len(members) / total)
+        members = sorted(members, key=lambda iid: -weight.get(iid, 0))
+        for iid, (dx, dy) in zip(members, _sunflower(len(members), radius)):
+            positions[iid] = [cx + dx, cy + dy]
+    if positions:
+        extent = max(max(abs(x), abs(y)) for x, y in positions.values()) or 1.0
+        positions = {iid: [round(x / extent, 5), round(y / extent, 5)] for iid, (x, y) in positions.items()}
+    return positions
+
+def neighbourhood(root, requires, required_by):
+    """Item ids in the root's upstream and downstream closure (root included)."""
+    seen = {root}
+    for adjacency in (requires, required_by):
+        queue = deque([root])
+        visited = {root}
+        while queue:
+            for nxt in adjacency.get(queue.popleft(), ()):
+                if nxt not in visited:
+                    visited.add(nxt)
+                    queue.append(nxt)
+        seen |= visited
+    return seen
+
+def write_shards(out_dir, graph_data, by="owner", layout=True):
+    """Write the sharded viewer output for graph_data; returns the index dict."""
+    nodes = graph_data["nodes"]
+    edges = graph_data["edges"]
+    node_by_id = {n["id"]: n for n in nodes}
+
+    groups = defaultdict(list)
+    for n in nodes:
+        groups[n.get(by) or ""].append(n["id"])
+    requires, required_by = defaultdict(list), defaultdict(list)
+    edges_from = defaultdict(list)
+    for e in edges:
+        requires[e["source"]].append(e["target"])
+        required_by[e["target"]].append(e["source"])
+        edges_from[e["source"]].append(e)
+
+    positions = {}
+    if layout:
+        weight = {iid: (n.get("dependency_info") or {}).get("total_recursive_dependents", 0)
+                  for iid, n in node_by_id.items()}
+        positions = compute_layout(groups, weight)
+
+    def with_layout(n):
+        return dict(n, layout=positions[n["id"]]) if n["id"] in positions else n
+
+    shutil.rmtree(out_dir, ignore_errors=True)
+    os.makedirs(out_dir)
+
+    manifest = []
+    for key, members in sorted(groups.items(), key=lambda kv: -len(kv[1])):
+        shard_edges = [e for iid in members for e in edges_from.get(iid, ())]
+        path = shard_file(by, key)
+        _write(os.path.join(out_dir, path), {
+            "shard": key,
+            "by": by,
+            "nodes": [with_layout(node_by_id[iid]) for iid in members],
+            "edges": shard_edges,
+        })
+        manifest.append({"key": key, "file": path, "nodes": len(members), "edges": len(shard_edges)})
+
+    neighbourhoods = {}
+    for item in graph_data.get("high_risk_items", []):
+        root = item["id"]
+        members = sorted(neighbourhood(root, requires, required_by))
+        member_set = set(members)
+        path = f"neighbourhood_{root}.json"
+        _write(os.path.join(out_dir, path), {
+            "root": root,
+            "nodes": [with_layout(node_by_id[iid]) for iid in members if iid in node_by_id],
+            "edges": [e for iid in members for e in edges_from.get(iid, ()) if e["target"] in member_set],
+        })
+        neighbourhoods[root] = path
+
+    if layout:
+        _write(os.path.join(out_dir, "layout.json"), positions)
+
+    owner_counts, type_counts = defaultdict(int), defaultdict(int)
+    for n in nodes:
+        owner_counts[n.get("owner") or ""] += 1
+        type_counts[n.get("type") or ""] += 1
+    index = {
+        "summary": graph_data.get("summary", {}),
+        "high_risk_items": graph_data.get("high_risk_items", []),
+        "by": by,
+        "shards": manifest,
+        "neighbourhoods": neighbourhoods,
+        "layout": "layout.json" if layout else None,
+        "counts": {
+            "owners": dict(owner_counts),
+            "types": dict(type_counts),
+        },
+    }
+    _write(os.path.join(out_dir, "index.json"), index)
+    return index
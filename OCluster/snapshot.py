@@ -0,0 +1,275 @@
+"""
+Binary graph snapshot used as the crawler cache.
+
+A snapshot is a directory of .npy arrays plus meta.json:
+  * owner / type / access interned into string tables, stored per node as int32 codes
+  * numeric attributes as int64 columns (NULL_INT marks a missing value)
+  * text and list attributes as one UTF-8 buffer plus offsets
+  * edges as CSR adjacency (indptr / indices over node positions, source requires target)
+  * references leaving the inventory (external_edges) as [source, target, type] rows in meta.json
+Arrays are memory-mapped on load, so opening a large snapshot is near-instant and only the
+columns that are touched get read. The web JSON and the GML file are exports derived from it.
+
+    snapshot.save("Inventory_snapshot", graph_data)
+    snap = snapshot.load("Inventory_snapshot")
+    snap.node(snap.index_of(item_id)), snap.successors(i)
+    snap = snapshot.from_graph_data(graph_data)   # same view without a directory
+"""
+import json
+import os
+import shutil
+
+import numpy as np
+
+SNAPSHOT_VERSION = 1
+NULL_INT = np.iinfo(np.int64).min
+
+INTERNED = ("owner", "type", "access")
+INT_COLUMNS = ("views", "modified", "created", "size")
+TEXT_COLUMNS = ("label", "url")
+LIST_COLUMNS = ("tags", "typeKeywords")
+DEPENDENCY_COLUMNS = (
+    "immediate_dependencies", "immediate_dependents",
+    "total_recursive_dependencies", "total_recursive_dependents",
+)
+# Node dict key order (as crawler.extract_item_metadata builds it)
+NODE_KEYS = ("id", "label", "type", "owner", "views", "access", "url", "modified", "created", "size",
+             "tags", "typeKeywords", "is_abandoned")
+KNOWN_KEYS = {"id", "is_abandoned", "dependency_info", *INTERNED, *INT_COLUMNS, *TEXT_COLUMNS, *LIST_COLUMNS}
+
+def _encode_text(values):
+    """Strings -> (uint8 buffer, int64 offsets of length n + 1)."""
+    encoded = [(v or "").encode("utf-8") for v in values]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(b) for b in encoded], out=offsets[1:])
+    return np.frombuffer(b"".join(encoded), dtype=np.uint8), offsets
+
+def _decode_text(buffer, offsets):
+    raw = bytes(buffer)
+    bounds = offsets.tolist()
+    return [raw[bounds[i]:bounds[i + 1]].decode("utf-8") for i in range(len(bounds) - 1)]
+
+def _int_column(values):
+    return np.array([NULL_INT if v is None else int(v) for v in values], dtype=np.int64)
+
+def encode(graph_data):
+    """graph_data (summary, high_risk_items, nodes, edges, external_edges) -> (meta, arrays) in snapshot layout."""
+    nodes = graph_data["nodes"]
+    ids = [n["id"] for n in nodes]
+    position = {iid: i for i, iid in enumerate(ids)}
+    arrays = {"ids": np.array(ids, dtype=f"S{max((len(i) for i in ids), default=1)}")}
+
+    tables = {}
+    for key in INTERNED:
+        table = {}
+        arrays[key] = np.array([table.setdefault(n.get(key) or "", len(table)) for n in nodes], dtype=np.int32)
+        tables[key] = list(table)
+    for key in INT_COLUMNS:
+        arrays[key] = _int_column(n.get(key) for n in nodes)
+    for key in TEXT_COLUMNS:
+        arrays[f"{key}_data"], arrays[f"{key}_offsets"] = _encode_text(n.get(key) for n in nodes)
+    for key in LIST_COLUMNS:
+        lists = [n.get(key) or [] for n in nodes]
+        arrays[f"{key}_data"], arrays[f"{key}_offsets"] = _encode_text(v for values in lists for v in values)
+        arrays[f"{key}_index"] = np.zeros(len(lists) + 1, dtype=np.int64)
+        np.cumsum([len(values) for values in lists], out=arrays[f"{key}_index"][1:])
+    arrays["is_abandoned"] = np.array([bool(n.get("is_abandoned")) for n in nodes], dtype=np.bool_)
+    for key in DEPENDENCY_COLUMNS:
+        arrays[key] = _int_column((n.get("dependency_info") or {}).get(key) for n in nodes)
+
+    # CSR adjacency; edges to items outside the inventory have no position and are dropped
+    pairs = sorted({(position[e["source"]], position[e["target"]]) for e in graph_data.get("edges", [])
+                    if e["source"] in position and e["target"] in position})
+    sources = np.array([s for s, _ in pairs], dtype=np.int64)
+    arrays["indices"] = np.array([t for _, t in pairs], dtype=np.int32)
+    arrays["indptr"] = np.searchsorted(sources, np.arange(len(nodes) + 1)).astype(np.int64)
+
+    # Keys added by later tools stay round-trippable without a schema change
+    extras = {str(i): {k: v for k, v in n.items() if k not in KNOWN_KEYS}
+              for i, n in enumerate(nodes) if not KNOWN_KEYS.issuperset(n)}
+    meta = {
+        "version": SNAPSHOT_VERSION,
+        "node_count": len(nodes),
+        "edge_count": len(pairs),
+        "summary": graph_data.get("summary", {}),
+        "high_risk_items": graph_data.get("high_risk_items", []),
+        "tables": tables,
+        "extras": extras,
+        "external_edges": [[e["source"], e["target"], e.get("type", "dependency")]
+                           for e in graph_data.get("external_edges", [])],
+    }
+    return meta, arrays
+
+def save(path, graph_data):
+    """Write graph_data as a snapshot directory, replacing any old one."""
+    meta, arrays = encode(graph_data)
+    tmp = path + ".tmp"
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    for name, array in arrays.items():
+        np.save(os.path.join(tmp, f"{name}.npy"), array)
+    with open(os.path.join(tmp, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f, separators=(",", ":"))
+
+    # Swap directories so a crash mid-write never leaves a half-written cache behind
+    old = path + ".old"
+    shutil.rmtree(old, ignore_errors=True)
+    if os.path.exists(path):
+        os.rename(path, old)
+    os.rename(tmp, path)
+    shutil.rmtree(old, ignore_errors=True)
+
+def load(path, mmap=True):
+    """Open a snapshot directory; arrays are memory-mapped unless mmap=False."""
+    with open(os.path.join(path, "meta.json"), "r", encoding="utf-8") as f:
+        meta = json.load(f)
+    if meta.get("version") != SNAPSHOT_VERSION:
+        raise ValueError(f"Unsupported snapshot version {meta.get('version')} in {path}")
+    mode = "r" if mmap else None
+    arrays = {
+        name[:-4]: np.load(os.path.join(path, name), mmap_mode=mode)
+        for name in os.listdir(path) if name.endswith(".npy")
+    }
+    return Snapshot(meta, arrays)
+
+def from_graph_data(graph_data):
+    """In-memory Snapshot of graph_data (e.g. a loaded Inventory_graph.json), nothing written to disk."""
+    return Snapshot(*encode(graph_data))
+
+class Snapshot:
+    """Read-only view over a loaded snapshot."""
+
+    def __init__(self, meta, arrays):
+        self.meta = meta
+        self.arrays = arrays
+        self.summary = meta["summary"]
+        self.high_risk_items = meta["high_risk_items"]
+        self.tables = meta["tables"]
+        self._ids = None
+        self._index = None
+
+    def __len__(self):
+        return self.meta["node_count"]
+
+    @property
+    def ids(self):
+        if self._ids is None:
+            self._ids = [i.decode("ascii") for i in self.arrays["ids"].tolist()]
+        return self._ids
+
+    def index_of(self, item_id):
+        """Node position for an item id (KeyError if absent)."""
+        if self._index is None:
+            self._index = {iid: i for i, iid in enumerate(self.ids)}
+        return self._index[item_id]
+
+    def column(self, key):
+        """Whole attribute column as a Python list (interned and text columns decoded)."""
+        if key == "id":
+            return self.ids
+        if key in INTERNED:
+            table = self.tables[key]
+            return [table[c] for c in self.arrays[key].tolist()]
+        if key in INT_COLUMNS or key in DEPENDENCY_COLUMNS:
+            return [None if v == NULL_INT else v for v in self.arrays[key].tolist()]
+        if key in TEXT_COLUMNS:
+            return _decode_text(self.arrays[f"{key}_data"], self.arrays[f"{key}_offsets"])
+        if key in LIST_COLUMNS:
+            flat = _decode_text(self.arrays[f"{key}_data"], self.arrays[f"{key}_offsets"])
+            bounds = self.arrays[f"{key}_index"].tolist()
+            return [flat[bounds[i]:bounds[i + 1]] for i in range(len(bounds) - 1)]
+        if key == "is_abandoned":
+            return self.arrays[key].tolist()
+        raise KeyError(key)
+
+    def successors(self, i):
+        """Node positions that node i requires."""
+        indptr = self.arrays["indptr"]
+        return self.arrays["indices"][indptr[i]:indptr[i + 1]]
+
+    def value(self, key, i):
+        """One attribute of node i, decoded."""
+        if key == "id":
+            return self.ids[i]
+        if key in INTERNED:
+            return self.tables[key][int(self.arrays[key][i])]
+        if key in TEXT_COLUMNS:
+            data, offsets = self.arrays[f"{key}_data"], self.arrays[f"{key}_offsets"]
+            return bytes(data[offsets[i]:offsets[i + 1]]).decode("utf-8")
+        if key in LIST_COLUMNS:
+            data, offsets = self.arrays[f"{key}_data"], self.arrays[f"{key}_offsets"]
+            bounds = self.arrays[f"{key}_index"]
+            return [bytes(data[offsets[j]:offsets[j + 1]]).decode("utf-8")
+                    for j in range(int(bounds[i]), int(bounds[i + 1]))]
+        if key == "is_abandoned":
+            return bool(self.arrays[key][i])
+        v = int(self.arrays[key][i])
+        return None if v == NULL_INT else v
+
+    def node(self, i):
+        """One node dict in the crawler's schema."""
+        node = {key: self.value(key, i) for key in NODE_KEYS}
+        info = {key: self.value(key, i) for key in DEPENDENCY_COLUMNS}
+        if None not in info.values():
+            node["dependency_info"] = info
+        node.update(self.meta["extras"].get(str(i), {}))
+        return node
+
+    def nodes(self):
+        """All node dicts, decoded column by column (much faster than node(i) in a loop)."""
+        columns = {key: self.column(key) for key in NODE_KEYS}
+        deps = [self.column(key) for key in DEPENDENCY_COLUMNS]
+        extras = self.meta["extras"]
+        nodes = []
+        for i in range(len(self)):
+            node = {key: values[i] for key, values in columns.items()}
+            info = dict(zip(DEPENDENCY_COLUMNS, (d[i] for d in deps)))
+            if None not in info.values():
+                node["dependency_info"] = info
+            if extras:
+                node.update(extras.get(str(i), {}))
+            nodes.append(node)
+        return nodes
+
+    def edges(self):
+        """Edge dicts in the crawler's schema."""
+        ids = self.ids
+        indptr = self.arrays["indptr"]
+        sources = np.repeat(np.arange(len(self)), np.diff(indptr)).tolist()
+        return [{"source": ids[s], "target": ids[t], "type": "dependency"}
+                for s, t in zip(sources, self.arrays["indices"].tolist())]
+
+    def external_edges(self):
+        """References to items or services outside the inventory, in the crawler's edge schema."""
+        return [{"source": s, "target": t, "type": kind} for s, t, kind in self.meta.get("external_edges", [])]
+
+    def to_graph_data(self):
+        """The crawler's graph_data dict (what the JSON cache used to hold)."""
+        return {
+            "summary": self.summary,
+            "high_risk_items": self.high_risk_items,
+            "nodes": self.nodes(),
+            "edges": self.edges(),
+            "external_edges": self.external_edges(),
+        }
+
+def _gml_string(value):
+    """GML string literal: quotes and non-ASCII characters as HTML entities (as NetworkX writes them)."""
+    text = str(value).replace("&", "&amp;").replace('"', "&quot;")
+    return '"' + "".join(c if ord(c) < 128 else f"&#{ord(c)};" for c in text) + '"'
+
+def write_gml(snap, path):
+    """Export the snapshot as a directed GML graph (Gephi, NetworkX, yEd)."""
+    ids, labels = snap.ids, snap.column("label")
+    types, owners = snap.column("type"), snap.column("owner")
+    with open(path, "w", encoding="ascii") as f:
+        f.write("graph [\n  directed 1\n")
+        for i in range(len(snap)):
+            f.write(f"  node [\n    id {i}\n    label {_gml_string(ids[i])}\n    title {_gml_string(labels[i])}\n"
+                    f"    type {_gml_string(types[i])}\n    owner {_gml_string(owners[i])}\n  ]\n")
+        indptr = snap.arrays["indptr"].tolist()
+        indices = snap.arrays["indices"].tolist()
+        for s in range(len(snap)):
+            for t in indices[indptr[s]:indptr[s + 1]]:
+                f.write(f"  edge [\n    source {s}\n    target {t}\n  ]\n")
+        f.write("]\n")
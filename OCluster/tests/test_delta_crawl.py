@@ -0,0 +1,73 @@
+"""
+Delta crawl vs full crawl on the mock portal: after items are deleted and others modified, a
+delta crawl over the previous cache must produce the same graph as a fresh full crawl.
+
+    cd OCluster && python -m pytest tests
+"""
+import json
+import os
+import random
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+pytest.importorskip("arcgis")    # crawler.py imports it at module level
+pytest.importorskip("aiohttp")   # native engine
+
+import crawler
+import mock_portal
+
+@pytest.fixture
+def configured(monkeypatch):
+    for name, value in {"GRAPH_ENGINE": "native", "INCREMENTAL": True, "SAVE_GML": False, "WEB_SHARDS": False,
+                        "HISTORY_DIR": None, "ENRICH_RATE": 2000}.items():
+        monkeypatch.setattr(crawler, name, value)
+
+def crawl(portal, workdir, monkeypatch):
+    monkeypatch.chdir(workdir)
+    monkeypatch.setattr(crawler, "connect_to_gis", lambda *a, **kw: mock_portal.FakeGIS(portal.rest_url))
+    crawler.main()
+    with open(crawler.OUTPUT_FILE, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def comparable(graph):
+    nodes = {n["id"]: {k: v for k, v in n.items()} for n in graph["nodes"]}
+    edge_set = lambda edges: {(e["source"], e["target"], e.get("type")) for e in edges}
+    summary = {k: graph["summary"][k] for k in ("total_items", "abandoned_count", "connected_count", "total_relationships")}
+    risk = sorted((-r["dependents_count"], r["id"]) for r in graph["high_risk_items"])
+    return nodes, edge_set(graph["edges"]), edge_set(graph["external_edges"]), summary, risk
+
+def test_delta_matches_full_after_deletions(tmp_path, monkeypatch, configured):
+    items, data = mock_portal.synthetic_org(2000, seed=3)
+    rng = random.Random(3)
+    with mock_portal.MockPortal(items, data) as portal:
+        (tmp_path / "delta").mkdir()
+        (tmp_path / "full").mkdir()
+        crawl(portal, tmp_path / "delta", monkeypatch)
+
+        # Delete layers that maps depend on, and modify some maps
+        referenced = {layer.get("itemId") for doc in data.values() for layer in doc.get("operationalLayers", [])}
+        layers = sorted(i for i, info in items.items() if info["type"] == "Feature Service" and i in referenced)
+        maps = sorted(i for i, info in items.items() if info["type"] == "Web Map")
+        portal.remove(rng.sample(layers, 10))
+        portal.touch(rng.sample(maps, 20))
+
+        delta = crawl(portal, tmp_path / "delta", monkeypatch)
+        assert "(delta)" in delta["summary"]["graph_method"]
+        full = crawl(portal, tmp_path / "full", monkeypatch)
+
+    d_nodes, d_edges, d_external, d_summary, d_risk = comparable(delta)
+    f_nodes, f_edges, f_external, f_summary, f_risk = comparable(full)
+    assert d_summary == f_summary
+    assert d_edges == f_edges
+    assert d_external == f_external
+    assert d_nodes == f_nodes
+    assert [c for c, _ in d_risk] == [c for c, _ in f_risk]
+
+    # Stats only count relationships present in the output
+    out_degree = {}
+    for s, _, _ in f_edges:
+        out_degree[s] = out_degree.get(s, 0) + 1
+    for iid, node in f_nodes.items():
+        assert node["dependency_info"]["immediate_dependencies"] == out_degree.get(iid, 0)
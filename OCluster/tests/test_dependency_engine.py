@@ -0,0 +1,48 @@
+"""
+Native dependency engine on the mock portal: one item whose /data isn't JSON must only fail that
+item, and the service URL index must not depend on the order items were found in.
+
+    cd OCluster && python -m pytest tests
+"""
+import os
+import random
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+pytest.importorskip("aiohttp")
+
+import dependency_engine
+import mock_portal
+
+def test_invalid_item_data_fails_only_that_item():
+    items, data = mock_portal.synthetic_org(300, seed=2)
+    maps = sorted(i for i, info in items.items() if info["type"] == "Web Map" and data.get(i))
+    bad = {maps[0]: b"<html><body>502 Bad Gateway</body></html>", maps[1]: b"\xff\xfe\x00binary", maps[2]: b'{"operationalLayers": ['}
+    with mock_portal.MockPortal(items, data) as portal:
+        gis = mock_portal.FakeGIS(portal.rest_url)
+        expected, errors, _ = dependency_engine.build_edges(gis, items, log=lambda *a: None)
+        assert errors == {}
+        data.update(bad)
+        edges, errors, counters = dependency_engine.build_edges(gis, items, log=lambda *a: None)
+
+    assert set(errors) == set(bad)
+    assert counters["failures"] == len(bad)
+    key = lambda edges: {(e["source"], e["target"]) for e in edges}
+    assert key(edges) == {k for k in key(expected) if k[0] not in bad}
+
+def test_url_index_ignores_item_order():
+    url = "https://services.example.com/arcgis/rest/services/Roads/FeatureServer"
+    nodes = {
+        "a" * 32: {"type": "Web Map", "url": url, "created": 1},
+        "b" * 32: {"type": "Feature Service", "url": url + "/0", "created": 500},
+        "c" * 32: {"type": "Feature Service", "url": url, "created": 200},
+        "d" * 32: {"type": "Feature Service", "url": url, "created": 200},
+        "e" * 32: {"type": "Feature Service", "url": url, "created": None},
+    }
+    ids = list(nodes)
+    for seed in range(10):
+        random.Random(seed).shuffle(ids)
+        index = dependency_engine.build_url_index({iid: nodes[iid] for iid in ids})
+        assert index == {dependency_engine.normalize_service_url(url): "c" * 32}
@@ -0,0 +1,60 @@
+"""
+Run history: crawls where only view counts move must not grow storage with inventory size, and
+structural columns must rebuild exactly from checkpoint + deltas.
+
+    cd OCluster && python -m pytest tests
+"""
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import history
+
+def graph(n, rng):
+    nodes = [{"id": f"{i:032x}", "label": f"Item {i}", "type": "Web Map", "owner": f"user{i % 7}",
+              "views": rng.randint(0, 50000), "access": "org", "url": None, "modified": 1700000000000 + i,
+              "created": 1600000000000 + i, "size": rng.randint(0, 10 ** 6), "tags": [], "typeKeywords": [],
+              "is_abandoned": False}
+             for i in range(n)]
+    edges = [{"source": nodes[i]["id"], "target": nodes[i - 1]["id"], "type": "dependency"} for i in range(1, n, 3)]
+    return {"summary": {}, "high_risk_items": [], "nodes": nodes, "edges": edges, "external_edges": []}
+
+def test_view_churn_keeps_deltas_small(tmp_path):
+    rng = random.Random(3)
+    g = graph(3000, rng)
+    store = history.HistoryStore(str(tmp_path))
+    store.record(g, started="2026-09-01T00:00:00")
+    snapshot_bytes = os.path.getsize(store._file("checkpoints", 1))
+    sizes = {}
+    for run in range(2, 16):
+        for node in rng.sample(g["nodes"], len(g["nodes"]) // 2):
+            node["views"] += rng.randint(1, 20)
+        g["nodes"][run]["size"] += 1
+        store.record(g, started=f"2026-09-{run:02d}T00:00:00")
+        sizes[run] = {n["id"]: n["size"] for n in g["nodes"]}
+        views = {n["id"]: n["views"] for n in g["nodes"]}
+
+    usage = store.storage_bytes()
+    assert max(os.path.getsize(store._file("deltas", run)) for run in sizes) < snapshot_bytes / 5
+    assert usage["checkpoints"] <= snapshot_bytes + usage["deltas"]
+    for run in (2, 9, 15):
+        assert {iid: row["size"] for iid, row in store.state(run, ("size",)).items()} == sizes[run]
+    latest = store.state(columns=("views",))
+    assert all(abs(latest[iid]["views"] - v) <= (2 ** history.COUNTER_STEP - 1) * (v + 1) for iid, v in views.items())
+
+def test_checkpoint_follows_delta_volume(tmp_path):
+    rng = random.Random(4)
+    g = graph(2000, rng)
+    store = history.HistoryStore(str(tmp_path))
+    for run in range(1, 9):
+        for node in g["nodes"]:
+            node["size"] = rng.randint(0, 10 ** 6)
+        store.record(g, started=f"2026-09-{run:02d}T00:00:00")
+
+    checkpoints = [r["run"] for r in store.runs() if r["checkpoint"]]
+    assert 1 < len(checkpoints) < 8
+    key = lambda nodes: sorted((n["id"], n["size"], n["owner"]) for n in nodes)
+    assert key(store.graph_data()["nodes"]) == key(g["nodes"])
+    assert store.edges() == {(e["source"], e["target"]) for e in g["edges"]}
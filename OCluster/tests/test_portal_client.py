@@ -0,0 +1,63 @@
+"""
+PortalClient retries and throttling against the mock portal: a 429's Retry-After (either form)
+is honoured as a minimum wait, and every lookup still succeeds once the portal lets it through.
+
+    cd OCluster && python -m pytest tests
+"""
+import asyncio
+import os
+import sys
+import time
+from email.utils import formatdate
+from types import SimpleNamespace
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+pytest.importorskip("aiohttp")
+
+import mock_portal
+import portal_client
+
+def test_parse_retry_after():
+    assert portal_client.parse_retry_after("2") == 2.0
+    assert portal_client.parse_retry_after("0.5") == 0.5
+    assert 3.0 <= portal_client.parse_retry_after(formatdate(time.time() + 5, usegmt=True)) <= 5.0
+    assert portal_client.parse_retry_after(formatdate(time.time() - 60, usegmt=True)) == 0.0
+    assert portal_client.parse_retry_after("soon") is None
+    assert portal_client.parse_retry_after(None) is None
+
+def fetch(portal, ids, **kwargs):
+    async def run():
+        async with portal_client.PortalClient(portal.rest_url, **kwargs) as client:
+            sizes, errors = await client.fetch_sizes(ids)
+            return sizes, errors, client.counters
+    return asyncio.run(run())
+
+# An HTTP-date only has whole seconds, so a 2 s Retry-After in that form can mean just over 1 s
+@pytest.mark.parametrize("as_date, floor", [(False, 2.0), (True, 1.0)])
+def test_throttled_requests_wait_for_retry_after(monkeypatch, as_date, floor):
+    sleeps = []
+    real_sleep = asyncio.sleep
+
+    async def sleep(delay):
+        sleeps.append(delay)
+        await real_sleep(delay)
+
+    monkeypatch.setattr(portal_client.asyncio, "sleep", sleep)
+    # No jitter, so a retry scheduled earlier than Retry-After can't hide behind a lucky draw
+    monkeypatch.setattr(portal_client, "random", SimpleNamespace(random=lambda: 0.0))
+    items, _ = mock_portal.synthetic_org(200, seed=1)
+    ids = sorted(items)[:40]
+    with mock_portal.MockPortal(items, rate=10) as portal:
+        portal.retry_after = 2
+        portal.retry_after_date = as_date
+        sizes, errors, counters = fetch(portal, ids, rate=1000, burst=40, backoff=0.01, max_retries=8)
+
+    assert errors == {}
+    assert set(sizes) == set(ids)
+    assert counters["throttled"] > 0
+    # Rate limiter waits are milliseconds at this rate; everything longer is a retry delay
+    retry_sleeps = [d for d in sleeps if d >= 0.5]
+    assert len(retry_sleeps) == counters["retries"]
+    assert min(retry_sleeps) >= floor
@@ -0,0 +1,30 @@
+"""
+Search partitions against the mock portal's paging limit: a partition with more results than a
+query can page must be split so the crawl still sees every item.
+
+    cd OCluster && python -m pytest tests
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+pytest.importorskip("arcgis")    # crawler.py imports it at module level
+
+import crawler
+import mock_portal
+
+@pytest.mark.parametrize("partition", [None, "owner", "type"])
+def test_partitions_stay_under_result_limit(monkeypatch, partition):
+    items, data = mock_portal.synthetic_org(2000, seed=5)
+    monkeypatch.setattr(crawler, "SEARCH_PARTITION", partition)
+    monkeypatch.setattr(crawler, "SEARCH_RESULT_LIMIT", 150)
+    with mock_portal.MockPortal(items, data, max_results=150) as portal:
+        gis = mock_portal.FakeGIS(portal.rest_url)
+        queries = crawler.search_partitions(gis)
+        assert all(crawler.search_total(gis, q) <= 150 for q in queries)
+        seen = [node["id"] for page in crawler.stream_inventory(gis) for node in page]
+
+    assert len(seen) == len(set(seen))  # partitions are disjoint
+    assert set(seen) == set(items)